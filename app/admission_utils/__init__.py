@@ -0,0 +1,209 @@
+import fcntl
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+from app.deadline_utils import check
+from app.stats_utils import summarize
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+DOCUMENT = 'document'
+BATCH = 'batch'
+
+
+class AdmissionRejected(Exception):
+    """
+    The request waited longer than its priority class allows for a backend slot
+    """
+
+    def __init__(self, priority_class, retry_after):
+        super().__init__('Too many {} requests, try again in {} s'.format(priority_class, retry_after))
+        self.priority_class = priority_class
+        self.retry_after = retry_after
+
+
+def classify(uploaded, input_type, frontend, input_nfc_len, interactive_max_chars, batch_frontends):
+    """
+    :param uploaded: the input came as a file
+    :return: the priority class of a request
+    """
+    if frontend in batch_frontends or input_type == BATCH:
+        return BATCH
+    if uploaded or input_type == 'file' or input_nfc_len > interactive_max_chars:
+        return DOCUMENT
+    return INTERACTIVE
+
+
+class _ClassStats(object):
+
+    def __init__(self, window=1000):
+        self.admitted = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.active = 0
+        self.waits = deque(maxlen=window)
+        self.holds = deque(maxlen=window)
+
+
+class AdmissionController(object):
+    """
+    Limits the number of backend batches in flight per priority class across all the workers on the host.
+    A class has `slots` lock files in the directory; a batch holds a flock on one of them while it is being
+    translated. A request that does not get a slot within the class `deadline` is rejected (429); once a request got
+    its first slot, its following batches wait as long as needed so that no translation is thrown away half done.
+    Each class has its own slots, so bulk uploads can't take the slots of keyboard users.
+    """
+
+    poll_interval = 0.005
+    max_poll_interval = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure(None, {})
+
+    def configure(self, directory, classes):
+        """
+        :param directory: where the slot files are, None for a directory in the system temp dir
+        :param classes: {class name: {'slots': int, 'deadline': seconds}}, see ADMISSION_CLASSES in settings
+        """
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'lindat-admission')
+        if classes:
+            os.makedirs(self.directory, exist_ok=True)
+        self.classes = {name: dict(cfg) for name, cfg in classes.items()}
+        with self._lock:
+            self._stats = {name: _ClassStats() for name in self.classes}
+
+    def _slot_path(self, priority_class, i):
+        return os.path.join(self.directory, '{}.{}.slot'.format(priority_class, i))
+
+    def _try_acquire(self, priority_class):
+        slots = list(range(self.classes[priority_class]['slots']))
+        random.shuffle(slots)
+        for i in slots:
+            slot_file = open(self._slot_path(priority_class, i), 'a')
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except BlockingIOError:
+                slot_file.close()
+        return None
+
+    @contextmanager
+    def slot(self, priority_class, wait_forever=False, deadline=None):
+        """
+        Holds one of the backend slots of the class for the duration of the with block
+        :param wait_forever: ignore the class deadline
+        :param deadline: the request deadline, app.deadline_utils.Deadline
+        :raises AdmissionRejected:
+        :raises DeadlineExceeded: when the request deadline passes while waiting
+        """
+        if priority_class not in self.classes:
+            yield
+            return
+        stats = self._stats[priority_class]
+        max_wait = self.classes[priority_class]['deadline']
+        start = time.monotonic()
+        interval = self.poll_interval
+        with self._lock:
+            stats.waiting += 1
+        try:
+            while True:
+                slot_file = self._try_acquire(priority_class)
+                if slot_file is not None:
+                    break
+                check(deadline)
+                if not wait_forever and time.monotonic() - start >= max_wait:
+                    with self._lock:
+                        stats.rejected += 1
+                    raise AdmissionRejected(priority_class, self.retry_after(priority_class))
+                time.sleep(interval)
+                interval = min(interval * 2, self.max_poll_interval)
+        finally:
+            with self._lock:
+                stats.waiting -= 1
+
+        acquired = time.monotonic()
+        with self._lock:
+            stats.admitted += 1
+            stats.active += 1
+            stats.waits.append(acquired - start)
+        try:
+            yield
+        finally:
+            slot_file.close()
+            with self._lock:
+                stats.active -= 1
+                stats.holds.append(time.monotonic() - acquired)
+
+    def retry_after(self, priority_class):
+        """
+        Seconds until the queue of the class is likely to move: the mean time a batch holds a slot times the
+        batches waiting per slot
+        """
+        stats = self._stats[priority_class]
+        with self._lock:
+            holds = list(stats.holds)
+            waiting = stats.waiting
+        mean_hold = sum(holds) / len(holds) if holds else 1
+        return max(1, int(math.ceil(mean_hold * max(waiting, 1) / self.classes[priority_class]['slots'])))
+
+    def slots_in_use(self, priority_class):
+        """
+        Probes the slot files, counts the slots held by any worker
+        """
+        in_use = 0
+        for i in range(self.classes[priority_class]['slots']):
+            with open(self._slot_path(priority_class, i), 'a') as slot_file:
+                try:
+                    fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    in_use += 1
+        return in_use
+
+    def metrics(self):
+        """
+        :return: {class name: metrics}; the counters and timings are of this worker, slots_in_use of all workers
+        """
+        result = {}
+        for name, cfg in self.classes.items():
+            stats = self._stats[name]
+            with self._lock:
+                snapshot = {
+                    'admitted': stats.admitted,
+                    'rejected': stats.rejected,
+                    'waiting': stats.waiting,
+                    'active': stats.active,
+                    'wait_secs': summarize(list(stats.waits)),
+                    'hold_secs': summarize(list(stats.holds)),
+                }
+            snapshot.update(slots=cfg['slots'], deadline=cfg['deadline'], slots_in_use=self.slots_in_use(name))
+            result[name] = snapshot
+        return result
+
+
+admission = AdmissionController()
+
+
+@contextmanager
+def backend_slot(deadline=None):
+    """
+    Holds a backend slot of the current request's priority class (g.priority_class) for the duration of the with
+    block. Does nothing outside of a request or when the request has no class.
+    """
+    priority_class = g.get('priority_class') if has_app_context() else None
+    if priority_class is None:
+        yield
+        return
+    with admission.slot(priority_class, wait_forever=g.get('admitted', False), deadline=deadline):
+        g.admitted = True
+        yield
@@ -0,0 +1,210 @@
+import copy
+import fcntl
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from app.admission_utils import AdmissionRejected
+from app.deadline_utils import DeadlineExceeded, check, remaining
+from app.text_utils import split_lines
+
+log = logging.getLogger(__name__)
+
+# errors of the leader's own deadline or admission, the requests that waited for it make the call themselves
+REQUEST_ERRORS = (DeadlineExceeded, AdmissionRejected)
+
+
+def make_key(route, src, tgt, text):
+    """
+    :param route: what translates the text, e.g. the model name
+    :param text: the NFC normalized input, a string or a list of its lines
+    :return: a string identifying identical translation requests
+    """
+    digest = hashlib.sha256()
+    for i, line in enumerate(split_lines(text)):
+        if i:
+            digest.update(b'\n')
+        digest.update(line.encode('utf-8'))
+    return '{}|{}|{}|{}'.format(route, src, tgt, digest.hexdigest())
+
+
+def _copy_error(error):
+    """
+    :return: a copy of the error of an identical call for a waiting call to raise; raising the same object in several
+        threads mixes up its traceback. A RuntimeError when it can't be copied.
+    """
+    try:
+        copied = copy.copy(error)
+        if type(copied) is type(error):
+            return copied
+    except Exception:
+        pass
+    return RuntimeError('The identical request in flight failed: {!r}'.format(error))
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs only one of the identical calls that are in flight at the same time; the others wait for it and get a copy
+    of its result (or of its exception).
+    Within a process the calls are coalesced across threads. With a directory (preferably on tmpfs, e.g.
+    /dev/shm/lindat-coalesce) they are coalesced across processes too: a flock on <key>.lock marks the call in
+    flight and the result is handed over in <key>.pickle. A process that finds the result missing (the call failed
+    or took longer than result_ttl) makes the call itself. A call waits at most max_wait_secs (or until its deadline)
+    for the identical one, then makes it itself, so a stuck call doesn't hold up the others. A call that failed on its
+    own deadline or admission is made again by the ones that waited for it.
+    """
+
+    def __init__(self, directory=None, result_ttl=10, max_wait_secs=120):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0
+        self.configure(directory, result_ttl, max_wait_secs)
+
+    def configure(self, directory=None, result_ttl=10, max_wait_secs=120):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.result_ttl = result_ttl
+        self.max_wait_secs = max_wait_secs
+
+    def do(self, key, fn, *args, deadline=None, reusable=None, **kwargs):
+        """
+        :param deadline: app.deadline_utils.Deadline of this call, it doesn't wait for another one past it
+        :param reusable: fn(result) -> False when the result of the identical call must not be used by this one (e.g. it
+            holds a failure of its deadline), the call is made again
+        :raises DeadlineExceeded: when the deadline passed while waiting
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                break
+            log.debug('Waiting for the identical request in flight %s', key)
+            if not flight.done.wait(self._wait_secs(deadline)):
+                check(deadline)
+                log.warning('The identical request in flight %s takes too long, making the call again', key)
+                return fn(*args, **kwargs)
+            if isinstance(flight.error, REQUEST_ERRORS) or \
+                    (flight.error is None and reusable is not None and not reusable(flight.result)):
+                # this call may have more time than the leader had
+                continue
+            if flight.error is not None:
+                raise _copy_error(flight.error) from flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = self._call(key, fn, args, kwargs, deadline, reusable)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _wait_secs(self, deadline):
+        return min(self.max_wait_secs, remaining(deadline, self.max_wait_secs))
+
+    def _call(self, key, fn, args, kwargs, deadline, reusable):
+        if not self.directory:
+            return fn(*args, **kwargs)
+
+        name = os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        started = time.time()
+        with open(name + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                log.debug('Waiting for the identical request in flight in another process %s', key)
+                if not self._wait_for_lock(lock_file, self._wait_secs(deadline)):
+                    check(deadline)
+                    log.warning('The identical request in flight in another process %s takes too long, making the '
+                                'call again', key)
+                    return fn(*args, **kwargs)
+                found, result = self._read_result(name + '.pickle', started)
+                if found and (reusable is None or reusable(result)):
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    return result
+            try:
+                os.utime(name + '.lock')
+                result = fn(*args, **kwargs)
+                self._write_result(name + '.pickle', result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._prune()
+
+    @staticmethod
+    def _wait_for_lock(lock_file, timeout_secs):
+        """
+        :return: whether the flock was taken within timeout_secs
+        """
+        give_up = time.monotonic() + timeout_secs
+        pause = 0.005
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= give_up:
+                    return False
+                time.sleep(min(pause, max(0.0, give_up - time.monotonic())))
+                pause = min(pause * 2, 0.1)
+
+    def _read_result(self, path, started):
+        """
+        :return: (True, result) if the result was written after `started`, (False, None) otherwise
+        """
+        try:
+            with open(path, 'rb') as f:
+                finished, result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        if finished < started or finished < time.time() - self.result_ttl:
+            return False, None
+        return True, result
+
+    def _write_result(self, path, result):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time(), result), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def _prune(self):
+        """
+        Removes the lock and result files nobody used for result_ttl, at most once per result_ttl
+        """
+        now = time.time()
+        if now - self._last_prune < self.result_ttl:
+            return
+        self._last_prune = now
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < now - self.result_ttl:
+                    # unlinking a lock file somebody just opened only costs a missed coalescing
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+single_flight = SingleFlight()
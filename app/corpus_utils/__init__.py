@@ -0,0 +1,125 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from app.text_utils import read_nfc_lines
+
+
+class Checkpoint(object):
+    """
+    Progress of a corpus translation: the number of input lines whose translations are in the output and the size of
+    the output at that point. Replaced atomically after every chunk, so the run may be killed at any moment.
+    """
+
+    def __init__(self, path, params):
+        """
+        :param path: None to not checkpoint (e.g. writing to stdout)
+        :param params: what is translated how, a checkpoint of other params is not resumed
+        """
+        self.path = path
+        self.params = params
+        self.lines = 0
+        self.offset = 0
+
+    def load(self):
+        """
+        :return: True when there is an interrupted run to resume
+        :raises ValueError: the checkpoint is of a run with other params
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['params'] != self.params:
+            raise ValueError('{} is a checkpoint of another run: {}'.format(self.path, state['params']))
+        self.lines = state['lines']
+        self.offset = state['offset']
+        return True
+
+    def save(self, lines, offset):
+        self.lines = lines
+        self.offset = offset
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'params': self.params, 'lines': lines, 'offset': offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def corpus_lines(stream):
+    """
+    :param stream: binary, e.g. sys.stdin.buffer
+    :return: generator of the NFC normalized lines
+    """
+    previous = None
+    for line in read_nfc_lines(stream):
+        if previous is not None:
+            yield previous
+        previous = line
+    # a trailing newline ends the last line, it does not start another one
+    if previous:
+        yield previous
+
+
+def read_chunks(lines, chunk_lines, skip=0):
+    """
+    :param skip: the lines translated by an interrupted run
+    :return: generator of lists of at most chunk_lines lines
+    """
+    lines = islice(lines, skip, None)
+    while True:
+        chunk = list(islice(lines, chunk_lines))
+        if not chunk:
+            return
+        yield chunk
+
+
+def translate_corpus(chunks, translate_chunk, output, checkpoint, in_flight=4, initializer=None, initargs=(),
+                     progress=None):
+    """
+    Translates the chunks in in_flight worker processes (splitting, backend batches and formatting, each worker sends
+    its batches one after another) and writes the translations in the input order. The checkpoint is saved after every
+    written chunk.
+    :param translate_chunk: fn(lines) -> a translation per line, called in the workers, must be picklable
+    :param output: binary file positioned at checkpoint.offset
+    :param initializer: called in each worker, e.g. to push an app context
+    :param progress: fn(lines) called after every written chunk with the number of lines done
+    """
+    pending = deque()
+
+    def write_next():
+        size, future = pending.popleft()
+        data = ''.join(translation.replace('\n', ' ') + '\n' for translation in future.result()).encode('utf-8')
+        output.write(data)
+        output.flush()
+        if checkpoint.path:
+            os.fsync(output.fileno())
+        checkpoint.save(checkpoint.lines + size, checkpoint.offset + len(data))
+        if progress:
+            progress(checkpoint.lines)
+
+    # fork, the workers get the loaded models and vocabularies of this process
+    with ProcessPoolExecutor(in_flight, mp_context=multiprocessing.get_context('fork'), initializer=initializer,
+                             initargs=initargs) as executor:
+        try:
+            for chunk in chunks:
+                # a chunk waiting for every worker keeps them busy, more would only hold memory
+                if len(pending) >= 2 * in_flight:
+                    write_next()
+                pending.append((len(chunk), executor.submit(translate_chunk, chunk)))
+            while pending:
+                write_next()
+        except BaseException:
+            # the checkpoint has what was written, don't wait for the queued chunks
+            executor.shutdown(cancel_futures=True)
+            raise
@@ -0,0 +1,91 @@
+"""
+The part of the ctranslate2 backend that runs in the pool processes. Kept out of app.models so that a spawned pool
+process imports only this module, not tensor2tensor and the rest of the app.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_translator = None
+_source_spm = None
+_target_spm = None
+
+
+def _init_process(model_dir, spm_vocab, target_spm_vocab, intra_threads, compute_type):
+    global _translator, _source_spm, _target_spm
+    # imported here, the frontend itself doesn't need ctranslate2 unless a model uses it
+    import ctranslate2
+    import sentencepiece as spm
+
+    _translator = ctranslate2.Translator(model_dir, device='cpu', inter_threads=1, intra_threads=intra_threads,
+                                         compute_type=compute_type)
+    _source_spm = spm.SentencePieceProcessor()
+    _source_spm.Load(spm_vocab)
+    if target_spm_vocab and target_spm_vocab != spm_vocab:
+        _target_spm = spm.SentencePieceProcessor()
+        _target_spm.Load(target_spm_vocab)
+    else:
+        _target_spm = _source_spm
+
+
+def _translate_batch(sentences, beam_size, target_prefix):
+    """
+    :param target_prefix: list of tokens forced at the start of every translation (e.g. a target language token) or
+    None
+    :return: the translations
+    """
+    tokens = [_source_spm.EncodeAsPieces(sent) for sent in sentences]
+    results = _translator.translate_batch(tokens, beam_size=beam_size,
+                                         target_prefix=[target_prefix] * len(tokens) if target_prefix else None)
+    translations = []
+    for result in results:
+        hypothesis = result.hypotheses[0]
+        if target_prefix:
+            hypothesis = hypothesis[len(target_prefix):]
+        translations.append(_target_spm.DecodePieces(hypothesis))
+    return translations
+
+
+class TranslatorPool(object):
+    """
+    A pool of processes, each with its own ctranslate2.Translator. Started on first use in the process that uses it
+    (i.e. in a gunicorn worker, not in the master before the fork) and restarted when a pool process dies.
+    """
+
+    def __init__(self, model_dir, spm_vocab, target_spm_vocab=None, processes=1, intra_threads=4,
+                 compute_type='int8'):
+        self._init_args = (model_dir, spm_vocab, target_spm_vocab, intra_threads, compute_type)
+        self.processes = processes
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn: forking a process with threads (grpc, flask) is not safe
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_process, initargs=self._init_args)
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, sentences, beam_size=4, target_prefix=None):
+        """
+        :return: a Future of the translations
+        """
+        try:
+            return self._get_executor().submit(_translate_batch, sentences, beam_size, target_prefix)
+        except BrokenProcessPool as e:
+            self.reset_if_broken(e)
+            raise
+
+    def reset_if_broken(self, error):
+        """
+        Call when a batch failed; a pool with a dead process is started again on the next submit
+        """
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._executor = None
@@ -1,37 +1,55 @@
 import os
 import sqlite3
-from flask import g
+from flask import current_app, g
 
 dirname = os.path.dirname(__file__)
 
 DATABASE = os.path.join(dirname, 'database.db')
 
 
+def get_database_path():
+    """
+    DATABASE from the app config, defaults to database.db next to this file
+    """
+    return current_app.config.get('DATABASE') or DATABASE
+
+
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
+        db = g._database = sqlite3.connect(get_database_path())
     return db
 
 
 def init_db():
-    db = sqlite3.connect(DATABASE)
+    db = sqlite3.connect(get_database_path())
     with open(os.path.join(dirname, 'schema.sql'), mode='r') as f:
         db.cursor().executescript(f.read())
     db.commit()
 
 
-def log_translation(src_lang, tgt_lang, src, tgt, author, frontend, ip_address, input_type, app_version, user_lang):
+def log_translation(src_lang, tgt_lang, src, tgt, author, frontend, ip_address, input_type, app_version, user_lang,
+                    commit=True):
     db = get_db()
     db.cursor().execute("INSERT INTO translations (src_lang, tgt_lang, src, tgt, author, frontend, ip_address, "
                         "input_type, app_version, user_lang) VALUES (?,?,?,?,?,?,?,?,?,?)",
             (src_lang, tgt_lang, src, tgt, author, frontend, ip_address, input_type, app_version, user_lang))
-    db.commit()
+    if commit:
+        db.commit()
 
 
-def log_access(src_lang, tgt_lang, author, frontend, input_nfc_len, duration_us, input_type, app_version, user_lang):
+def log_access(src_lang, tgt_lang, author, frontend, input_nfc_len, duration_us, input_type, app_version, user_lang,
+               commit=True):
     db = get_db()
     db.cursor().execute("INSERT INTO access (src_lang, tgt_lang, input_nfc_len, author, frontend, duration_us, "
                         "input_type, app_version, user_lang) VALUES (?,?,?,?,?,?,?,?,?)",
             (src_lang, tgt_lang, input_nfc_len, author, frontend, duration_us, input_type, app_version, user_lang))
-    db.commit()
+    if commit:
+        db.commit()
+
+
+def commit():
+    """
+    Commits the rows logged with commit=False, e.g. one row per target of a fan-out request in one transaction
+    """
+    get_db().commit()
@@ -0,0 +1,76 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """
+    The request ran out of time; the batches not sent yet were skipped
+    """
+
+
+class Deadline(object):
+    """
+    The point in time by which a request has to be translated. Passed down the pipeline so that every backend call
+    gets only the time that is left and no batch is sent after the client stopped waiting.
+    """
+
+    def __init__(self, timeout_secs):
+        self.timeout_secs = timeout_secs
+        self.expires_at = time.monotonic() + timeout_secs
+
+    def remaining(self):
+        """
+        :return: seconds left, never below 0
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        """
+        :raises DeadlineExceeded: when there is no time left
+        """
+        if self.expired():
+            raise DeadlineExceeded('The request did not finish within {} s'.format(self.timeout_secs))
+
+
+def remaining(deadline, default):
+    """
+    :return: the time left before the deadline or default when there is no deadline
+    """
+    return default if deadline is None else deadline.remaining()
+
+
+def check(deadline):
+    if deadline is not None:
+        deadline.check()
+
+
+def socket_timeout(deadline, default):
+    """
+    remaining() for a socket timeout; a timeout of 0 would make the socket non-blocking
+    :raises DeadlineExceeded: when there is no time left
+    """
+    timeout = remaining(deadline, default)
+    if deadline is not None and timeout <= 0:
+        raise DeadlineExceeded('The request did not finish within {} s'.format(deadline.timeout_secs))
+    return timeout
+
+
+def request_timeout(header_value, route, route_timeouts):
+    """
+    The timeout of a request: the X-Request-Timeout header, at most the route's default
+    :param header_value: seconds or None
+    :param route: see coalesced in app/main/translate.py, e.g. 'languages' or 'models/en-cs'
+    :param route_timeouts: {route or 'default': seconds}, see REQUEST_DEADLINE_SECS in settings
+    :return: seconds
+    """
+    timeout = route_timeouts.get(route, route_timeouts.get('default'))
+    if header_value:
+        try:
+            requested = float(header_value)
+        except ValueError:
+            requested = None
+        if requested is not None and requested > 0:
+            timeout = min(requested, timeout) if timeout else requested
+    return timeout
@@ -1,5 +1,7 @@
 import logging
-from flask import Flask, Blueprint
+import os
+import tempfile
+from flask import Flask, Blueprint, request
 from . import settings
 from .extensions import bootstrap
 from .main.views import bp as main
@@ -7,6 +9,17 @@ from app.main.api.restplus import api
 from app.main.api.translation.endpoints.models import ns as models_ns
 from app.main.api.translation.endpoints.languages import ns as languages_ns
 from app.main.api.translation.endpoints.root import ns as root_ns
+from app.main.api.translation.endpoints.admin import ns as admin_ns
+from app.admission_utils import admission
+from app.coalesce_utils import single_flight
+from app.model_settings import models
+from app.models import batch_log
+from app.ratelimit_utils import limiter
+from app.revision_utils import revisions
+from app.shadow_utils import shadow
+from app.text_utils import preload_splitters
+from app.tracing_utils import start_trace, end_trace, current_trace_id
+from app.warmup_utils import warmup
 
 
 class ReverseProxied(object):
@@ -42,6 +55,25 @@ class ReverseProxied(object):
             environ['wsgi.url_scheme'] = scheme
         return self.app(environ, start_response)
 
+def _init_tracing(app):
+
+    @app.before_request
+    def _start_trace():
+        start_trace(request.headers.get('X-Trace-Id'), app.config['TRACE_SAMPLE_RATE'])
+
+    @app.after_request
+    def _add_trace_header(response):
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers['X-Trace-Id'] = trace_id
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        trace_file = app.config['TRACE_FILE'] or os.path.join(tempfile.gettempdir(), 'lindat-traces.json')
+        end_trace(trace_file, method=request.method, path=request.path, **({'error': repr(exc)} if exc else {}))
+
+
 def create_app():
     app = Flask(__name__)
     app.wsgi_app = ReverseProxied(app.wsgi_app)
@@ -49,6 +81,23 @@ def create_app():
     app.config.from_envvar('LOCAL_SETTINGS', silent=True)
     logging.getLogger().error('DEFAULT_SERVER=' + app.config.get('DEFAULT_SERVER'))
     bootstrap.init_app(app)
+    # with gunicorn --preload this happens before the workers fork, so they share the splitters
+    preload_splitters(models.get_source_languages(), app.config['SENTENCE_SPLITTERS'])
+    batch_log.configure(app.config['LOG_BATCH_SAMPLE_EVERY'])
+    single_flight.configure(app.config['COALESCE_DIR'], app.config['COALESCE_RESULT_TTL'],
+                            app.config['COALESCE_MAX_WAIT_SECS'])
+    admission.configure(app.config['ADMISSION_DIR'],
+                        app.config['ADMISSION_CLASSES'] if app.config['ADMISSION_CONTROL'] else {})
+    limiter.configure(app.config['RATE_LIMIT_DATABASE'], app.config['RATE_LIMIT_CAPACITY'],
+                      app.config['RATE_LIMIT_RATE'], app.config['RATE_LIMIT_OVERRIDES'],
+                      app.config['RATE_LIMIT_IDLE_SECS'])
+    revisions.configure(app.config['REVISION_DATABASE'], app.config['REVISION_TTL'],
+                        app.config['REVISION_MAX_ENTRIES'])
+    warmup.configure(app.config['WARMUP_LENGTHS'], app.config['WARMUP_RETRY_SECS'], app.config['WARMUP_TIMEOUT_SECS'],
+                     ready_while_rewarming=app.config['WARMUP_READY_WHILE_REWARMING'])
+    shadow.configure(app.config['SHADOW_DATABASE'], app.config['SHADOW_MAX_PENDING'], app.config['SHADOW_TIMEOUT_SECS'],
+                     app.config['SHADOW_MAX_ROWS'])
+    _init_tracing(app)
     app.register_blueprint(main)
 
     # https://github.com/noirbizarre/flask-restplus/issues/712
@@ -61,5 +110,6 @@ def create_app():
     api.add_namespace(models_ns)
     api.add_namespace(languages_ns)
     api.add_namespace(root_ns)
+    api.add_namespace(admin_ns)
     app.register_blueprint(api_bp)
     return app
@@ -0,0 +1,187 @@
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app.stats_utils import percentile, summarize
+from app.tracing_utils import span
+
+log = logging.getLogger(__name__)
+
+# threads of a worker process running the hedged backend calls
+MAX_THREADS = 64
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # the threads don't survive a fork
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(MAX_THREADS, thread_name_prefix='hedge')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+class Attempt(object):
+    """
+    One copy of a hedged backend call; the copy that loses the race is cancelled
+    """
+
+    def __init__(self, server, hedge=False):
+        self.server = server
+        self.hedge = hedge
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, fn):
+        """
+        Registers fn aborting the request of this attempt, e.g. cancelling the grpc future; called right away when
+        the attempt is already cancelled
+        """
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                log.debug('Cancelling the request to %s failed', self.server, exc_info=True)
+
+
+class HedgePolicy(object):
+    """
+    Hedged backend calls of a model: a batch that did not return within the `percentile` of the recent latencies is
+    sent again to one of the model's replicas and whichever answer comes first is used, the other request is
+    cancelled. A call earns `budget` hedges (at most `burst` saved up), so the replicas get at most that much extra
+    load.
+    """
+
+    def __init__(self, percentile=95, budget=0.05, burst=10, window=1000, min_samples=20):
+        """
+        :param window: the number of recent latencies the percentile is taken of
+        :param min_samples: no hedging until this many latencies are known
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._delay = None
+        self._tokens = 0.0
+        self._next_replica = itertools.count()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    def delay(self):
+        """
+        :return: seconds to wait for the first answer before hedging, None while there are too few latencies
+        """
+        return self._delay
+
+    def _record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            # sorting the window on every call would cost more than the calls it saves
+            if len(self._latencies) >= self.min_samples and (self._delay is None or self.calls % 10 == 0):
+                self._delay = percentile(self._latencies, self.percentile)
+
+    def _take_budget(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.hedged += 1
+                return True
+            self.over_budget += 1
+            return False
+
+    def call(self, send, server, replicas):
+        """
+        :param send: fn(attempt) -> the backend's answer; sends the request to attempt.server and registers
+            attempt.on_cancel to abort it
+        :param server: the primary server
+        :param replicas: the servers the hedges go to, in turns
+        :return: the first answer
+        """
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self._tokens + self.budget, self.burst)
+        delay = self.delay()
+        if delay is None:
+            start = time.monotonic()
+            result = send(Attempt(server))
+            self._record(time.monotonic() - start)
+            return result
+
+        executor = _get_executor()
+        started = []
+        started_event = threading.Event()
+
+        def send_primary(attempt):
+            started.append(time.monotonic())
+            started_event.set()
+            return send(attempt)
+
+        # the copied context carries the app context (g), the trace and the deadline of the request
+        futures = {}
+        primary = Attempt(server)
+        primary_future = executor.submit(contextvars.copy_context().run, send_primary, primary)
+        futures[primary_future] = primary
+        # the time the primary waited for a free thread is not the backend's, it must not set off a hedge
+        started_event.wait()
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._take_budget():
+            hedge = Attempt(replicas[next(self._next_replica) % len(replicas)], hedge=True)
+            futures[executor.submit(contextvars.copy_context().run, self._send_hedge, send, hedge)] = hedge
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        futures[loser].cancel()
+                    self._record(time.monotonic() - started[0])
+                    if futures[future].hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        # both failed, the error of the primary does not depend on which one failed first
+        raise primary_future.exception()
+
+    @staticmethod
+    def _send_hedge(send, attempt):
+        with span('hedge', server=attempt.server):
+            return send(attempt)
+
+    def metrics(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_rate': self.hedged / self.calls if self.calls else None,
+                'hedge_wins': self.hedge_wins,
+                'win_rate': self.hedge_wins / self.hedged if self.hedged else None,
+                'over_budget': self.over_budget,
+                'delay_secs': self._delay,
+                'latency_secs': summarize(latencies),
+            }
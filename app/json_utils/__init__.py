@@ -0,0 +1,35 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _stdlib_dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+_encoders = {
+    'json': _stdlib_dumps,
+}
+if orjson is not None:
+    _encoders['orjson'] = _orjson_dumps
+
+
+def get_encoder(name):
+    """
+    Returns a function that turns data into utf-8 encoded json bytes.
+    Falls back to the stdlib json module when the requested encoder is not installed.
+    :param name: 'orjson' or 'json'
+    :return:
+    """
+    return _encoders.get(name, _stdlib_dumps)
+
+
+def dumps(data, encoder='orjson'):
+    return get_encoder(encoder)(data)
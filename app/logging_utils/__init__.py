@@ -1 +1,2 @@
-from .logged import LoggedDecorator as logged
\ No newline at end of file
+from .logged import LoggedDecorator as logged
+from .lazy import Payload, SampledLogger
@@ -0,0 +1,74 @@
+"""
+Deferred formatting for the translation pipeline logs. Pass Payload as a %-style argument (never in an f-string), the
+logging module then formats it only when the record is actually emitted.
+"""
+import hashlib
+import itertools
+import logging
+
+
+class Payload(object):
+    """
+    A large payload (a batch of sentences, a block of text) summarized by size and hash instead of its content, e.g.
+    `20 items, 1843 chars, sha1 3f2a9c1e0b7d 'Hello world.' ...`
+    """
+    __slots__ = ('obj', 'preview')
+
+    def __init__(self, obj, preview=60):
+        """
+        :param obj: a string, a list (tuple, numpy array) of strings or anything else with a repr
+        :param preview: show at most this many characters of the first item
+        """
+        self.obj = obj
+        self.preview = preview
+
+    def __str__(self):
+        if isinstance(self.obj, str):
+            items = [self.obj]
+        elif hasattr(self.obj, '__len__') and hasattr(self.obj, '__iter__') and not isinstance(self.obj, dict):
+            items = [str(item) for item in self.obj]
+        else:
+            items = [repr(self.obj)]
+        digest = hashlib.sha1()
+        chars = 0
+        for item in items:
+            digest.update(item.encode('utf-8', 'surrogatepass'))
+            digest.update(b'\n')
+            chars += len(item)
+        summary = '{} items, {} chars, sha1 {}'.format(len(items), chars, digest.hexdigest()[:12])
+        if self.preview and items:
+            first = items[0]
+            summary += ' {!r}{}'.format(first[:self.preview], ' ...' if len(first) > self.preview or len(items) > 1
+                                        else '')
+        return summary
+
+
+class SampledLogger(object):
+    """
+    Wraps a logger for the per-batch messages: when the level is enabled, only every `every`-th message is passed on
+    """
+
+    def __init__(self, logger, every=1):
+        self.logger = logger
+        self.every = every
+        self._counter = itertools.count()
+
+    def configure(self, every):
+        self.every = max(1, int(every))
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        if self.every > 1 and next(self._counter) % self.every:
+            return
+        # report the caller of debug()/info(), not this module
+        self.logger.log(level, msg, *args, stacklevel=3)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
@@ -1,15 +1,16 @@
 import functools, logging
-from pprint import pformat
+
+from .lazy import Payload
 
 
 class LoggedDecorator(object):
     """Logging decorator that allows you to log with a
 specific logger.
 """
-    # Customize these messages
-    ENTRY_MESSAGE = 'Entering {}'
-    EXIT_MESSAGE = 'Exiting {}'
-    RETURNS_MESSAGES = 'Returns >>{}<<'
+    # Customize these messages, %s is the function name and the return value
+    ENTRY_MESSAGE = 'Entering %s'
+    EXIT_MESSAGE = 'Exiting %s'
+    RETURNS_MESSAGES = 'Returns >>%s<<'
 
     def __init__(self, logger=None):
         self.logger = logger
@@ -31,9 +32,12 @@ with logging.INFO level.
 
         @functools.wraps(func)
         def wrapper(*args, **kwds):
-            self.logger.info(self.ENTRY_MESSAGE.format(func.__name__))
+            if not self.logger.isEnabledFor(logging.INFO):
+                return func(*args, **kwds)
+            self.logger.info(self.ENTRY_MESSAGE, func.__name__)
             f_result = func(*args, **kwds)
-            self.logger.info(self.RETURNS_MESSAGES.format(pformat(f_result)))
-            self.logger.info(self.EXIT_MESSAGE.format(func.__name__))
+            # the return value may be a whole translated document; log its size and hash, formatted lazily
+            self.logger.info(self.RETURNS_MESSAGES, Payload(f_result))
+            self.logger.info(self.EXIT_MESSAGE, func.__name__)
             return f_result
         return wrapper
@@ -0,0 +1,60 @@
+import functools
+import hashlib
+from flask import current_app, request
+from flask.helpers import make_response
+from flask_restx.api import output_json as _restx_output_json
+from flask_restx.utils import unpack
+
+from app.json_utils import dumps
+from app.model_settings import models_cfg_digest
+
+# Every X-Script-Name/X-Scheme pair seen gets its own rendered variant; don't let clients grow this forever
+_MAX_RENDERED_VARIANTS = 1024
+_rendered = {}
+
+
+def output_json(data, code, headers=None):
+    """
+    Same as flask_restx output_json but serialized with the encoder chosen by JSON_ENCODER in settings.
+    In debug mode the pretty printed restx output is kept.
+    """
+    if current_app.debug:
+        return _restx_output_json(data, code, headers)
+    resp = make_response(dumps(data, current_app.config['JSON_ENCODER']), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def cached_rendering(func):
+    """
+    Caches the rendered json body of a GET handler whose output only depends on models.json.
+    The cache key is the models.json snapshot, the endpoint with its arguments and the SCRIPT_NAME/scheme
+    (set by ReverseProxied) the links were generated for. Responses carry an ETag and honor If-None-Match.
+    Put it above ns.marshal_with so that it sees the marshalled data; requests with a field mask (X-Fields) are not
+    cached, marshal_with applies the mask.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['CACHE_RENDERED_RESOURCES'] or \
+                not request.accept_mimetypes.best_match(['application/json']):
+            # let restx do the content negotiation
+            return func(*args, **kwargs)
+        if request.headers.get(current_app.config.get('RESTX_MASK_HEADER', 'X-Fields')):
+            data, code, headers = unpack(func(*args, **kwargs))
+            return output_json(data, code, headers)
+        key = (models_cfg_digest, request.endpoint, tuple(sorted(kwargs.items())), request.script_root,
+               request.scheme)
+        rendered = _rendered.get(key)
+        if rendered is None:
+            data, code, headers = unpack(func(*args, **kwargs))
+            if code != 200 or headers:
+                return output_json(data, code, headers)
+            body = dumps(data, current_app.config['JSON_ENCODER'])
+            rendered = (body, hashlib.sha1(body).hexdigest())
+            if len(_rendered) < _MAX_RENDERED_VARIANTS:
+                rendered = _rendered.setdefault(key, rendered)
+        body, etag = rendered
+        resp = current_app.response_class(body, mimetype='application/json')
+        resp.set_etag(etag)
+        return resp.make_conditional(request)
+    return wrapper
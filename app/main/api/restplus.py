@@ -1,6 +1,10 @@
 from flask import render_template
 from flask_restx import Api
 
+from app.admission_utils import AdmissionRejected
+from app.deadline_utils import DeadlineExceeded
+from app.ratelimit_utils import RateLimited
+
 # TODO terms, etc.
 api = Api(version='2.0', title='LINDAT Translation API', default_mediatype=None,
           contact_email='lindat-technical@ufal.mff.cuni.cz', doc='/doc')
@@ -10,3 +14,18 @@ api = Api(version='2.0', title='LINDAT Translation API', default_mediatype=None,
 def custom_ui():
     return render_template('swagger-ui.html', title=api.title,
                            specs_url=api.specs_url)
+
+
+@api.errorhandler(AdmissionRejected)
+def handle_admission_rejected(error):
+    return {'message': str(error)}, 429, {'Retry-After': str(error.retry_after)}
+
+
+@api.errorhandler(RateLimited)
+def handle_rate_limited(error):
+    return {'message': str(error)}, 429, error.quota.headers
+
+
+@api.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(error):
+    return {'message': str(error)}, 504
@@ -1,15 +1,21 @@
 import datetime
 from unicodedata import normalize
-from flask import request
+from flask import current_app, g, request
 from flask.helpers import make_response
 from flask_restx import Resource
-from flask_restx.api import output_json
 from flask_restx._http import HTTPStatus
 
 from app.main.api.restplus import api
+from app.main.api.representations import output_json
 from app.main.api.translation.parsers import text_input_with_src_tgt # , file_input
-from app.db import log_translation, log_access
-from app.text_utils import extract_text as _extract_text
+from app.admission_utils import classify
+from app.db import commit as commit_log, log_translation, log_access
+from app.deadline_utils import Deadline, request_timeout
+from app.main.translate import translate_revision
+from app.ratelimit_utils import RateLimited, client_key, limiter
+from app.revision_utils import make_scope, revisions
+from app.text_utils import extract_text as _extract_text, join_lines, read_nfc_lines
+from app.tracing_utils import span
 
 
 class MyAbstractResource(Resource):
@@ -18,23 +24,121 @@ class MyAbstractResource(Resource):
     def to_text(cls, data, code, headers):
         return make_response(_extract_text(data), code, headers)
 
-    def get_text_from_request(self):
+    def get_text_from_request(self, targets=1):
+        """
+        Returns the NFC normalized input as a list of lines. Uploaded files are decoded and normalized chunk by chunk,
+        so no full copies of the raw, decoded and normalized file are made.
+        :param targets: the number of target languages the input is translated into, see consume_quota
+        """
         self._start_time = datetime.datetime.now()
         if request.files and 'input_text' in request.files:
             input_file = request.files.get('input_text')
             if input_file.content_type != 'text/plain':
                 api.abort(code=415, message='Can only handle text/plain files.')
-            text = input_file.read().decode('utf-8')
+            try:
+                lines = list(read_nfc_lines(input_file.stream, current_app.config['UPLOAD_CHUNK_SIZE']))
+            except UnicodeDecodeError:
+                api.abort(code=400, message='The uploaded file is not valid utf-8.')
             self._input_file_name = input_file.filename or '_NO_FILENAME_SET'
         else:
             text = request.form.get('input_text')
+            lines = normalize('NFC', text).split('\n') if text else []
             self._input_file_name = '_DIRECT_INPUT'
-        if not text:
+        # the newlines count too
+        self._input_nfc_len = sum(map(len, lines)) + len(lines) - 1
+        if self._input_nfc_len <= 0:
             api.abort(code=400, message='No text found in the input_text form/field or in request files')
-        self._input_word_count = self._count_words(text)
-        text = normalize('NFC', text)
-        self._input_nfc_len = len(text)
-        return text
+        self._input_word_count = sum(len(line.split()) for line in lines)
+        g.priority_class = self.get_priority_class(uploaded=self._input_file_name != '_DIRECT_INPUT')
+        self._quota = self.consume_quota(targets)
+        self._revision = None
+        return lines
+
+    def get_revision(self):
+        """
+        :return: the X-Document-Revision header, the token of the revision the client edited or 'new', None when
+        the client doesn't ask for incremental translation (or it is off)
+        """
+        if not current_app.config['INCREMENTAL_TRANSLATION']:
+            return None
+        return request.headers.get('X-Document-Revision') or None
+
+    def translate_revision(self, route, src, tgt, models_on_path, text, revision, deadline):
+        """
+        Translates only what changed since the revision and stores the alignments of this one under a new token,
+        returned in the X-Document-Revision response header
+        """
+        scope = make_scope(route, src, tgt)
+        translation, alignments = translate_revision(models_on_path, text, revisions.load(revision, scope), deadline)
+        self._revision = revisions.save(scope, alignments)
+        return translation
+
+    def get_texts_from_json(self):
+        """
+        Reads the texts of a batch request, {"texts": ["...", {"text": "...", "src": "en", "tgt": "cs"}, ...]}, the
+        batch counts as one input for the billing, admission control and rate limiting
+        :return: a list of (NFC normalized text, src or None, tgt or None)
+        """
+        self._start_time = datetime.datetime.now()
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get('texts'), list) or not body['texts']:
+            api.abort(code=400, message='Expected a json object with a non-empty list of texts')
+        if len(body['texts']) > current_app.config['BATCH_MAX_TEXTS']:
+            api.abort(code=400, message='At most {} texts per request'.format(current_app.config['BATCH_MAX_TEXTS']))
+        items = []
+        for item in body['texts']:
+            if isinstance(item, str):
+                item = {'text': item}
+            if not isinstance(item, dict) or not isinstance(item.get('text'), str) or \
+                    not all(isinstance(item.get(key), (str, type(None))) for key in ('src', 'tgt')):
+                api.abort(code=400, message='Every item of texts has to be a string or an object with a text string '
+                                            'and optional src and tgt strings')
+            items.append((normalize('NFC', item['text']), item.get('src'), item.get('tgt')))
+        self._input_file_name = '_BATCH_INPUT'
+        self._input_nfc_len = sum(len(text) for text, _, _ in items)
+        if self._input_nfc_len <= 0:
+            api.abort(code=400, message='No text found in the texts')
+        self._input_word_count = sum(len(text.split()) for text, _, _ in items)
+        g.priority_class = self.get_priority_class(uploaded=False)
+        self._quota = self.consume_quota()
+        self._revision = None
+        return items
+
+    def consume_quota(self, targets=1):
+        """
+        Takes the input size, once per target language, from the client's rate limit bucket
+        :raises RateLimited: when the bucket doesn't have enough
+        :return: the Quota or None when rate limiting is off or the client can't be told apart
+        """
+        if not current_app.config['RATE_LIMIT']:
+            return None
+        key = client_key(self.get_additional_args_from_request(), current_app.config['RATE_LIMIT_KEY'])
+        if key is None:
+            return None
+        cost = self._input_word_count if current_app.config['RATE_LIMIT_UNIT'] == 'words' else self._input_nfc_len
+        cost *= targets
+        quota = limiter.consume(key, cost)
+        if not quota.allowed:
+            raise RateLimited(quota)
+        return quota
+
+    def get_deadline(self, route):
+        """
+        The X-Request-Timeout header or the default of the route, see REQUEST_DEADLINE_SECS in settings
+        :return: Deadline or None for no limit
+        """
+        timeout = request_timeout(request.headers.get('X-Request-Timeout'), route,
+                                  current_app.config['REQUEST_DEADLINE_SECS'])
+        return Deadline(timeout) if timeout else None
+
+    def get_priority_class(self, uploaded):
+        """
+        :return: the admission control class of the request, see ADMISSION_CLASSES in settings
+        """
+        args = self.get_additional_args_from_request()
+        return classify(uploaded, args['input_type'], args['frontend'], self._input_nfc_len,
+                        current_app.config['ADMISSION_INTERACTIVE_MAX_CHARS'],
+                        current_app.config['ADMISSION_BATCH_FRONTENDS'])
 
     def get_additional_args_from_request(self):
         args = text_input_with_src_tgt.parse_args(request)
@@ -45,7 +149,8 @@ class MyAbstractResource(Resource):
             'user_lang': args.get('X-User-Language') or 'unknown',
             'input_type': args.get('inputType') or 'keyboard',
             'log_input': args.get('logInput', False),
-            'ip_address': request.headers.get('X-Real-IP', 'unknown')
+            # the peer when there is no proxy in front of the app
+            'ip_address': request.headers.get('X-Real-IP') or request.remote_addr or 'unknown'
              }
 
     def set_media_type_representations(self):
@@ -56,32 +161,91 @@ class MyAbstractResource(Resource):
             self.representations['application/json'] = output_json
 
     def create_response(self, translation, extra_msg):
+        return translation, HTTPStatus.OK, self.billing_headers(self._count_words(translation), extra_msg)
+
+    def create_fan_out_response(self, translations, errors, extra_msg):
+        """
+        :param translations: {target: translation}
+        :param errors: {target: message} of the targets that failed
+        """
+        word_counts = {tgt: self._count_words(translation) for tgt, translation in translations.items()}
+        headers = self.billing_headers(sum(word_counts.values()), extra_msg)
+        for tgt, word_count in word_counts.items():
+            headers['X-Billing-Output-Word-Count-' + tgt] = word_count
+        return {'translations': translations, 'errors': errors}, HTTPStatus.OK, headers
+
+    def create_batch_response(self, results, extra_msg):
+        """
+        :param results: per text, {'translation': ..., 'src': ..., 'tgt': ...} or {'error': message}
+        """
+        output_word_count = 0
+        for result in results:
+            if 'translation' in result:
+                result['output_word_count'] = self._count_words(result['translation'])
+                output_word_count += result['output_word_count']
+        return {'results': results}, HTTPStatus.OK, self.billing_headers(output_word_count, extra_msg)
+
+    def billing_headers(self, output_word_count, extra_msg):
         end = datetime.datetime.now()
         headers = {
             'X-Billing-Filename': self._input_file_name,
             'X-Billing-Input-Word-Count': self._input_word_count,
-            'X-Billing-Output-Word-Count': self._count_words(translation),
+            'X-Billing-Output-Word-Count': output_word_count,
             'X-Billing-Start-Time': self._start_time,
             'X-Billing-End-Time': end,
             'X-Billing-Duration': str(end - self._start_time),
             'X-Billing-Input-NFC-Len': self._input_nfc_len,
             'X-Billing-Extra': extra_msg
         }
-        return translation, HTTPStatus.OK, headers
+        if self._quota is not None:
+            headers.update(self._quota.headers)
+        if self._revision:
+            headers['X-Document-Revision'] = self._revision
+        return headers
 
     def log_request(self, src, tgt, text, translation):
         self.log_request_with_additional_args(src=src, tgt=tgt, text=text, translation=translation, **self.get_additional_args_from_request())
 
+    def log_fan_out_request(self, src, text, translations):
+        """
+        Logs a row per target, like separate requests would, in one transaction
+        :param translations: {target: translation}, '' for the targets that failed
+        """
+        args = self.get_additional_args_from_request()
+        src_text = join_lines(text)
+        for tgt, translation in translations.items():
+            self.log_request_with_additional_args(src=src, tgt=tgt, text=src_text, translation=translation,
+                                                  commit=False, **args)
+        commit_log()
+
+    def log_batch_request(self, src, tgt, results):
+        """
+        One access row for the whole batch; with logInput also a translations row per text, in one transaction
+        :param results: (src, tgt, text, translation) per text
+        """
+        args = self.get_additional_args_from_request()
+        log_input = args.pop('log_input')
+        self.log_request_with_additional_args(src=src, tgt=tgt, text='', translation='', log_input=False,
+                                              commit=not log_input, **args)
+        if log_input:
+            for item_src, item_tgt, text, translation in results:
+                log_translation(src_lang=item_src, tgt_lang=item_tgt, src=join_lines(text),
+                                tgt=_extract_text(translation), author=args['author'], frontend=args['frontend'],
+                                ip_address=args['ip_address'], input_type=args['input_type'],
+                                app_version=args['app_version'], user_lang=args['user_lang'], commit=False)
+            commit_log()
+
     def log_request_with_additional_args(self, src, tgt, author, frontend, input_type, log_input, ip_address, text,
-                                         translation, app_version, user_lang):
+                                         translation, app_version, user_lang, commit=True):
         duration_us = int((datetime.datetime.now() - self._start_time) / datetime.timedelta(microseconds=1))
-        log_access(src_lang=src, tgt_lang=tgt, author=author, frontend=frontend,
-                   input_nfc_len=self._input_nfc_len, duration_us=duration_us, input_type=input_type,
-                   app_version=app_version, user_lang=user_lang)
-        if log_input:
-            log_translation(src_lang=src, tgt_lang=tgt, src=text, tgt=_extract_text(translation),
-                            author=author, frontend=frontend, ip_address=ip_address, input_type=input_type,
-                            app_version=app_version, user_lang=user_lang)
+        with span('db_log', log_input=bool(log_input)):
+            log_access(src_lang=src, tgt_lang=tgt, author=author, frontend=frontend,
+                       input_nfc_len=self._input_nfc_len, duration_us=duration_us, input_type=input_type,
+                       app_version=app_version, user_lang=user_lang, commit=commit)
+            if log_input:
+                log_translation(src_lang=src, tgt_lang=tgt, src=join_lines(text), tgt=_extract_text(translation),
+                                author=author, frontend=frontend, ip_address=ip_address, input_type=input_type,
+                                app_version=app_version, user_lang=user_lang, commit=commit)
 
     @staticmethod
     def _count_words(translation):
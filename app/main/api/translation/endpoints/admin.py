@@ -0,0 +1,92 @@
+import functools
+import hmac
+import os
+
+from flask import current_app, request
+from flask_restx import Namespace, Resource, reqparse
+
+from app.admission_utils import admission
+from app.model_settings import models
+from app.ratelimit_utils import limiter, redact_key
+from app.resource_utils import memory_report
+
+ns = Namespace('admin', description='Operational metrics and quotas', path='/admin')
+
+
+def require_admin_token(func):
+    """
+    The request has to carry ADMIN_TOKEN in the X-Admin-Token header; without ADMIN_TOKEN the endpoints are closed
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('ADMIN_TOKEN')
+        if not token:
+            ns.abort(code=403, message='The admin endpoints are disabled, ADMIN_TOKEN is not set')
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            ns.abort(code=403, message='Missing or wrong X-Admin-Token')
+        return func(*args, **kwargs)
+    return wrapper
+
+
+class AdminResource(Resource):
+    method_decorators = [require_admin_token]
+
+
+@ns.route('/admission')
+class Admission(AdminResource):
+
+    @ns.response(code=200, description='Success')
+    @ns.response(code=403, description='Missing or wrong X-Admin-Token')
+    def get(self):
+        """
+        Returns the admission control metrics per priority class. Counters and timings are of the worker that
+        answered, slots_in_use is of all the workers.
+        """
+        return {'pid': os.getpid(), 'classes': admission.metrics()}
+
+
+usage_args = reqparse.RequestParser()
+usage_args.add_argument('limit', type=int, default=100)
+
+
+@ns.route('/ratelimit')
+class RateLimit(AdminResource):
+
+    @ns.expect(usage_args)
+    @ns.response(code=200, description='Success')
+    @ns.response(code=403, description='Missing or wrong X-Admin-Token')
+    def get(self):
+        """
+        Returns the rate limit buckets of the clients that used the most, shared by all the workers. The ip addresses
+        in the client keys are hashed.
+        """
+        args = usage_args.parse_args(request)
+        clients = [dict(client, key=redact_key(client['key'])) for client in limiter.usage(args['limit'])]
+        return {'unit': current_app.config['RATE_LIMIT_UNIT'], 'clients': clients}
+
+
+@ns.route('/memory')
+class Memory(AdminResource):
+
+    @ns.response(code=200, description='Success')
+    @ns.response(code=403, description='Missing or wrong X-Admin-Token')
+    def get(self):
+        """
+        Returns the memory usage (rss, pss, uss in bytes) of the worker that answered, right after it was forked and
+        now, and the vocabularies shared by the models
+        """
+        return memory_report()
+
+
+@ns.route('/hedging')
+class Hedging(AdminResource):
+
+    @ns.response(code=200, description='Success')
+    @ns.response(code=403, description='Missing or wrong X-Admin-Token')
+    def get(self):
+        """
+        Returns the hedged batches of the models with replicas: how many were sent again to a replica, how many of
+        those answered first and the current hedging delay. Of the worker that answered.
+        """
+        return {'pid': os.getpid(), 'models': {model.model: model.hedge.metrics() for model in models.get_models()
+                                               if model.hedge is not None}}
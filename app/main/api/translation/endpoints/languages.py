@@ -1,13 +1,13 @@
 import logging
 from flask import request, url_for
-from flask.helpers import make_response
 from flask_restx import Namespace, Resource, fields
-from flask_restx.api import output_json
 
+from app.coalesce_utils import REQUEST_ERRORS
+from app.main.api.representations import cached_rendering
 from app.main.api.translation.endpoints.MyAbstractResource import MyAbstractResource
-from app.main.api.translation.parsers import text_input_with_src_tgt  # , file_input
-from app.model_settings import languages
-from app.main.translate import translate_from_to
+from app.main.api.translation.parsers import fan_out_input, text_input_with_src_tgt  # , file_input
+from app.model_settings import languages, models
+from app.main.translate import coalesced, fan_out_reusable, translate_fan_out, translate_from_to
 
 from app.main.api_examples.language_resource_example import *
 from app.main.api_examples.languages_resource_example import *
@@ -46,13 +46,12 @@ def identity(x):
     return x
 
 
-def set_endpoint_href(lang_o):
-    def add_href(x):
-        x.add_href(url_for('.languages_language_item', language=x.language))
-        return x
-
-    lang_o.sources = list(map(lambda src: add_href(src), lang_o.sources))
-    lang_o.targets = list(map(lambda tgt: add_href(tgt), lang_o.targets))
+def language_link(lang_o):
+    return {
+        'href': url_for('.languages_language_item', language=lang_o.language),
+        'name': lang_o.name,
+        'title': lang_o.title
+    }
 
 
 def get_templated_translate_link():
@@ -68,8 +67,10 @@ language_resource = ns.model('LanguageResource', {
         ns.model('LanguageResourceLinks', {
             'translate': fields.Nested(link, attribute=lambda _: get_templated_translate_link(),
                                        skip_none=True),
-            'sources': fields.List(fields.Nested(link, skip_none=True)),
-            'targets': fields.List(fields.Nested(link, skip_none=True)),
+            'sources': fields.List(fields.Nested(link, skip_none=True),
+                                   attribute=lambda x: [language_link(src) for src in x.sources]),
+            'targets': fields.List(fields.Nested(link, skip_none=True),
+                                   attribute=lambda x: [language_link(tgt) for tgt in x.targets]),
             'self': fields.Nested(link, attribute=lambda x: {'href': url_for(
                 '.languages_language_item', language=x.language)}, skip_none=True),
             # TODO potrebuju linky na modely k necemu? Potrebuju, kdyby interface vypadal choose
@@ -102,18 +103,16 @@ languages_resources = ns.model('LanguagesResource', {
 @ns.route('/')
 class LanguageCollection(MyAbstractResource):
 
+    @cached_rendering
     @ns.marshal_with(languages_resources, skip_none=True)
     def get(self):
         """
         Returns a list of available languages
         """
         values = list(languages.languages.values())
-        for lang_o in values:
-            set_endpoint_href(lang_o)
-
         return {
             '_links': {
-                _models_item_relation: values
+                _models_item_relation: [language_link(lang_o) for lang_o in values]
             },
             '_embedded': {
                 _models_item_relation: values
@@ -123,23 +122,39 @@ class LanguageCollection(MyAbstractResource):
     @ns.produces(['application/json', 'text/plain'])
     @ns.response(code=200, description="Success", model=str)
     @ns.response(code=415, description="You sent a file but it was not text/plain")
+    @ns.response(code=504, description="The translation did not finish within the request timeout")
     @ns.param(**{'name': 'tgt', 'description': 'tgt query param description', 'x-example': 'cs'})
     @ns.param(**{'name': 'src', 'description': 'src query param description', 'x-example': 'en'})
     @ns.param(**{'name': 'input_text', 'description': 'text to translate',
                  'x-example': 'this is a sample text', '_in': 'formData'})
+    @ns.param(**{'name': 'X-Document-Revision', '_in': 'header',
+                 'description': 'for edited documents: "new" or the X-Document-Revision of the previous response; '
+                                'only the changed sentences are translated again'})
     def post(self):
         """
         Translate input from scr lang to tgt lang.
         It expects the text in variable called `input_text` and handles both "application/x-www-form-urlencoded" and "multipart/form-data" (for uploading text/plain files)
         """
-        text = self.get_text_from_request()
         args = text_input_with_src_tgt.parse_args(request)
         src = args.get('src') or 'en'
         tgt = args.get('tgt') or 'cs'
+        # before the input is read, a pair without a route must not use up the client's quota
+        if not models.get_model_list(src, tgt):
+            ns.abort(code=404, message='Can\'t translate from {} to {}'.format(src, tgt))
+        text = self.get_text_from_request()
         translation = ''
         self.set_media_type_representations()
+        deadline = self.get_deadline('languages')
+        revision = self.get_revision()
         try:
-            translation = translate_from_to(src, tgt, text)
+            if revision:
+                models_on_path = models.get_model_list(src, tgt)
+                if not models_on_path:
+                    raise ValueError('No models found for the given pair')
+                translation = self.translate_revision('languages', src, tgt, models_on_path, text, revision, deadline)
+            else:
+                translation = coalesced('languages', src, tgt, text, translate_from_to, src, tgt, text, deadline,
+                                        deadline=deadline)
             return self.create_response(translation,
                                         'src={};tgt={}'.format(src, tgt))
         except ValueError as e:
@@ -152,8 +167,77 @@ class LanguageCollection(MyAbstractResource):
                 log.exception(ex)
 
 
+@ns.route('/fan-out')
+class LanguageFanOut(MyAbstractResource):
+
+    @ns.produces(['application/json'])
+    @ns.response(code=200, description="Success; a translation per target and the targets that failed, "
+                                       "X-Billing-Output-Word-Count-<tgt> header per target")
+    @ns.response(code=404, description="None of the targets can be translated from src")
+    @ns.response(code=415, description="You sent a file but it was not text/plain")
+    @ns.response(code=504, description="The translation did not finish within the request timeout")
+    @ns.param(**{'name': 'tgt', 'description': 'target languages, repeated or comma separated',
+                 'x-example': 'cs,de,fr'})
+    @ns.param(**{'name': 'src', 'description': 'src query param description', 'x-example': 'en'})
+    @ns.param(**{'name': 'input_text', 'description': 'text to translate',
+                 'x-example': 'this is a sample text', '_in': 'formData'})
+    def post(self):
+        """
+        Translate input from src lang into several tgt langs at once.
+        The input is read and split into sentences once, hops shared by the targets (e.g. the first hop through en)
+        are translated once and the rest run in parallel.
+        """
+        args = fan_out_input.parse_args(request)
+        src = args.get('src') or 'en'
+        targets = []
+        for value in args.get('tgt') or []:
+            for tgt in value.split(','):
+                tgt = tgt.strip()
+                if tgt and tgt not in targets:
+                    targets.append(tgt)
+        if not targets:
+            ns.abort(code=400, message='No tgt given')
+        if len(targets) > len(languages.languages):
+            ns.abort(code=400, message='Too many targets')
+        # only the targets with a route are charged
+        routed = sum(1 for tgt in targets if models.get_model_list(src, tgt))
+        if not routed:
+            ns.abort(code=404, message='Can\'t translate from {} to {}'.format(src, ','.join(targets)))
+        text = self.get_text_from_request(targets=routed)
+        translations = {}
+        deadline = self.get_deadline('languages')
+        try:
+            results = coalesced('languages/fan-out', src, ','.join(targets), text, translate_fan_out, src, targets,
+                                text, deadline, deadline=deadline, reusable=fan_out_reusable)
+            errors = {}
+            for tgt in targets:
+                if isinstance(results[tgt], Exception):
+                    errors[tgt] = results[tgt]
+                else:
+                    translations[tgt] = results[tgt]
+            if not translations:
+                # nothing to return, answer like the single target endpoint would (404, 429, 504); a target that
+                # ran out of time or was not admitted says more than one without a route
+                error = next((error for error in errors.values() if isinstance(error, REQUEST_ERRORS)),
+                             errors[targets[0]])
+                if isinstance(error, ValueError):
+                    ns.abort(code=404, message='Can\'t translate from {} to {}'.format(src, ','.join(targets)))
+                raise error
+            for tgt, error in errors.items():
+                log.error('Fan-out from %s to %s failed: %r', src, tgt, error)
+            return self.create_fan_out_response(translations, {tgt: str(error) for tgt, error in errors.items()},
+                                                'src={};tgt={}'.format(src, ','.join(targets)))
+        finally:
+            try:
+                self.log_fan_out_request(src=src, text=text,
+                                         translations={tgt: translations.get(tgt, '') for tgt in targets})
+            except Exception as ex:
+                log.exception(ex)
+
+
 @ns.route('/<string(length=2):language>')
 class LanguageItem(Resource):
+    @cached_rendering
     @ns.marshal_with(language_resource, skip_none=True)
     @ns.param(**{'name': 'language', 'description': 'Language code',
                  'x-example': 'en', '_in': 'path'})
@@ -161,8 +245,8 @@ class LanguageItem(Resource):
         """
         Returns a language resource object
         """
-        lang_o = languages.languages[language]
-        # TODO can we not call setter when the href was alredy set
-        set_endpoint_href(lang_o)
+        lang_o = languages.languages.get(language)
+        if lang_o is None:
+            ns.abort(code=404, message='Unknown language {}'.format(language))
         return lang_o
 
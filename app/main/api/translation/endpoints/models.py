@@ -2,10 +2,11 @@ import logging
 from flask import request, url_for
 from flask_restx import Namespace, Resource, fields
 
+from app.main.api.representations import cached_rendering
 from app.main.api.translation.endpoints.MyAbstractResource import MyAbstractResource
 from app.main.api.translation.parsers import text_input_with_src_tgt
 from app.model_settings import models
-from app.main.translate import translate_with_model
+from app.main.translate import coalesced, group_batch_items, translate_many_with_model, translate_with_model
 
 from app.main.api_examples.model_resource_example import *
 from app.main.api_examples.models_resource_example import *
@@ -38,9 +39,12 @@ def identity(x):
     return x
 
 
-def add_href(model):
-    model.add_href(url_for('.models_model_item', model=model.model))
-    return model
+def model_link(model):
+    return {
+        'href': url_for('.models_model_item', model=model.model),
+        'name': model.name,
+        'title': model.title
+    }
 
 
 def get_templated_translate_link(model):
@@ -74,7 +78,7 @@ models_resources = ns.model('ModelsResource', {
     '_links': fields.Nested(models_links,
                             attribute=lambda x: {'self':
                                                  {'href': url_for('.models_model_collection')},
-                                                 'models': list(map(add_href, x['models']))},
+                                                 'models': [model_link(model) for model in x['models']]},
                             example=models_resource_links_example
                             ),
     '_embedded': fields.Nested(ns.model('EmbeddedModels', {
@@ -87,6 +91,7 @@ models_resources = ns.model('ModelsResource', {
 @ns.route('/')
 class ModelCollection(Resource):
 
+    @cached_rendering
     @ns.marshal_with(models_resources, skip_none=True, code=200, description='Success')
     def get(self):
         """
@@ -103,17 +108,20 @@ class ModelItem(MyAbstractResource):
     @ns.produces(['application/json', 'text/plain'])
     @ns.response(code=200, description="Success", model=str)
     @ns.response(code=415, description="You sent a file but it was not text/plain")
+    @ns.response(code=504, description="The translation did not finish within the request timeout")
     @ns.param(**{'name': 'tgt', 'description': 'tgt query param description', 'x-example': 'cs'})
     @ns.param(**{'name': 'src', 'description': 'src query param description', 'x-example': 'en'})
     @ns.param(**{'name': 'input_text', 'description': 'text to translate',
                  'x-example': 'this is a sample text', '_in': 'formData'})
+    @ns.param(**{'name': 'X-Document-Revision', '_in': 'header',
+                 'description': 'for edited documents: "new" or the X-Document-Revision of the previous response; '
+                                'only the changed sentences are translated again'})
     def post(self, model):
         """
         Send text to be processed by the selected model.
         It expects the text in variable called `input_text` and handles both "application/x-www-form-urlencoded" and "multipart/form-data" (for uploading text/plain files)
         If you don't provide src or tgt some will be chosen for you!
         """
-        text = self.get_text_from_request()
         args = text_input_with_src_tgt.parse_args(request)
         # map model name to model obj
         model = models.get_model(model)
@@ -129,12 +137,22 @@ class ModelItem(MyAbstractResource):
             ns.abort(code=404,
                       message='This model does not support translation from {} to {}'
                       .format(src, tgt))
+        # only now, a rejected pair must not use up the client's quota
+        text = self.get_text_from_request()
 
         translation = ''
 
         self.set_media_type_representations()
+        route = 'models/' + model.name
+        deadline = self.get_deadline(route)
+        revision = self.get_revision()
         try:
-            translation = translate_with_model(model, text, src, tgt)
+            if revision:
+                translation = self.translate_revision(route, src, tgt, [{'model': model, 'src': src, 'tgt': tgt}],
+                                                      text, revision, deadline)
+            else:
+                translation = coalesced(route, src, tgt, text, translate_with_model, model, text, src, tgt, deadline,
+                                        deadline=deadline)
             return self.create_response(translation,
                                         'src={};tgt={};model={}'.format(src, tgt, model.name))
         finally:
@@ -143,9 +161,61 @@ class ModelItem(MyAbstractResource):
             except Exception as ex:
                 log.exception(ex)
 
+    @cached_rendering
     @ns.marshal_with(model_resource, skip_none=True)
     def get(self, model):
         """
         Get model's details
         """
         return models.get_model(model)
+
+
+batch_texts = ns.model('BatchTexts', {
+    'texts': fields.List(fields.Raw, required=True, description='strings or {"text": ..., "src": ..., "tgt": ...}',
+                         example=['Save', {'text': 'Open file', 'src': 'en', 'tgt': 'cs'}]),
+})
+
+
+@ns.route('/<any' + str(tuple(models.get_model_names())) + ':model>/batch')
+@ns.param(**{'name': 'model', 'description': 'model name', 'x-example': 'en-cs', '_in': 'path'})
+class ModelBatch(MyAbstractResource):
+
+    @ns.produces(['application/json'])
+    @ns.response(code=200, description="Success; a result per text, in the order of the texts")
+    @ns.response(code=400, description="The body is not {\"texts\": [...]} or has too many texts")
+    @ns.response(code=504, description="The translation did not finish within the request timeout")
+    @ns.param(**{'name': 'tgt', 'description': 'default tgt of the texts', 'x-example': 'cs'})
+    @ns.param(**{'name': 'src', 'description': 'default src of the texts', 'x-example': 'en'})
+    @ns.expect(batch_texts)
+    def post(self, model):
+        """
+        Translate many short texts in one request.
+        The sentences of all the texts with the same src and tgt go to the backend in shared batches; the request is
+        billed and logged as a whole. src and tgt default to the query params and then to the model's defaults; a text
+        whose pair the model doesn't support gets an error.
+        """
+        items = self.get_texts_from_json()
+        args = text_input_with_src_tgt.parse_args(request)
+        model = models.get_model(model)
+        results, groups = group_batch_items(model, items, args.get('src'), args.get('tgt'))
+        src_default = args.get('src') or list(model.supports.keys())[0]
+
+        route = 'models/' + model.name
+        deadline = self.get_deadline(route)
+        translated = []
+        try:
+            for (src, tgt), indices in groups.items():
+                texts = [items[i][0] for i in indices]
+                for i, translation in zip(indices, translate_many_with_model(model, texts, src, tgt, deadline)):
+                    results[i] = {'translation': translation, 'src': src, 'tgt': tgt,
+                                  'input_word_count': len(items[i][0].split())}
+                    translated.append((src, tgt, items[i][0], translation))
+            pairs = sorted(groups)
+            return self.create_batch_response(results, 'texts={};pairs={};model={}'.format(
+                len(items), ','.join('{}-{}'.format(src, tgt) for src, tgt in pairs), model.name))
+        finally:
+            try:
+                self.log_batch_request(src=','.join(sorted({src for src, _ in groups})) or src_default,
+                                       tgt=','.join(sorted({tgt for _, tgt in groups})), results=translated)
+            except Exception as ex:
+                log.exception(ex)
@@ -16,3 +16,6 @@ text_input_with_src_tgt.add_argument('X-App-Version', type=str, location='header
 text_input_with_src_tgt.add_argument('X-User-Language', type=str, location='headers')
 text_input_with_src_tgt.add_argument('inputType', type=str)
 text_input_with_src_tgt.add_argument('logInput', type=inputs.boolean)
+# several tgt values (repeated or comma separated) for /languages/fan-out
+fan_out_input = text_input_with_src_tgt.copy()
+fan_out_input.replace_argument('tgt', type=str, action='append')
@@ -1,23 +1,196 @@
 #from app.logging_utils import logged
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.coalesce_utils import REQUEST_ERRORS, make_key, single_flight
 from app.model_settings import models
-from app.text_utils import extract_text as _extract_text
+from app.text_utils import extract_text as _extract_text, is_blank, shared_splitting
+from app.tracing_utils import span
 
 import logging
 log = logging.getLogger(__name__)
 
 
-def translate_with_model(model, text, src=None, tgt=None):
-    if not text or not text.strip():
+def translate_with_model(model, text, src=None, tgt=None, deadline=None):
+    if is_blank(text):
         return []
-    return model.translate(text, src, tgt)
+    return model.translate(text, src, tgt, deadline=deadline)
+
+
+def translate_many_with_model(model, texts, src=None, tgt=None, deadline=None):
+    """
+    :return: a translation per text, the non-blank ones translated in shared backend batches
+    """
+    translations = [[] for _ in texts]
+    to_translate = [i for i, text in enumerate(texts) if not is_blank(text)]
+    if to_translate:
+        for i, translation in zip(to_translate, model.translate_many([texts[i] for i in to_translate], src, tgt,
+                                                                     deadline=deadline)):
+            translations[i] = translation
+    return translations
 
 
-def translate_from_to(source, target, text):
+def translate_from_to(source, target, text, deadline=None):
     models_on_path = models.get_model_list(source, target)
     if not models_on_path:
         raise ValueError('No models found for the given pair')
     translation = []
     for obj in models_on_path:
-        translation = translate_with_model(obj['model'], text, obj['src'], obj['tgt'])
+        with span('hop', model=obj['model'].model, src=obj['src'], tgt=obj['tgt']):
+            translation = translate_with_model(obj['model'], text, obj['src'], obj['tgt'], deadline=deadline)
         text = _extract_text(translation)
     return translation
+
+
+def get_route(source, target, model_name=None):
+    """
+    :param model_name: translate with this model only instead of the shortest path from source to target
+    :return: models_on_path
+    """
+    if model_name:
+        model = models.get_model(model_name) if model_name in models.get_model_names() else None
+        if model is None or target not in model.supports.get(source, []):
+            raise ValueError('{} does not translate from {} to {}'.format(model_name, source, target))
+        return [{'model': model, 'src': source, 'tgt': target}]
+    models_on_path = models.get_model_list(source, target)
+    if not models_on_path:
+        raise ValueError('No models found for the given pair')
+    return models_on_path
+
+
+def translate_lines(source, target, lines, model_name=None):
+    """
+    Translates each line on its own, hop by hop, the sentences of all the lines go to the backend in shared batches
+    (used by the translate-corpus command)
+    :return: a translation (str) per line
+    """
+    for obj in get_route(source, target, model_name):
+        with span('hop', model=obj['model'].model, src=obj['src'], tgt=obj['tgt']):
+            translations = translate_many_with_model(obj['model'], lines, obj['src'], obj['tgt'])
+        lines = [_extract_text(translation).strip() for translation in translations]
+    return lines
+
+
+def group_batch_items(model, items, src=None, tgt=None):
+    """
+    Groups the texts of a batch request by their pair, see translate_many_with_model
+    :param items: (text, src or None, tgt or None) per text
+    :param src: the default src of the items, the model's first source language when None
+    :param tgt: the default tgt of the items, the model's first target of their src when None
+    :return: a result per item, None or {'error': message} for the pairs the model doesn't support, and the
+        {(src, tgt): indices of the items} groups
+    """
+    src = src or list(model.supports.keys())[0]
+    results = [None] * len(items)
+    groups = {}
+    for i, (_, item_src, item_tgt) in enumerate(items):
+        item_src = item_src or src
+        if item_src not in model.supports:
+            results[i] = {'error': 'This model does not support translation from {}'.format(item_src)}
+            continue
+        item_tgt = item_tgt or tgt or model.supports[item_src][0]
+        if item_tgt not in model.supports[item_src]:
+            results[i] = {'error': 'This model does not support translation from {} to {}'.format(item_src, item_tgt)}
+            continue
+        groups.setdefault((item_src, item_tgt), []).append(i)
+    return results, groups
+
+
+def translate_revision(models_on_path, text, previous=None, deadline=None):
+    """
+    Translates a new revision of an edited text hop by hop, sending only the new and changed sentences of each hop to
+    the backend (see Model.translate_revision)
+    :param previous: the alignments of the previous revision, one per hop, None for the first revision
+    :return: the translation and the alignments of this revision
+    """
+    translation = []
+    alignments = []
+    for i, obj in enumerate(models_on_path):
+        if is_blank(text):
+            return [], alignments
+        with span('hop', model=obj['model'].model, src=obj['src'], tgt=obj['tgt']):
+            translation, alignment = obj['model'].translate_revision(
+                text, obj['src'], obj['tgt'], previous[i] if previous and i < len(previous) else None,
+                deadline=deadline)
+        alignments.append(alignment)
+        text = _extract_text(translation)
+    return translation, alignments
+
+
+def translate_fan_out(source, targets, text, deadline=None):
+    """
+    Translates text into each of the targets. The routes form a tree: a hop shared by several targets (e.g. cs->en
+    for cs->de and cs->fr) runs once, the branches run in parallel and each text is split into sentences once.
+    :return: {target: translation or the exception that stopped it}
+    """
+    routes = []
+    results = {}
+    for target in targets:
+        models_on_path = models.get_model_list(source, target)
+        if models_on_path:
+            routes.append((target, models_on_path))
+        else:
+            results[target] = ValueError('No models found for the given pair')
+    if routes:
+        # one thread per leaf is enough: a branch runs its first child itself while waiting for the others
+        with shared_splitting(), ThreadPoolExecutor(max_workers=len(routes)) as executor:
+            _translate_branches(executor, text, routes, 0, results, deadline)
+    return results
+
+
+def fan_out_reusable(results):
+    """
+    Whether the results of translate_fan_out can be handed to an identical request; not when a target failed on the
+    deadline or admission of the request that translated it
+    """
+    return not any(isinstance(result, REQUEST_ERRORS) for result in results.values())
+
+
+def _translate_branches(executor, text, routes, depth, results, deadline):
+    """
+    :param routes: (target, models_on_path) of the targets that share the first `depth` hops, text is their output
+    """
+    branches = {}
+    for target, models_on_path in routes:
+        obj = models_on_path[depth]
+        branches.setdefault((obj['model'].model, obj['src'], obj['tgt']), []).append((target, models_on_path))
+
+    def run(branch):
+        obj = branch[0][1][depth]
+        try:
+            with span('hop', model=obj['model'].model, src=obj['src'], tgt=obj['tgt'],
+                      targets=[target for target, _ in branch]):
+                translation = translate_with_model(obj['model'], text, obj['src'], obj['tgt'], deadline=deadline)
+        except Exception as e:
+            for target, _ in branch:
+                results[target] = e
+            return
+        next_routes = []
+        for target, models_on_path in branch:
+            if len(models_on_path) == depth + 1:
+                results[target] = translation
+            else:
+                next_routes.append((target, models_on_path))
+        if next_routes:
+            _translate_branches(executor, _extract_text(translation), next_routes, depth + 1, results, deadline)
+
+    branches = list(branches.values())
+    # the copied context carries the app context (g.priority_class), the trace and the shared splitting
+    futures = [executor.submit(contextvars.copy_context().run, run, branch) for branch in branches[1:]]
+    run(branches[0])
+    for future in futures:
+        future.result()
+
+
+def coalesced(route, src, tgt, text, fn, *args, deadline=None, reusable=None):
+    """
+    Calls fn(*args) or, when an identical request (same route, src, tgt and text) is already being translated,
+    waits for it (at most until the deadline) and returns a copy of its translation
+    :param reusable: see SingleFlight.do
+    """
+    with span('translate', route=route, src=src, tgt=tgt):
+        if not current_app.config['COALESCE_REQUESTS']:
+            return fn(*args)
+        return single_flight.do(make_key(route, src, tgt, text), fn, *args, deadline=deadline, reusable=reusable)
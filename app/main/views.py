@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, request, current_app, url_for, redirect
+from flask import Blueprint, render_template, request, current_app, url_for, redirect, jsonify
 
 from .forms import TranslateForm
 from app.model_settings import models as models_conf
 from app.model_settings import languages
+from app.warmup_utils import warmup
 
 bp = Blueprint('main', __name__)
 
@@ -35,6 +36,17 @@ def docs():
     return render_template('docs.html', file_size_limit=current_app.config['MAX_CONTENT_LENGTH'])
 
 
+@bp.route('/ready', methods=['GET'])
+def ready():
+    """
+    For the load balancer: 503 until this worker warmed up the models (see WARMUP_LENGTHS), starts the warm-up
+    when the gunicorn hook didn't
+    """
+    warmup.start(current_app._get_current_object(), models_conf.get_models())
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
 def url_for_choices():
     return list(map(lambda model:
                     (url_for('api.models_model_item', model=model.model), model.title),
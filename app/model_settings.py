@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import os
@@ -93,6 +94,12 @@ class Models(object):
     def get_default_model_name(self):
         return self._default_model_name
 
+    def get_source_languages(self):
+        """
+        Languages the models translate from, i.e. the languages we split into sentences
+        """
+        return sorted({src for model in self._models.values() for src in model.supports})
+
     def get_model_names(self):
         return list(self._models.keys())
 
@@ -118,11 +125,6 @@ class Language(object):
         yield 'title', self.title
         yield 'sources', self.sources
         yield 'targets', self.targets
-        if self.href:
-            yield 'href', self.href
-
-    def add_href(self, href):
-        self.href = href
 
 
 class Languages(object):
@@ -144,9 +146,20 @@ class Languages(object):
                 lang.sources.add(from_lang)
                 from_lang.targets.add(lang)
 
+        # The languages are shared by all requests (and threads), don't let anyone modify them
+        for lang in self.languages.values():
+            lang.sources = tuple(sorted(lang.sources, key=lambda l: l.name))
+            lang.targets = tuple(sorted(lang.targets, key=lambda l: l.name))
+
+
+# MODELS_JSON env variable can point to an alternative config (e.g. the one generated by the benchmarks)
+models_json_path = os.environ.get('MODELS_JSON') or os.path.join(os.path.dirname(__file__), 'models.json')
+with open(models_json_path, 'rb') as models_json:
+    _models_cfg_raw = models_json.read()
 
-with open(os.path.join(os.path.dirname(__file__), 'models.json')) as models_json:
-    models_cfg = json.load(models_json)
+# identifies the config snapshot, anything derived only from models.json can be cached under this key
+models_cfg_digest = hashlib.sha1(_models_cfg_raw).hexdigest()
+models_cfg = json.loads(_models_cfg_raw)
 
 models = Models(models_cfg)
 languages = Languages(models)
@@ -1,3 +1,4 @@
-from .model import Model, hparams, log
+from .model import Model, batch_log, hparams, log
 from .marian_model import MarianModel
 from .t2t_model import T2TModel, T2TDocModel, T2TModelWithScores
+from .ctranslate2_model import CTranslate2Model
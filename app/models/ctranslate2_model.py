@@ -0,0 +1,71 @@
+from concurrent.futures import TimeoutError
+
+from flask import current_app
+
+import app.models as models
+from app.admission_utils import backend_slot
+from app.ctranslate2_utils import TranslatorPool
+from app.deadline_utils import DeadlineExceeded, check, remaining
+from app.tracing_utils import span
+
+
+class CTranslate2Model(models.MarianModel):
+    """
+    Translates in-process on CPU with a ctranslate2 model (e.g. a converted marian/OPUS-MT model), no serving daemon
+    needed. The batches go to a pool of processes owned by this model; sentences are cut by the spm_vocab subwords
+    like for marian.
+    """
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self.model_dir = cfg['model_dir']
+        self.beam_size = cfg.get('beam_size', 4)
+        # e.g. ">>{target}<<" for multilingual models
+        self.target_prefix = cfg.get('target_prefix', None)
+        self.pool = TranslatorPool(self.model_dir, self.spm_vocab, cfg.get('target_spm_vocab'),
+                                   processes=cfg.get('processes', 1), intra_threads=cfg.get('intra_threads', 4),
+                                   compute_type=cfg.get('compute_type', 'int8'))
+        if self.hedge is not None:
+            models.log.warning('%s: hedging needs replicas, the model translates in-process', self.model)
+            self.hedge = None
+        if self.shadow is not None:
+            models.log.warning('%s: shadow traffic needs a candidate backend, the model translates in-process',
+                               self.model)
+            self.shadow = None
+
+    @property
+    def server(self):
+        return 'in-process'
+
+    @property
+    def batch_size(self):
+        """
+        This method needs a valid app context, current_app is not available at init time.
+        """
+        if hasattr(self, '_batch_size'):
+            return self._batch_size
+        else:
+            return current_app.config['CTRANSLATE2_BATCH_SIZE']
+
+    def send_sentences_to_backend(self, sentences, src=None, tgt=None, deadline=None):
+        target_prefix = [self.target_prefix.format(source=src, target=tgt)] if self.target_prefix else None
+        results = []
+        for i in range(0, len(sentences), self.batch_size):
+            batch = sentences[i:i + self.batch_size]
+            with span('batch', model=self.model, size=len(batch)), backend_slot(deadline):
+                check(deadline)
+                future = self.pool.submit(batch, self.beam_size, target_prefix)
+                try:
+                    with span('backend_call', server=self.server):
+                        results.extend(future.result(timeout=remaining(deadline, None)))
+                except TimeoutError as e:
+                    # a batch that is already running can't be cancelled, the pool process finishes it and the next
+                    # batches of this worker wait for it; only a batch still queued is dropped
+                    if not future.cancel():
+                        models.log.debug('%s: the pool keeps translating a batch past the request deadline',
+                                         self.model)
+                    raise DeadlineExceeded('The translation did not finish before the request deadline') from e
+                except Exception as e:
+                    self.pool.reset_if_broken(e)
+                    raise
+        return results
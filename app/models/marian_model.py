@@ -1,9 +1,18 @@
+import functools
+import os
+import time
+
 import sentencepiece as spm
 from flask import current_app
-from websocket import create_connection
+from websocket import WebSocketException, WebSocketTimeoutException, create_connection
 
 import app.models as models
-from app.text_utils import split_text_into_sentences
+from app.admission_utils import backend_slot
+from app.deadline_utils import DeadlineExceeded, check, socket_timeout
+from app.resource_utils import resources
+from app.shadow_utils import shadow
+from app.tracing_utils import current_trace_id, span
+from app.warmup_utils import warmup
 
 
 # for Marian, by Dominik:
@@ -12,13 +21,17 @@ class MarianModel(models.Model):
     def __init__(self, cfg):
         super().__init__(cfg)
         self.spm_vocab = cfg['spm_vocab']
-        self.spm_processor = spm.SentencePieceProcessor()
-        self.spm_processor.Load(self.spm_vocab)
+        self.spm_processor = resources.get('spm', os.path.realpath(self.spm_vocab), self._load_spm_processor)
         if 'spm_limit' in cfg:
             self.spm_limit = cfg['spm_limit']
         else:
             self.spm_limit = 100
 
+    def _load_spm_processor(self):
+        spm_processor = spm.SentencePieceProcessor()
+        spm_processor.Load(self.spm_vocab)
+        return spm_processor
+
     @property
     def batch_size(self):
         """
@@ -29,35 +42,106 @@ class MarianModel(models.Model):
         else:
             return current_app.config['MARIAN_BATCH_SIZE']
 
-    def send_sentences_to_backend(self, sentences, src=None, tgt=None):
-        marian_endpoint = "ws://{}/translate".format(self.server)
-        models.log.debug("Connecting to '{}'".format(marian_endpoint))
-        ws = create_connection(marian_endpoint)
+    def _connect(self, server, deadline):
+        marian_endpoint = "ws://{}/translate".format(server)
+        models.log.debug("Connecting to '%s'", marian_endpoint)
+        trace_id = current_trace_id()
+        timeout = socket_timeout(deadline, None)
+        try:
+            with span('connect', server=server):
+                return create_connection(marian_endpoint, timeout=timeout,
+                                         header=['X-Trace-Id: ' + trace_id] if trace_id else None)
+        except (WebSocketTimeoutException, TimeoutError) as e:
+            # the tcp connect times out with socket.timeout (TimeoutError), the handshake with WebSocketTimeoutException
+            raise DeadlineExceeded('Could not connect to the backend before the request deadline') from e
+        except (OSError, WebSocketException):
+            warmup.backend_failed(self.model)
+            raise
 
-        results = []
+    @staticmethod
+    def _translate_batch(ws, server, batch, deadline):
+        # None blocks as long as it takes, like before
+        ws.settimeout(socket_timeout(deadline, None))
+        try:
+            with span('backend_call', server=server):
+                ws.send(batch)
+                return ws.recv().strip().splitlines()
+        except (WebSocketTimeoutException, TimeoutError) as e:
+            raise DeadlineExceeded('The backend did not answer before the request deadline') from e
 
-        batch = ""
-        count = 0
-        for sent in sentences:
-            count += 1
-            batch += sent + "\n"
-            if count == self.batch_size:
+    def _mirror(self, batch, primary_secs, primary_outputs):
+        server = self.shadow_server
+
+        def send(timeout_secs):
+            # not self._connect, a failing candidate must not look like a failing backend of the model
+            ws = create_connection("ws://{}/translate".format(server), timeout=timeout_secs)
+            try:
                 ws.send(batch)
-                results.extend(ws.recv().strip().splitlines())
-                count = 0
-                batch = ""
-        if count:
-            ws.send(batch)
-            results.extend(ws.recv().strip().splitlines())
-        # print(result.rstrip())
-
-        # close connection
-        ws.close()
+                return ws.recv().strip().splitlines()
+            finally:
+                ws.close()
+
+        shadow.mirror(self.model, server, send, batch.splitlines(), primary_secs, primary_outputs)
+
+    def send_sentences_to_backend(self, sentences, src=None, tgt=None, deadline=None):
+        # the connection to self.server; dropped when a hedge won the race, its answer would be read by the next batch
+        connections = [self._connect(self.server, deadline)]
+        replicas = self.hedge_replicas if self.hedge else ()
+        results = []
+
+        def send_attempt(batch, attempt):
+            if attempt.hedge:
+                ws = self._connect(attempt.server, deadline)
+                attempt.on_cancel(ws.abort)
+                try:
+                    return self._translate_batch(ws, attempt.server, batch, deadline)
+                finally:
+                    ws.close()
+            if not connections:
+                connections.append(self._connect(self.server, deadline))
+            ws = connections[0]
+
+            def drop():
+                ws.abort()
+                if ws in connections:
+                    connections.remove(ws)
+
+            attempt.on_cancel(drop)
+            return self._translate_batch(ws, self.server, batch, deadline)
+
+        def send_batch(batch, size):
+            with span('batch', model=self.model, size=size), backend_slot(deadline):
+                check(deadline)
+                start = time.monotonic()
+                if self.hedge is None:
+                    outputs = self._translate_batch(connections[0], self.server, batch, deadline)
+                else:
+                    outputs = self.hedge.call(functools.partial(send_attempt, batch), self.server, replicas)
+                secs = time.monotonic() - start
+                results.extend(outputs)
+            if self.shadow is not None and self.shadow.sampled():
+                self._mirror(batch, secs, outputs)
+
+        try:
+            batch = ""
+            count = 0
+            for sent in sentences:
+                count += 1
+                batch += sent + "\n"
+                if count == self.batch_size:
+                    send_batch(batch, count)
+                    count = 0
+                    batch = ""
+            if count:
+                send_batch(batch, count)
+        finally:
+            # close connection
+            for ws in connections:
+                ws.close()
         return results
 
-    def split_to_sent_array(self, text, lang):
+    def split_long_sentence(self, sent):
         spm_limit = self.spm_limit
-        spm_processor = self.spm_processor
         _ = "▁"  # words in sentencepieces start with this weird unicode underscore
 
         def decode(x):
@@ -74,13 +158,11 @@ class MarianModel(models.Model):
             return s[:n + 1]
 
         sent_array = []
-        for sent in split_text_into_sentences(text=text, language=lang):
-            sp_sent = spm_processor.EncodeAsPieces(sent)
-            # splitting to chunks of 100 (default) subwords, at most
-            while len(sp_sent) > spm_limit:
-                part = limit_sp(spm_limit, sp_sent)
-                sent_array.append(decode(part))
-                sp_sent = sp_sent[len(part):]
-            sent_array.append(decode(sp_sent))
-        # print(len(sent_array), [len(x) for x in sent_array], [len(spm_processor.EncodeAsPieces(x)) for x in sent_array])
-        return sent_array
\ No newline at end of file
+        sp_sent = self.spm_processor.EncodeAsPieces(sent)
+        # splitting to chunks of 100 (default) subwords, at most
+        while len(sp_sent) > spm_limit:
+            part = limit_sp(spm_limit, sp_sent)
+            sent_array.append(decode(part))
+            sp_sent = sp_sent[len(part):]
+        sent_array.append(decode(sp_sent))
+        return sent_array
@@ -1,3 +1,4 @@
+import copy
 import os
 import logging
 from flask import current_app
@@ -5,10 +6,18 @@ from iso639 import to_name
 from tensor2tensor.utils import usr_dir, hparam
 
 from app.dict_utils import get_or_create
+from app.hedge_utils import HedgePolicy
+from app.logging_utils import SampledLogger
+from app.shadow_utils import ShadowTarget
+from app.text_utils import split_lines, split_many, split_text_into_sentences
+from app.text_utils.masking import KINDS, Masker, number_per_block, unmask
+from app.tracing_utils import span
 import app.models as models
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
+# for the messages logged per backend batch or doc model block, see LOG_BATCH_SAMPLE_EVERY
+batch_log = SampledLogger(log)
 usr_dir.import_usr_dir('t2t_usr_dir')
 hparams = hparam.HParams(data_dir=os.path.expanduser('t2t_data_dir'))
 
@@ -24,6 +33,8 @@ class Model(object):
                 return models.T2TDocModel(cfg)
             elif cfg['model_framework'] == 'tensorflow_with_scores':
                 return models.T2TModelWithScores(cfg)
+            elif cfg['model_framework'] == 'ctranslate2':
+                return models.CTranslate2Model(cfg)
         return models.T2TModel(cfg)
 
     @staticmethod
@@ -56,6 +67,18 @@ class Model(object):
         self.domain = cfg.get('domain', None)
         self.default = cfg.get('default', False)
         self.prefix_with = cfg.get('prefix_with', None)
+        # true or a list of the kinds of spans (see app.text_utils.masking) replaced by placeholders
+        mask = cfg.get('mask', False)
+        self.masker = Masker(KINDS if mask is True else mask) if mask else None
+        # {"replicas": [servers], "percentile": 95, "budget": 0.05}: a batch slower than the percentile of the recent
+        # ones is sent again to a replica, see app.hedge_utils
+        hedge = dict(cfg.get('hedge') or {})
+        self._hedge_replicas = hedge.pop('replicas', [])
+        self.hedge = HedgePolicy(**hedge) if self._hedge_replicas else None
+        # {"server": ..., "sample": 0.05}: a copy of a sample of the batches goes to a candidate backend, see
+        # app.shadow_utils
+        shadow = cfg.get('shadow')
+        self.shadow = ShadowTarget(**shadow) if shadow else None
 
         src = Model.lang_list_display(cfg['source'])
         tgt = Model.lang_list_display(cfg['target'])
@@ -79,6 +102,22 @@ class Model(object):
         else:
             return current_app.config['DEFAULT_SERVER']
 
+    @property
+    def hedge_replicas(self):
+        """
+        This method needs a valid app context, current_app is not available at init time.
+        :return: host:port of each replica the hedged batches go to
+        """
+        return [replica.format(**current_app.config) for replica in self._hedge_replicas]
+
+    @property
+    def shadow_server(self):
+        """
+        This method needs a valid app context, current_app is not available at init time.
+        :return: host:port of the candidate backend
+        """
+        return self.shadow.server.format(**current_app.config)
+
     @property
     def sent_chars_limit(self):
         """
@@ -99,9 +138,6 @@ class Model(object):
         else:
             return current_app.config['BATCH_SIZE']
 
-    def add_href(self, url):
-        self.href = url
-
     def __iter__(self):
         yield 'model', self.model
         yield 'name', self.name
@@ -111,16 +147,132 @@ class Model(object):
             yield 'default', self.default
         if self.domain:
             yield 'domain', self.domain
-        if self.href:
-            yield 'href', self.href
 
-    def translate(self, text, src=None, tgt=None):
+    def translate(self, text, src=None, tgt=None, deadline=None):
+        """
+        :param deadline: app.deadline_utils.Deadline, None for no limit
+        """
+        src = src or list(self.supports.keys())[0]
+        tgt = tgt or self.supports[src][0]
+
+        with span('preprocess', model=self.model, lines=len(split_lines(text))):
+            blocks_of_text, formatting, masked_spans = self.extract_masked_blocks(text, src)
+        with span('backend', model=self.model, blocks=len(blocks_of_text)):
+            outputs = self.send_blocks_to_backend(blocks_of_text, src, tgt, deadline=deadline)
+            outputs = self.unmask_outputs(outputs, blocks_of_text, masked_spans, src, tgt, deadline=deadline)
+        with span('postprocess', model=self.model):
+            return self.reconstruct_formatting(outputs, formatting)
+
+    def translate_revision(self, text, src=None, tgt=None, previous=None, deadline=None):
+        """
+        Translates a new revision of an edited text, only its blocks that are not in the previous revision's
+        alignment are sent to the backend
+        :param previous: {block key: backend output} returned for the previous revision, None for the first one
+        :return: the translation and the alignment of this revision
+        """
+        src = src or list(self.supports.keys())[0]
+        tgt = tgt or self.supports[src][0]
+
+        with span('preprocess', model=self.model, lines=len(split_lines(text))):
+            blocks_of_text, formatting, masked_spans = self.extract_masked_blocks(text, src)
+        with span('backend', model=self.model, incremental=previous is not None):
+            outputs, alignment = self.send_changed_blocks_to_backend(blocks_of_text, src, tgt, previous or {},
+                                                                     deadline=deadline)
+            outputs = self.unmask_outputs(outputs, blocks_of_text, masked_spans, src, tgt, deadline=deadline,
+                                          previous=previous, alignment=alignment)
+        with span('postprocess', model=self.model):
+            return self.reconstruct_formatting(outputs, formatting), alignment
+
+    def send_changed_blocks_to_backend(self, blocks, src, tgt, previous, deadline=None):
+        """
+        Sends the blocks (sentences) not found in previous to the backend
+        :return: an output per block and the {block: output} alignment of all the blocks
+        """
+        alignment = {block: previous[block] for block in blocks if block in previous}
+        changed = [block for block in dict.fromkeys(blocks) if block not in alignment]
+        if changed:
+            alignment.update(zip(changed, self.send_blocks_to_backend(changed, src, tgt, deadline=deadline)))
+        # reconstruct_formatting modifies the outputs, the alignment keeps the backend's
+        return [copy.copy(alignment[block]) for block in blocks], alignment
+
+    def translate_many(self, texts, src=None, tgt=None, deadline=None):
+        """
+        Translates several texts at once, the sentences of all of them go to the backend in shared batches
+        :return: a translation per text
+        """
         src = src or list(self.supports.keys())[0]
         tgt = tgt or self.supports[src][0]
 
-        blocks_of_text, formatting = self.extract_blocks_of_text(text, src)
-        outputs = self.send_blocks_to_backend(blocks_of_text, src, tgt)
-        return self.reconstruct_formatting(outputs, formatting)
+        blocks_of_text = []
+        masked_spans = [] if self.masker else None
+        ranges = []
+        with span('preprocess', model=self.model, texts=len(texts)):
+            for text in texts:
+                text_blocks, formatting, text_masked_spans = self.extract_masked_blocks(text, src)
+                ranges.append((len(blocks_of_text), len(blocks_of_text) + len(text_blocks), formatting))
+                blocks_of_text += text_blocks
+                if masked_spans is not None:
+                    masked_spans += text_masked_spans or [[]] * len(text_blocks)
+        with span('backend', model=self.model, blocks=len(blocks_of_text)):
+            outputs = self.send_blocks_to_backend(blocks_of_text, src, tgt, deadline=deadline)
+            outputs = self.unmask_outputs(outputs, blocks_of_text, masked_spans, src, tgt, deadline=deadline)
+        with span('postprocess', model=self.model):
+            return [self.reconstruct_formatting(outputs[start:end], formatting) for start, end, formatting in ranges]
+
+    def extract_masked_blocks(self, text, text_lang):
+        """
+        extract_blocks_of_text of the text with the spans the model masks (cfg mask) replaced by placeholders; the
+        whole document is scanned at once, the placeholders are then numbered from [1] in each sentence
+        :return: blocks, formatting and the masked spans of each block (None when nothing was masked)
+        """
+        if self.masker is None:
+            return self.extract_blocks_of_text(text, text_lang) + (None,)
+        masked_lines, spans = self.masker.mask(split_lines(text))
+        blocks, formatting = self.extract_blocks_of_text(masked_lines, text_lang)
+        if not spans:
+            return blocks, formatting, None
+        blocks, masked_spans = number_per_block(blocks, spans)
+        return blocks, formatting, masked_spans
+
+    def unmask_outputs(self, outputs, blocks, masked_spans, src, tgt, deadline=None, previous=None, alignment=None):
+        """
+        Puts the masked spans back into the outputs. The sentences whose placeholders did not make it through the
+        backend are translated again unmasked.
+        :param previous: the alignment of the previous revision (see translate_revision), the unmasked sentences
+            translated again there are reused
+        :param alignment: the alignment of this revision, the unmasked sentences translated again are added to it
+        """
+        if not masked_spans:
+            return outputs
+        previous = previous or {}
+        lost = []
+        for i, (output, originals) in enumerate(zip(outputs, masked_spans)):
+            if originals:
+                if previous and unmask(blocks[i], originals) in previous:
+                    # the placeholders were already lost in the previous revision
+                    lost.append(i)
+                    continue
+                text = unmask(output['output_text'] if isinstance(output, dict) else output, originals)
+                if text is None:
+                    lost.append(i)
+                elif isinstance(output, dict):
+                    output['output_text'] = text
+                else:
+                    outputs[i] = text
+        if lost:
+            log.warning('%s: placeholders lost in %d of %d sentences, translating them unmasked', self.model,
+                        len(lost), len(blocks))
+            unmasked = [unmask(blocks[i], masked_spans[i]) for i in lost]
+            if alignment is None:
+                fallbacks = self.send_blocks_to_backend(unmasked, src, tgt, deadline=deadline)
+            else:
+                # keyed by the unmasked sentence, a masked block is never one
+                fallbacks, fallback_alignment = self.send_changed_blocks_to_backend(unmasked, src, tgt, previous,
+                                                                                    deadline=deadline)
+                alignment.update(fallback_alignment)
+            for i, output in zip(lost, fallbacks):
+                outputs[i] = output
+        return outputs
 
     def extract_blocks_of_text(self, text, text_lang):
         """
@@ -132,31 +284,42 @@ class Model(object):
         log.debug("Model::extract_blocks_of_text")
         return self.extract_sentences(text, text_lang)
 
-    def send_blocks_to_backend(self, blocks, src, tgt):
+    def send_blocks_to_backend(self, blocks, src, tgt, deadline=None):
         """
         By default calls send_sentences_to_backend
         :param blocks:
         :param src:
         :param tgt:
+        :param deadline: the remaining batches are skipped once it passes
         :return:
         """
         log.debug("Model::send_blocks_to_backend")
-        return self.send_sentences_to_backend(blocks, src, tgt)
+        return self.send_sentences_to_backend(blocks, src, tgt, deadline=deadline)
 
-    def send_sentences_to_backend(self, sentences, src, tgt):
+    def send_sentences_to_backend(self, sentences, src, tgt, deadline=None):
         raise NotImplementedError("Abstract method")
 
     def extract_sentences(self, text, text_lang):
         sentences = []
         newlines_after = []
-        for segment in text.split('\n'):
-            if segment:
-                sentences += self.split_to_sent_array(segment, lang=text_lang,
-                                                      )
+        # the whole document is split at once, one list of sentences per line
+        for line_sentences in split_many(split_lines(text), text_lang):
+            for sent in line_sentences:
+                sentences += self.split_long_sentence(sent)
             newlines_after.append(len(sentences) - 1)
         return sentences, newlines_after
 
     def split_to_sent_array(self, segment, lang):
+        sent_array = []
+        for sent in split_text_into_sentences(text=segment, language=lang):
+            sent_array += self.split_long_sentence(sent)
+        return sent_array
+
+    def split_long_sentence(self, sent):
+        """
+        Cuts a sentence that is too long for the backend into parts
+        :return: a list of the parts
+        """
         raise NotImplementedError("Abstract method")
 
     def reconstruct_formatting(self, outputs, newlines_after):
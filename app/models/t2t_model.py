@@ -1,48 +1,139 @@
+import os
+import time
+from functools import lru_cache
 from math import ceil
-from pprint import pformat
 
+import grpc
 import numpy as np
+import tensorflow as tf
 from flask import current_app, session
 from tensor2tensor.serving import serving_utils
 from tensor2tensor.utils import registry
+from tensorflow_serving.apis import predict_pb2, prediction_service_pb2_grpc
 
 import app.models as models
-from app.text_utils import split_text_into_sentences
+from app.admission_utils import backend_slot
+from app.deadline_utils import DeadlineExceeded, check, remaining
+from app.logging_utils import Payload
+from app.resource_utils import resources
+from app.shadow_utils import shadow
+from app.text_utils import split_on_budget
+from app.tracing_utils import current_trace_id, span
+from app.warmup_utils import warmup
+
+# timeout of a batch of a request without a deadline
+GRPC_TIMEOUT_SECS = 500
+# words whose subword count each model remembers
+SUBWORD_CACHE_SIZE = 100000
+
+
+def make_grpc_request_fn(servable_name, server, hedge=None, replicas=()):
+    """
+    Same as serving_utils.make_grpc_request_fn, but the timeout is given to every call, so that each batch gets only
+    the time left before the request deadline
+    :param hedge: app.hedge_utils.HedgePolicy, a slow batch is sent again to one of the replicas
+    :return: fn(examples, timeout_secs)
+    """
+    stubs = {}
+
+    def get_stub(target):
+        if target not in stubs:
+            stubs[target] = prediction_service_pb2_grpc.PredictionServiceStub(grpc.insecure_channel(target))
+        return stubs[target]
+
+    def _make_grpc_request(examples, timeout_secs):
+        request = predict_pb2.PredictRequest()
+        request.model_spec.name = servable_name
+        request.inputs["input"].CopyFrom(
+            tf.make_tensor_proto([ex.SerializeToString() for ex in examples], shape=[len(examples)]))
+        trace_id = current_trace_id()
+        metadata = [('x-trace-id', trace_id)] if trace_id else None
+        if hedge is None:
+            response = get_stub(server).Predict(request, timeout_secs, metadata=metadata)
+        else:
+            def send(attempt):
+                future = get_stub(attempt.server).Predict.future(request, timeout_secs, metadata=metadata)
+                attempt.on_cancel(future.cancel)
+                return future.result()
+
+            response = hedge.call(send, server, replicas)
+        outputs = tf.make_ndarray(response.outputs["outputs"])
+        scores = tf.make_ndarray(response.outputs["scores"])
+        assert len(outputs) == len(scores)
+        return [{"outputs": output, "scores": score} for output, score in zip(outputs, scores)]
+
+    return _make_grpc_request
+
+
+def load_problem(name):
+    problem = registry.problem(name)
+    # loads the encoders (vocabulary) from the data dir
+    problem.get_hparams(models.hparams)
+    return problem
 
 
 class T2TModel(models.Model):
     def __init__(self, cfg):
         super().__init__(cfg)
-        self.problem = registry.problem(cfg['problem'])
-        self.problem.get_hparams(models.hparams)
-
-    def send_sentences_to_backend(self, sentences, src, tgt):
+        # the reverse direction model usually has the same problem (and vocabulary)
+        self.problem = resources.get('t2t_problem', cfg['problem'], lambda: load_problem(cfg['problem']))
+        # cut long sentences by subwords of the problem's vocabulary instead of sent_chars_limit
+        self.subword_limit = cfg.get('subword_limit')
+        if self.subword_limit:
+            encoder = self.problem.feature_info['inputs'].encoder
+            self.count_subwords = lru_cache(maxsize=SUBWORD_CACHE_SIZE)(lambda word: len(encoder.encode(word)))
+        # {candidate server: request fn} of the mirrored batches, the grpc channels are reused; a forked worker
+        # starts over
+        self._shadow_request_fns = {}
+        self._shadow_request_fns_pid = None
+
+    def send_sentences_to_backend(self, sentences, src, tgt, deadline=None):
         if self.prefix_with:
             prefix = self.prefix_with.format(source=src, target=tgt)
             sentences = [prefix + sent for sent in sentences]
 
-        return self._do_send_request(sentences)
+        return self._do_send_request(sentences, deadline=deadline)
 
-    def _do_send_request(self, text_arr, with_scores=False):
+    def _do_send_request(self, text_arr, with_scores=False, deadline=None):
         """
         Divide the arr into batches and send the batches to the backend to be processed
         :param text_arr: individual elements of arr will be grouped into batches
+        :param deadline: every batch gets the time left; no batch is sent after it passed
         :return:
         """
         outputs_with_scores = []
-        request_fn = serving_utils.make_grpc_request_fn(servable_name=self.model, timeout_secs=500,
-                                                        server=self.server)
+        request_fn = make_grpc_request_fn(servable_name=self.model, server=self.server, hedge=self.hedge,
+                                          replicas=self.hedge_replicas if self.hedge else ())
 
         for batch in np.array_split(text_arr,
                                     ceil(len(text_arr) / self.batch_size)):
             try:
-                models.log.debug(f"===== sending batch\n{pformat(batch)}\n")
-                outputs_with_scores += serving_utils.predict(batch.tolist(), self.problem, request_fn)
+                models.batch_log.debug("===== sending batch %s", Payload(batch))
+                with span('batch', model=self.model, size=len(batch)), backend_slot(deadline):
+                    check(deadline)
+                    timeout_secs = remaining(deadline, GRPC_TIMEOUT_SECS)
+                    with span('backend_call', server=self.server):
+                        start = time.monotonic()
+                        batch_outputs = serving_utils.predict(
+                            batch.tolist(), self.problem, lambda examples: request_fn(examples, timeout_secs))
+                        secs = time.monotonic() - start
+                        outputs_with_scores += batch_outputs
+            except DeadlineExceeded:
+                raise
+            except grpc.RpcError as e:
+                if deadline is not None and e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    raise DeadlineExceeded('The backend did not answer before the request deadline') from e
+                warmup.backend_failed(self.model)
+                session.clear()
+                raise
             except:
                 # When tensorflow serving restarts web clients seem to "remember" the channel where
                 # the connection have failed. clearing up the session, seems to solve that
+                warmup.backend_failed(self.model)
                 session.clear()
                 raise
+            if self.shadow is not None and self.shadow.sampled():
+                self._mirror(batch.tolist(), secs, [output for output, _ in batch_outputs])
 
         if not with_scores:
             return list(map(lambda sent_score: sent_score[0], outputs_with_scores))
@@ -51,26 +142,43 @@ class T2TModel(models.Model):
             # np.float32 ... `Object of type float32 is not JSON serializable` .item() turns it into python scalar 
             return list(map(lambda tup: {'output_text': tup[0], 'output_score': tup[1].item()}, outputs_with_scores))
 
-    def split_to_sent_array(self, text, lang):
+    def _mirror(self, batch, primary_secs, primary_outputs):
+        server = self.shadow_server
+        if self._shadow_request_fns_pid != os.getpid():
+            self._shadow_request_fns = {}
+            self._shadow_request_fns_pid = os.getpid()
+        request_fn = self._shadow_request_fns.get(server)
+        if request_fn is None:
+            request_fn = make_grpc_request_fn(servable_name=self.shadow.model or self.model, server=server)
+            self._shadow_request_fns[server] = request_fn
+
+        def send(timeout_secs):
+            return [output for output, _ in serving_utils.predict(
+                batch, self.problem, lambda examples: request_fn(examples, timeout_secs))]
+
+        shadow.mirror(self.model, server, send, batch, primary_secs, primary_outputs)
+
+    def split_long_sentence(self, sent):
+        if self.subword_limit:
+            # the problem appends EOS to every input
+            return split_on_budget(sent, self.subword_limit - 1, self.count_subwords)
         charlimit = self.sent_chars_limit
         sent_array = []
-        for sent in split_text_into_sentences(text=text, language=lang):
-            while len(sent) > charlimit:
-                try:
-                    # When sent starts with a space, then sent[0:0] was an empty string,
-                    # and it caused an infinite loop. This fixes it.
-                    beg = 0
-                    while sent[beg] == ' ':
-                        beg += 1
-                    last_space_idx = sent.rindex(" ", beg, charlimit)
-                    sent_array.append(sent[0:last_space_idx])
-                    sent = sent[last_space_idx:]
-                except ValueError:
-                    # raised if no space found by rindex
-                    sent_array.append(sent[0:charlimit])
-                    sent = sent[charlimit:]
-            sent_array.append(sent)
-        # print(len(sent_array), [len(x) for x in sent_array])
+        while len(sent) > charlimit:
+            try:
+                # When sent starts with a space, then sent[0:0] was an empty string,
+                # and it caused an infinite loop. This fixes it.
+                beg = 0
+                while sent[beg] == ' ':
+                    beg += 1
+                last_space_idx = sent.rindex(" ", beg, charlimit)
+                sent_array.append(sent[0:last_space_idx])
+                sent = sent[last_space_idx:]
+            except ValueError:
+                # raised if no space found by rindex
+                sent_array.append(sent[0:charlimit])
+                sent = sent[charlimit:]
+        sent_array.append(sent)
         return sent_array
 
 
@@ -82,6 +190,14 @@ class T2TDocModel(T2TModel):
         self.PRE_CHARS = 400
         self.PRE_TOO_SHORT = self.PRE_CHARS/2
         self.CUT_PRE = True
+        if self.masker is not None:
+            # the blocks are context windows of several sentences, see _create_clever_context
+            models.log.warning('%s: masking is not supported by the document level model', self.model)
+            self.masker = None
+
+    def translate_many(self, texts, src=None, tgt=None, deadline=None):
+        # the blocks carry the context of their document, they can't be mixed
+        return [self.translate(text, src, tgt, deadline=deadline) for text in texts]
 
     @staticmethod
     def has_next_sent(index, array):
@@ -101,14 +217,31 @@ class T2TDocModel(T2TModel):
         clever_context = self._create_clever_context(sentences)
         return {"clever_context": clever_context, "sentences": sentences}, formatting
 
-    def send_blocks_to_backend(self, clever_context_with_sentences, src, tgt):
+    def send_blocks_to_backend(self, clever_context_with_sentences, src, tgt, deadline=None):
         models.log.debug("T2TDocLevel::send_blocks_to_backend")
         sequences = clever_context_with_sentences["clever_context"]
         sentences = clever_context_with_sentences["sentences"]
-        outputs = self._do_send_request([x["sequence"] for x in sequences])
-        outputs = self._postproc_context(outputs, [x["pattern"] for x in sequences], sentences)
+        outputs = self._do_send_request([x["sequence"] for x in sequences], deadline=deadline)
+        outputs = self._postproc_context(outputs, [x["pattern"] for x in sequences], sentences, deadline=deadline)
         return outputs
 
+    def send_changed_blocks_to_backend(self, clever_context_with_sentences, src, tgt, previous, deadline=None):
+        """
+        Sends only the context windows whose text or sentence pattern changed, i.e. the ones an edited sentence
+        touches
+        """
+        sequences = clever_context_with_sentences["clever_context"]
+        sentences = clever_context_with_sentences["sentences"]
+        keys = ['{}\x00{}'.format(x["sequence"], ''.join('1' if b else '0' for b in x["pattern"]))
+                for x in sequences]
+        alignment = {key: previous[key] for key in keys if key in previous}
+        changed = {key: x["sequence"] for key, x in zip(keys, sequences) if key not in alignment}
+        if changed:
+            alignment.update(zip(changed, self._do_send_request(list(changed.values()), deadline=deadline)))
+        outputs = self._postproc_context([alignment[key] for key in keys], [x["pattern"] for x in sequences],
+                                         sentences, deadline=deadline)
+        return outputs, alignment
+
     def _create_clever_context(self, sentences):
         """
         group sentences into seqeunces of sentences
@@ -169,7 +302,7 @@ class T2TDocModel(T2TModel):
                 pre_context_start -= 1
                 too_long_pre_sent = sentences[pre_context_start]
                 cut_sent = too_long_pre_sent[-(self.PRE_CHARS - pre_context_len):]
-                models.log.debug(f"====CUT_PRE===={pre_context_len}:{too_long_pre_sent}->{cut_sent}")
+                models.log.debug("====CUT_PRE====%s:%s->%s", pre_context_len, too_long_pre_sent, cut_sent)
                 after_first_space = cut_sent.index(" ") + 1
                 cut_sent = cut_sent[after_first_space:]
                 if cut_sent:
@@ -198,23 +331,25 @@ class T2TDocModel(T2TModel):
 
         return sequences
 
-    def _postproc_context(self, translated_blocks, patterns, original_untranslated_sentences):
+    def _postproc_context(self, translated_blocks, patterns, original_untranslated_sentences, deadline=None):
         assert len(translated_blocks) == len(patterns)
         i = 0
         outputs = []
         for block in translated_blocks:
-            models.log.debug(f"===== postprocessing block\n{block}\n")
+            models.batch_log.debug("===== postprocessing block %s", Payload(block))
             sents = block.split(' ¬ ')
             pattern = patterns[i]
             i += 1
             expected = len(pattern)
             found = len(sents)
             if found != expected:
-                models.log.warn(f"expected={expected} ({pattern}), but got {found}:\n{block}\n")
+                models.log.warning("expected=%s (%s), but got %s: %s", expected, pattern, found, Payload(block))
                 current_sent_i = len(outputs)
                 translate_again = original_untranslated_sentences[current_sent_i:current_sent_i+sum(pattern)]
-                models.log.warn(f"===TRANSLATING_AGAIN==={current_sent_i}:{sum(pattern)}={translate_again}")
-                outputs += self._do_send_request(translate_again)
+                models.log.warning("===TRANSLATING_AGAIN===%s:%s=%s", current_sent_i, sum(pattern),
+                                   Payload(translate_again))
+                with span('retry', model=self.model, expected=expected, found=found):
+                    outputs += self._do_send_request(translate_again, deadline=deadline)
             else:
                 for b, sent in zip(pattern, sents):
                     if b:
@@ -223,8 +358,8 @@ class T2TDocModel(T2TModel):
 
 
 class T2TModelWithScores(T2TModel):
-    def send_sentences_to_backend(self, sentences, src, tgt):
-        return self._do_send_request(sentences, with_scores=True)
+    def send_sentences_to_backend(self, sentences, src, tgt, deadline=None):
+        return self._do_send_request(sentences, with_scores=True, deadline=deadline)
 
     def reconstruct_formatting(self, outputs, newlines_after):
         """
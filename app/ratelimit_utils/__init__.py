@@ -0,0 +1,170 @@
+import hashlib
+import math
+import time
+
+from app.sqlite_utils import SharedDatabase, tmpfs_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    requests INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def default_database_path():
+    """
+    A sqlite file on tmpfs when available; the buckets need not survive a reboot
+    """
+    return tmpfs_path('lindat-ratelimit.db')
+
+
+class RateLimited(Exception):
+
+    def __init__(self, quota):
+        super().__init__('Quota exceeded for {}, try again in {} s'.format(quota.key, quota.retry_after))
+        self.quota = quota
+
+
+class Quota(object):
+    """
+    The state of a client's bucket after a request
+    """
+
+    def __init__(self, key, allowed, tokens, cost, capacity, rate):
+        self.key = key
+        self.allowed = allowed
+        self.remaining = int(tokens)
+        self.capacity = capacity
+        # seconds until the bucket is full again and until it holds enough for this request
+        self.reset = int(math.ceil((capacity - tokens) / rate))
+        self.retry_after = max(1, int(math.ceil((cost - tokens) / rate))) if not allowed else 0
+
+    @property
+    def headers(self):
+        headers = {
+            'X-RateLimit-Limit': self.capacity,
+            'X-RateLimit-Remaining': self.remaining,
+            'X-RateLimit-Reset': self.reset,
+        }
+        if not self.allowed:
+            headers['Retry-After'] = self.retry_after
+        return headers
+
+
+class TokenBucketLimiter(object):
+    """
+    Token buckets per client key in a sqlite database shared by all the workers on the host. A bucket holds at most
+    `capacity` tokens (characters or words) and refills at `rate` tokens per second; a request takes as many tokens
+    as it costs or is rejected. Every thread keeps its own connection; one check is a single short write transaction.
+    """
+
+    def __init__(self, database=None, capacity=1000000, rate=2000, overrides=None, idle_secs=86400):
+        self.configure(database, capacity, rate, overrides, idle_secs)
+
+    def configure(self, database=None, capacity=1000000, rate=2000, overrides=None, idle_secs=86400):
+        """
+        :param overrides: {key: {'capacity': ..., 'rate': ...}} for clients with their own limits
+        :param idle_secs: the buckets of clients idle for this long are dropped; a dropped bucket starts full, so
+            keep it above capacity / rate
+        """
+        self.database = database or default_database_path()
+        self.capacity = capacity
+        self.rate = rate
+        self.overrides = overrides or {}
+        self.idle_secs = idle_secs
+        self._last_prune = 0
+        self._db = SharedDatabase(self.database, SCHEMA)
+
+    def limits(self, key):
+        override = self.overrides.get(key, {})
+        return override.get('capacity', self.capacity), override.get('rate', self.rate)
+
+    def consume(self, key, cost):
+        """
+        Takes `cost` tokens from the bucket of `key` if it has enough
+        :return: Quota
+        """
+        capacity, rate = self.limits(key)
+        # a request bigger than the whole bucket gets through on a full bucket
+        cost = min(cost, capacity)
+        now = time.time()
+        conn = self._db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute('INSERT INTO buckets (key, tokens, updated, used, requests, rejected) VALUES (?,?,?,?,1,?) '
+                         'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, '
+                         'used = used + excluded.used, requests = requests + 1, '
+                         'rejected = rejected + excluded.rejected',
+                         (key, tokens, now, cost if allowed else 0, 0 if allowed else 1))
+            # a worker prunes at most once per minute
+            if now - self._last_prune > 60:
+                self._last_prune = now
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle_secs,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return Quota(key, allowed, tokens, cost, capacity, rate)
+
+    def usage(self, limit=100):
+        """
+        :return: the buckets of the clients that used the most tokens, refilled to now
+        """
+        now = time.time()
+        rows = self._db.connect().execute('SELECT key, tokens, updated, used, requests, rejected FROM buckets '
+                                          'ORDER BY used DESC LIMIT ?', (limit,)).fetchall()
+        usage = []
+        for key, tokens, updated, used, requests, rejected in rows:
+            capacity, rate = self.limits(key)
+            usage.append({
+                'key': key,
+                'remaining': int(min(capacity, tokens + max(0.0, now - updated) * rate)),
+                'capacity': capacity,
+                'rate': rate,
+                'used': used,
+                'requests': requests,
+                'rejected': rejected,
+            })
+        return usage
+
+
+limiter = TokenBucketLimiter()
+
+
+# the value of the request args that were not sent, see MyAbstractResource.get_additional_args_from_request
+UNKNOWN = 'unknown'
+
+
+def client_key(args, key_fields):
+    """
+    :param args: see MyAbstractResource.get_additional_args_from_request
+    :param key_fields: which of author, frontend, ip_address identify a client
+    :return: the key of the fields that were sent, None when none was; the clients that didn't send a field must not
+        share one bucket
+    """
+    known = [field for field in key_fields if args[field] and args[field] != UNKNOWN]
+    if not known:
+        return None
+    return '|'.join('{}={}'.format(field, args[field]) for field in known)
+
+
+def redact_key(key):
+    """
+    :return: the client key with the ip address replaced by a hash of it, e.g. ip_address=#3f1c9a2b
+    """
+    def redact(field):
+        name, _, value = field.partition('=')
+        if name != 'ip_address':
+            return field
+        return '{}=#{}'.format(name, hashlib.sha256(value.encode('utf-8')).hexdigest()[:8])
+    return '|'.join(map(redact, key.split('|')))
@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class SharedResources(object):
+    """
+    Loads every vocabulary (sentencepiece model, t2t problem with its encoders) once per process, no matter how many
+    models use it. Loaded at import time, i.e. in the gunicorn master with preload_app, the resources are shared
+    copy-on-write by all the workers; see gunicorn.conf.py for keeping those pages clean.
+    """
+
+    def __init__(self):
+        self._resources = {}
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, key, load):
+        """
+        :param kind: e.g. 'spm' or 't2t_problem'
+        :param key: identifies the resource within the kind, e.g. the real path of the file
+        :param load: called without arguments when the resource is not loaded yet
+        """
+        with self._lock:
+            if (kind, key) not in self._resources:
+                log.info('Loading %s %s', kind, key)
+                self._resources[(kind, key)] = load()
+                self._users[(kind, key)] = 0
+            self._users[(kind, key)] += 1
+            return self._resources[(kind, key)]
+
+    def stats(self):
+        """
+        :return: the loaded resources and the number of models sharing each
+        """
+        with self._lock:
+            return [{'kind': kind, 'key': key, 'users': users} for (kind, key), users in sorted(self._users.items())]
+
+
+resources = SharedResources()
+
+
+def _read_memory_file(path):
+    """
+    Sums the kB fields of a /proc smaps(_rollup) file
+    """
+    totals = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                totals[parts[0].rstrip(':')] = totals.get(parts[0].rstrip(':'), 0) + int(parts[1])
+    return totals
+
+
+def memory_usage(pid='self'):
+    """
+    Memory of a process in bytes: rss, pss (shared pages divided among the processes sharing them) and uss (the
+    private pages, what the process would free on exit)
+    :return: dict or None when /proc is not available
+    """
+    for name in ('smaps_rollup', 'smaps'):
+        path = os.path.join('/proc', str(pid), name)
+        if os.path.exists(path):
+            totals = _read_memory_file(path)
+            return {
+                'rss': totals.get('Rss', 0) * 1024,
+                'pss': totals.get('Pss', 0) * 1024,
+                'uss': (totals.get('Private_Clean', 0) + totals.get('Private_Dirty', 0)) * 1024,
+                'swap': totals.get('Swap', 0) * 1024,
+            }
+    return None
+
+
+_baseline = {}
+
+
+def record_baseline():
+    """
+    Remembers the memory usage of a freshly forked worker, see post_fork in gunicorn.conf.py
+    """
+    _baseline.clear()
+    _baseline.update(memory_usage() or {})
+
+
+def memory_report():
+    return {
+        'pid': os.getpid(),
+        'at_fork': dict(_baseline) or None,
+        'now': memory_usage(),
+        'resources': resources.stats(),
+    }
@@ -0,0 +1,82 @@
+import json
+import time
+import uuid
+
+from app.sqlite_utils import SharedDatabase, tmpfs_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS revisions (
+    token TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    created REAL NOT NULL,
+    alignments TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS revisions_created ON revisions (created);
+"""
+
+# the X-Document-Revision value of a client's first request
+NEW_REVISION = 'new'
+
+
+def default_database_path():
+    """
+    A sqlite file on tmpfs when available; a lost revision only means translating the whole document again
+    """
+    return tmpfs_path('lindat-revisions.db')
+
+
+class RevisionStore(object):
+    """
+    The sentence -> translation alignments of the last translated revision of the documents being edited, so that
+    the next revision sends only the new and changed sentences to the backend. Shared by all the workers on the host,
+    bounded to `max_entries` revisions, each kept for `ttl` seconds.
+    """
+
+    def __init__(self, database=None, ttl=3600, max_entries=10000):
+        self.configure(database, ttl, max_entries)
+
+    def configure(self, database=None, ttl=3600, max_entries=10000):
+        self.database = database or default_database_path()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db = SharedDatabase(self.database, SCHEMA)
+
+    def load(self, token, scope):
+        """
+        :param scope: what was translated (route, src, tgt); a revision of another scope is not used
+        :return: the alignments saved under token or None when unknown, expired or of another scope
+        """
+        if not token or token == NEW_REVISION:
+            return None
+        row = self._db.connect().execute(
+            'SELECT alignments FROM revisions WHERE token = ? AND scope = ? AND created > ?',
+            (token, scope, time.time() - self.ttl)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, scope, alignments):
+        """
+        :param alignments: json serializable, e.g. a {block: output} dict per hop
+        :return: the token of the new revision
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        conn = self._db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO revisions (token, scope, created, alignments) VALUES (?,?,?,?)',
+                         (token, scope, now, json.dumps(alignments, ensure_ascii=False)))
+            conn.execute('DELETE FROM revisions WHERE created <= ?', (now - self.ttl,))
+            conn.execute('DELETE FROM revisions WHERE token IN '
+                         '(SELECT token FROM revisions ORDER BY created DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return token
+
+
+revisions = RevisionStore()
+
+
+def make_scope(route, src, tgt):
+    return '{}|{}|{}'.format(route, src, tgt)
@@ -4,9 +4,95 @@ BOOTSTRAP_SERVE_LOCAL = True
 ERROR_404_HELP = False
 RESTX_MASK_SWAGGER = False
 MAX_CONTENT_LENGTH = 100 * 1024
+# uploaded files are decoded and normalized in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 64 * 1024
 BATCH_SIZE = 20 #1000
 MARIAN_BATCH_SIZE = 16
+CTRANSLATE2_BATCH_SIZE = 16
 SENT_LEN_LIMIT = 500
+# texts per request of the /models/<model>/batch json endpoint
+BATCH_MAX_TEXTS = 1000
+# 'orjson' or 'json'; json is used when orjson is not installed
+JSON_ENCODER = 'orjson'
+# pre-render the /models/ and /languages/ GET responses once per models.json
+CACHE_RENDERED_RESOURCES = True
+# sentence splitter per source language ('default' for the rest): 'fast' splits the whole document in one pass,
+# 'moses' line by line; both give the same sentences
+SENTENCE_SPLITTERS = {'default': 'fast'}
+# identical concurrent translation requests are translated once
+COALESCE_REQUESTS = True
+# set to a directory (preferably on tmpfs, e.g. /dev/shm/lindat-coalesce) to coalesce across the gunicorn workers too
+COALESCE_DIR = None
+# seconds a finished translation is kept for the requests of other workers that waited for it
+COALESCE_RESULT_TTL = 10
+# seconds a request waits for the identical one in flight before it translates the text itself
+COALESCE_MAX_WAIT_SECS = 120
+# limit the backend batches in flight per priority class on this host (all workers together); a request that waits
+# longer than `deadline` seconds for its first batch gets 429 with Retry-After; off by default, size the slots to
+# what the backends and the workers handle before turning it on
+ADMISSION_CONTROL = False
+ADMISSION_CLASSES = {
+    'interactive': {'slots': 8, 'deadline': 5},
+    'document': {'slots': 3, 'deadline': 30},
+    'batch': {'slots': 2, 'deadline': 60},
+}
+# the slot lock files, defaults to a directory in the system temp dir
+ADMISSION_DIR = None
+# keyboard input up to this many characters is interactive, longer input is a document
+ADMISSION_INTERACTIVE_MAX_CHARS = 2000
+# requests from these frontends (X-Frontend or frontend param) are batch
+ADMISSION_BATCH_FRONTENDS = ()
+# token bucket per client shared by the workers: a client may burst RATE_LIMIT_CAPACITY units (input 'chars' or
+# 'words') and gets RATE_LIMIT_RATE units back per second
+RATE_LIMIT = True
+RATE_LIMIT_UNIT = 'chars'
+RATE_LIMIT_CAPACITY = 1000000
+RATE_LIMIT_RATE = 2000
+# which of author, frontend and ip_address (X-Real-IP, else the peer address) make up the client key; author and
+# frontend are sent by the client, a key with them can be dodged by sending another value; the fields a request
+# does not send are left out of its key
+RATE_LIMIT_KEY = ('ip_address',)
+# {client key: {'capacity': ..., 'rate': ...}}, e.g. {'ip_address=10.0.0.1': {...}}
+RATE_LIMIT_OVERRIDES = {}
+# the buckets of clients idle for this many seconds are dropped (a new bucket is full)
+RATE_LIMIT_IDLE_SECS = 86400
+# the sqlite file with the buckets, defaults to /dev/shm/lindat-ratelimit.db
+RATE_LIMIT_DATABASE = None
+# seconds a translation may take per route ('languages', 'models/<model>' or 'default'), keep it below the gunicorn
+# timeout; clients can ask for less with the X-Request-Timeout header. Batches that can't make it are skipped (504)
+REQUEST_DEADLINE_SECS = {'default': 480}
+# clients editing a document send X-Document-Revision, only its new and changed sentences (context windows for the
+# document level model) are translated again; the sentence alignments of a revision are kept for REVISION_TTL
+# seconds, at most REVISION_MAX_ENTRIES revisions, in REVISION_DATABASE (defaults to /dev/shm/lindat-revisions.db)
+INCREMENTAL_TRANSLATION = True
+REVISION_TTL = 3600
+REVISION_MAX_ENTRIES = 10000
+REVISION_DATABASE = None
+# with DEBUG logging on, log only every n-th backend batch and doc model block (by size and hash, not content)
+LOG_BATCH_SAMPLE_EVERY = 1
+# share (0-1) of the requests whose spans (preprocessing, hops, batches, retries, db logging) are recorded; the trace
+# id (X-Trace-Id) is sent to the backends for every request
+TRACE_SAMPLE_RATE = 0.0
+# the spans are appended here in the Chrome trace event format (chrome://tracing, ui.perfetto.dev), defaults to a
+# file in the system temp dir
+TRACE_FILE = None
+# before a worker reports ready at /ready, every model translates a batch of sentences of each of these lengths
+# (words), so that the backends and the frontend are done with their lazy initialization; an empty tuple skips it.
+# A model whose backend failed is warmed up again once it answers, tried every WARMUP_RETRY_SECS; the worker is not
+# ready meanwhile unless WARMUP_READY_WHILE_REWARMING. The warm-up of a model may take WARMUP_TIMEOUT_SECS
+WARMUP_LENGTHS = (8, 32, 96)
+WARMUP_RETRY_SECS = 10
+WARMUP_TIMEOUT_SECS = 120
+WARMUP_READY_WHILE_REWARMING = False
+# the batches mirrored to the candidate backends ("shadow" in models.json) are recorded in SHADOW_DATABASE (defaults to
+# /dev/shm/lindat-shadow.db), at most SHADOW_MAX_ROWS of the latest; a worker leaves out the sampled batches while
+# SHADOW_MAX_PENDING of its batches wait for a candidate, which gets SHADOW_TIMEOUT_SECS per batch
+SHADOW_DATABASE = None
+SHADOW_MAX_ROWS = 100000
+SHADOW_MAX_PENDING = 16
+SHADOW_TIMEOUT_SECS = 60
+# the /admin/ endpoints require the X-Admin-Token header with this value; they are closed (403) when it is not set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 #CSRF prevention
 SECRET_KEY = (os.environ.get('SECRET_KEY') or
               b'\x0c\x11{\xd3\x11$\xeeel\xa6\xfb\x1d~\xfd\xb3\x9d\x11\x00\xfb4\xd64\xd4\xe0')
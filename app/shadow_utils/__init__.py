@@ -0,0 +1,186 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.sqlite_utils import SharedDatabase, tmpfs_path
+from app.stats_utils import percentile, summarize
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow_batches (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    model TEXT NOT NULL,
+    server TEXT NOT NULL,
+    sentences INTEGER NOT NULL,
+    input_chars INTEGER NOT NULL,
+    primary_secs REAL NOT NULL,
+    primary_chars INTEGER NOT NULL,
+    shadow_secs REAL NOT NULL,
+    shadow_chars INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS shadow_batches_created ON shadow_batches (created);
+"""
+
+# threads of a worker process sending the mirrored batches
+MAX_THREADS = 4
+
+
+def default_database_path():
+    """
+    A sqlite file on tmpfs when available, the comparison is only needed while a candidate is being tried
+    """
+    return tmpfs_path('lindat-shadow.db')
+
+
+class ShadowTarget(object):
+    """
+    The candidate backend of a model ("shadow" in models.json)
+    """
+
+    def __init__(self, server, sample=0.05, model=None):
+        """
+        :param server: host:port of the candidate, interpolated with the app config
+        :param sample: share (0-1) of the batches mirrored to the candidate
+        :param model: the servable name of the candidate on tensorflow serving, defaults to the model's
+        """
+        self.server = server
+        self.sample = sample
+        self.model = model
+
+    def sampled(self):
+        return random.random() < self.sample
+
+
+class Shadow(object):
+    """
+    Sends a copy of the sampled backend batches to the candidate backend of the model in background threads, after
+    the primary backend answered, and records the latency and output length of both side by side. The user always
+    gets the answer of the primary backend; a failed or slow candidate is only recorded. At most `max_pending` batches
+    of a worker wait for the candidate, more are not mirrored. The records are shared by all the workers on the host,
+    at most `max_rows` of the latest are kept.
+    """
+
+    def __init__(self, database=None, max_pending=16, timeout_secs=60, max_rows=100000):
+        self.configure(database, max_pending, timeout_secs, max_rows)
+
+    def configure(self, database=None, max_pending=16, timeout_secs=60, max_rows=100000):
+        self.database = database or default_database_path()
+        self.max_pending = max_pending
+        self.timeout_secs = timeout_secs
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._db = SharedDatabase(self.database, SCHEMA)
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self):
+        # the threads don't survive a fork
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(MAX_THREADS, thread_name_prefix='shadow')
+            self._executor_pid = os.getpid()
+            self._pending = 0
+        return self._executor
+
+    def mirror(self, model, server, send, batch, primary_secs, primary_outputs):
+        """
+        Sends the batch to the candidate in the background
+        :param send: fn(timeout_secs) -> the output sentences of the candidate; it must not need the request (app
+            context, trace), it runs in another thread
+        :param batch: the input sentences
+        :param primary_outputs: the output sentences of the primary backend
+        :return: whether the batch was mirrored
+        """
+        with self._lock:
+            executor = self._get_executor()
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending += 1
+        row = dict(model=model, server=server, sentences=len(batch), input_chars=sum(map(len, batch)),
+                   primary_secs=primary_secs, primary_chars=sum(map(len, primary_outputs)))
+        executor.submit(self._run, send, row)
+        return True
+
+    def _run(self, send, row):
+        start = time.monotonic()
+        try:
+            try:
+                outputs = send(self.timeout_secs)
+                row.update(shadow_chars=sum(map(len, outputs)), error=None)
+            except Exception as e:
+                row.update(shadow_chars=None, error=repr(e))
+            row['shadow_secs'] = time.monotonic() - start
+            self.record(**row)
+        except Exception:
+            log.exception('Could not record the shadow batch of %s', row['model'])
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def record(self, model, server, sentences, input_chars, primary_secs, primary_chars, shadow_secs,
+               shadow_chars=None, error=None):
+        conn = self._db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO shadow_batches (created, model, server, sentences, input_chars, primary_secs, '
+                         'primary_chars, shadow_secs, shadow_chars, error) VALUES (?,?,?,?,?,?,?,?,?,?)',
+                         (time.time(), model, server, sentences, input_chars, primary_secs, primary_chars,
+                          shadow_secs, shadow_chars, error))
+            conn.execute('DELETE FROM shadow_batches WHERE id IN '
+                         '(SELECT id FROM shadow_batches ORDER BY id DESC LIMIT -1 OFFSET ?)', (self.max_rows,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def report(self, model=None, since=None):
+        """
+        :param model: only the batches of this model
+        :param since: only the batches recorded after this unix time
+        :return: per model and candidate the batch latencies of both backends, the per batch ratios of the latency and
+            of the output length (candidate / primary) and the failed batches of the candidate
+        """
+        query = 'SELECT model, server, sentences, primary_secs, primary_chars, shadow_secs, shadow_chars, error ' \
+                'FROM shadow_batches WHERE created > ?'
+        params = [since or 0]
+        if model:
+            query += ' AND model = ?'
+            params.append(model)
+        groups = {}
+        for row in self._db.connect().execute(query + ' ORDER BY id', params):
+            groups.setdefault(row[:2], []).append(row[2:])
+
+        report = []
+        for (model_name, server), rows in sorted(groups.items()):
+            ok = [row for row in rows if row[5] is None]
+            length_ratios = [shadow_chars / primary_chars for _, _, primary_chars, _, shadow_chars, _ in ok
+                             if primary_chars]
+            errors = {}
+            for row in rows:
+                if row[5] is not None:
+                    errors[row[5]] = errors.get(row[5], 0) + 1
+            report.append({
+                'model': model_name,
+                'server': server,
+                'batches': len(rows),
+                'sentences': sum(row[0] for row in rows),
+                'failed': len(rows) - len(ok),
+                'errors': sorted(errors.items(), key=lambda item: -item[1]),
+                'primary_secs': summarize([row[1] for row in ok]),
+                'shadow_secs': summarize([row[3] for row in ok]),
+                'latency_ratio': summarize([row[3] / row[1] for row in ok if row[1] > 0]),
+                'length_ratio': dict(summarize(length_ratios), p10=percentile(length_ratios, 10),
+                                     min=min(length_ratios) if length_ratios else None),
+            })
+        return report
+
+
+shadow = Shadow()
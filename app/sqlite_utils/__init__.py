@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+
+def tmpfs_path(file_name):
+    """
+    :return: the path of file_name on tmpfs when available, in the system temp dir otherwise
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, file_name)
+
+
+class SharedDatabase(object):
+    """
+    A sqlite database shared by all the workers on the host. Every thread keeps its own connection, in WAL mode (the
+    readers don't wait for the writer) and without fsync (the data need not survive a crash of the host); the schema
+    is created on connect.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # a connection must not be used in a forked child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.executescript(self.schema)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
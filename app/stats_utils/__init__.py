@@ -0,0 +1,29 @@
+import math
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile
+    :param values: numbers, need not be sorted
+    :param q: 0-100
+    :return: None for no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(math.ceil(q / 100 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    """
+    count, mean and the usual percentiles of values
+    """
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
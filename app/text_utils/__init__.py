@@ -1,23 +1,52 @@
-from collections import defaultdict
-import os
-from sentence_splitter import SentenceSplitter
+import codecs
+import contextvars
+from contextlib import contextmanager
+from unicodedata import normalize
 
-pwd = os.path.dirname(os.path.abspath(__file__))
-prefix_dir = os.path.join(pwd, 'non_breaking_prefixes')
+from .splitter import splitters
 
-_lang2file = defaultdict(lambda: None)
-_lang2file['uk'] = os.path.join(prefix_dir, 'uk.txt')
-
-_instances = {}
+# {(language, lines): sentences} while shared_splitting is active
+_split_memo = contextvars.ContextVar('split_memo', default=None)
 
 
 def split_text_into_sentences(text, language):
-    if language not in _instances:
-        instance = SentenceSplitter(language, _lang2file[language])
-        _instances[language] = instance
-    else:
-        instance = _instances[language]
-    return instance.split(text=text)
+    return splitters.get(language).split(text)
+
+
+def split_many(lines, language):
+    """
+    Splits each of the lines into sentences
+    :return: a list of sentences for every line
+    """
+    memo = _split_memo.get()
+    if memo is None:
+        return splitters.get(language).split_lines(lines)
+    key = (language, tuple(lines))
+    if key not in memo:
+        memo[key] = splitters.get(language).split_lines(lines)
+    return memo[key]
+
+
+@contextmanager
+def shared_splitting():
+    """
+    Within the with block (and in threads running a copy of its context) every text is split into sentences once per
+    language, no matter how many models translate it
+    """
+    token = _split_memo.set({})
+    try:
+        yield
+    finally:
+        _split_memo.reset(token)
+
+
+def preload_splitters(languages, selection=None):
+    """
+    :param selection: which splitter to use per language, see SENTENCE_SPLITTERS in settings
+    """
+    if selection is not None:
+        splitters.configure(selection)
+    splitters.preload(languages)
 
 
 def extract_text(translation):
@@ -33,3 +62,73 @@ def extract_text(translation):
     else:
         text_arr = []
     return ' '.join(text_arr).replace('\n ', '\n')
+
+
+def read_nfc_lines(stream, chunk_size=64 * 1024, encoding='utf-8'):
+    """
+    Reads a binary stream chunk by chunk and yields its lines (without the newline) decoded and NFC normalized.
+    The lines are the same as normalize('NFC', stream.read().decode(encoding)).split('\n') but only a chunk and the
+    current line are held in memory.
+    :raises UnicodeDecodeError:
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            lines = (pending + text).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                # NFC never composes across a newline, so normalizing line by line is safe
+                yield normalize('NFC', line)
+        if not chunk:
+            break
+    yield normalize('NFC', pending)
+
+
+def split_lines(text):
+    """
+    Input text is passed around either as a string or as a list of its lines (see read_nfc_lines)
+    :return: the lines
+    """
+    return text.split('\n') if isinstance(text, str) else text
+
+
+def join_lines(text):
+    return text if isinstance(text, str) else '\n'.join(text)
+
+
+def is_blank(text):
+    return not text or all(not line.strip() for line in split_lines(text))
+
+
+def split_on_budget(sent, limit, cost):
+    """
+    Cuts a sentence at spaces into parts costing at most limit, e.g. subwords of the model's vocabulary. The cost of
+    each word is computed once, a word over the limit alone is cut in proportion to its cost.
+    :param cost: fn(word) -> int, should be cached, the same words come again and again
+    :return: a list of the parts
+    """
+    parts = []
+    current = []
+    used = 0
+    for word in sent.split(' '):
+        word_cost = cost(word) if word else 0
+        if current and used + word_cost > limit:
+            parts.append(' '.join(current))
+            current, used = [], 0
+        while word_cost > limit:
+            cut = max(1, len(word) * limit // word_cost)
+            # the cost is not spread evenly over the word, a piece over the limit is cut shorter
+            piece_cost = cost(word[:cut])
+            while cut > 1 and piece_cost > limit:
+                cut = max(1, cut * limit // piece_cost)
+                piece_cost = cost(word[:cut])
+            parts.append(word[:cut])
+            word = word[cut:]
+            word_cost = cost(word) if word else 0
+        current.append(word)
+        used += word_cost
+    parts.append(' '.join(current))
+    return parts
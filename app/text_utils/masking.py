@@ -0,0 +1,84 @@
+"""
+Placeholder masking: URLs, e-mail addresses, code spans, long numbers and identifiers are replaced by [1], [2], ...
+before the sentences go to the backend and put back into the translations. The masked sentences are shorter (fewer
+subwords, fewer forced splits) and the same sentence with another URL or number is the same backend input.
+"""
+import re
+
+KINDS = ('url', 'email', 'code', 'number', 'identifier')
+
+# shorter numbers are left to the model, they decide the grammatical number of the words around them (1 minuta,
+# 2 minuty, 5 minut)
+MIN_NUMBER_CHARS = 4
+
+_PATTERNS = {
+    # placeholders already in the text are masked too, so every [n] in a masked text is ours
+    'placeholder': r'\[\d+\]',
+    'url': r'(?:(?:https?|ftp)://|www\.)[^\s<>"]*[^\s<>".,;:!?)\]\'"»“”]',
+    'email': r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+',
+    'code': r'`[^`\n]+`',
+    'number': r'(?<![\w.,])\d[\d.,:/-]{%d,}(?<=\d)(?!\w)' % (MIN_NUMBER_CHARS - 1),
+    # letters mixed with digits or underscores: A320, ISO-9001, x86_64, max_len; not the ordinals (1st, 22nd), they
+    # are translated
+    'identifier': r'\b(?!\d+(?i:st|nd|rd|th)\b)(?=[\w-]*[\d_])(?=[\w-]*[^\W\d_])\w+(?:-\w+)*\b',
+}
+
+_PLACEHOLDER = re.compile(r'\[(\d+)\]')
+
+
+class Masker(object):
+    """
+    Masks the spans of the selected kinds with one precompiled regex, i.e. in a single pass over the document
+    """
+
+    def __init__(self, kinds=KINDS):
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise ValueError('Unknown masking kinds: {}'.format(', '.join(sorted(unknown))))
+        self.kinds = tuple(kinds)
+        self._scanner = re.compile('|'.join('(?P<{}>{})'.format(kind, _PATTERNS[kind])
+                                            for kind in ('placeholder',) + self.kinds))
+
+    def mask(self, lines):
+        """
+        :param lines: the document as a list of lines
+        :return: the masked lines with document wide placeholders [1], [2], ... and the masked spans in their order
+        """
+        spans = []
+
+        def replace(match):
+            spans.append(match.group(0))
+            return '[{}]'.format(len(spans))
+
+        return [self._scanner.sub(replace, line) for line in lines], spans
+
+
+def number_per_block(blocks, spans):
+    """
+    Renumbers the document wide placeholders from 1 in each block (sentence), so that the same sentence is the same
+    backend input wherever it is in the document
+    :return: the blocks and the original spans of each block
+    """
+    numbered = []
+    block_spans = []
+    for block in blocks:
+        originals = []
+
+        def replace(match):
+            originals.append(spans[int(match.group(1)) - 1])
+            return '[{}]'.format(len(originals))
+
+        numbered.append(_PLACEHOLDER.sub(replace, block))
+        block_spans.append(originals)
+    return numbered, block_spans
+
+
+def unmask(text, originals):
+    """
+    :return: text with [1], [2], ... replaced by the originals or None when they did not survive the translation
+    exactly once each
+    """
+    found = [int(number) for number in _PLACEHOLDER.findall(text)]
+    if sorted(found) != list(range(1, len(originals) + 1)):
+        return None
+    return _PLACEHOLDER.sub(lambda match: originals[int(match.group(1)) - 1], text)
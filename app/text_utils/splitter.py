@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+
+import regex
+import sentence_splitter
+from sentence_splitter import SentenceSplitterException
+
+log = logging.getLogger(__name__)
+
+pwd = os.path.dirname(os.path.abspath(__file__))
+prefix_dir = os.path.join(pwd, 'non_breaking_prefixes')
+_default_prefix_dir = os.path.join(os.path.dirname(os.path.abspath(sentence_splitter.__file__)),
+                                   'non_breaking_prefixes')
+
+_lang2file = defaultdict(lambda: None)
+_lang2file['uk'] = os.path.join(prefix_dir, 'uk.txt')
+_lang2file['hi'] = os.path.join(prefix_dir, 'hi.txt')
+
+# The rules of sentence_splitter.SentenceSplitter (Moses split-sentences.perl), compiled once
+_STARTER = r'[\'"([\u00bf\u00A1\p{Initial_Punctuation}]*[\p{Uppercase_Letter}\p{Other_Letter}]'
+_BREAKS = [
+    # Non-period end of sentence markers (?!) followed by sentence starters
+    regex.compile(r'([?!]) +(' + _STARTER + ')', flags=regex.UNICODE),
+    # Multi-dots followed by sentence starters
+    regex.compile(r'(\.[\.]+) +(' + _STARTER + ')', flags=regex.UNICODE),
+    # Punctuation inside a quote or parenthetical followed by a possible sentence starter punctuation and upper case
+    regex.compile(r'([?!\.][\ ]*[\'")\]\p{Final_Punctuation}]+) +([\'"([\u00bf\u00A1\p{Initial_Punctuation}]*[\ ]*'
+                  r'[\p{Uppercase_Letter}\p{Other_Letter}])', flags=regex.UNICODE),
+    # Punctuation followed by a sentence starter punctuation and upper case
+    regex.compile(r'([?!\.]) +([\'"[\u00bf\u00A1\p{Initial_Punctuation}]+[\ ]*[\p{Uppercase_Letter}'
+                  r'\p{Other_Letter}])', flags=regex.UNICODE),
+]
+_SPACES = regex.compile(r' +', flags=regex.UNICODE)
+_ENDS_WITH_PERIOD = regex.compile(r'([\w\.\-]*)([\'\"\)\]\%\p{Final_Punctuation}]*)(\.+)$', flags=regex.UNICODE)
+_ACRONYM = regex.compile(r'(\.)[\p{Uppercase_Letter}\p{Other_Letter}\-]+(\.+)$', flags=regex.UNICODE)
+_STARTS_SENTENCE = regex.compile(r'^([ ]*[\'"([\u00bf\u00A1\p{Initial_Punctuation}]*[ ]*[\p{Uppercase_Letter}'
+                                 r'\p{Other_Letter}0-9])', flags=regex.UNICODE)
+_STARTS_WITH_NUMBER = regex.compile(r'^[0-9]+', flags=regex.UNICODE)
+_COMMENT = regex.compile(r'#.*', flags=regex.DOTALL | regex.UNICODE)
+
+# FastSplitter joins the lines of a document with this; none of the rules above can match it
+_LINE_SEPARATOR = '\x00'
+# The period ending a word that is followed by another word on the same line; only those words can get a sentence
+# break in the word loop
+_PERIOD_BEFORE_WORD = regex.compile(r'\.(?= +[^ \x00])', flags=regex.UNICODE)
+_NEXT_WORD = regex.compile(r' +([^ \x00]*)', flags=regex.UNICODE)
+
+
+def load_non_breaking_prefixes(language, non_breaking_prefix_file=None):
+    """
+    Reads a non-breaking prefix file the way sentence_splitter does
+    :return: (default prefixes, numeric only prefixes) as frozensets
+    """
+    if not regex.match(r'^[a-z][a-z]$', language):
+        raise SentenceSplitterException("Invalid language code: {}".format(language))
+    if non_breaking_prefix_file is None:
+        non_breaking_prefix_file = os.path.join(_default_prefix_dir, '{}.txt'.format(language))
+    if not os.path.isfile(non_breaking_prefix_file):
+        raise SentenceSplitterException("Non-breaking prefix file for language '{}' was not found at path '{}'"
+                                        .format(language, non_breaking_prefix_file))
+    numeric_only = {}
+    with open(non_breaking_prefix_file, mode='r', encoding='utf-8') as prefix_file:
+        for line in prefix_file:
+            is_numeric_only = '#NUMERIC_ONLY#' in line
+            line = _COMMENT.sub('', line).strip()
+            if line:
+                # the last occurrence wins, as in sentence_splitter
+                numeric_only[line] = is_numeric_only
+    return (frozenset(prefix for prefix, numeric in numeric_only.items() if not numeric),
+            frozenset(prefix for prefix, numeric in numeric_only.items() if numeric))
+
+
+class Splitter(object):
+    """
+    Same splits as sentence_splitter.SentenceSplitter, but with the regexes compiled once and the non-breaking
+    prefixes in frozensets. Holds no mutable state, so a single instance can be shared by all threads.
+    """
+
+    def __init__(self, language, non_breaking_prefix_file=None):
+        self.language = language
+        self.prefixes, self.numeric_prefixes = load_non_breaking_prefixes(language, non_breaking_prefix_file)
+
+    def split(self, text):
+        if not text:
+            return []
+
+        for pattern in _BREAKS:
+            text = pattern.sub('\\1\n\\2', text)
+
+        # Special punctuation cases are covered. Check all remaining periods
+        words = _SPACES.split(text)
+        for i in range(len(words) - 1):
+            if self._breaks_after(words[i], words[i + 1]):
+                words[i] = words[i] + '\n'
+        text = ' '.join(words)
+
+        # Clean up spaces at head and tail of each line as well as any double-spacing
+        text = _SPACES.sub(' ', text).replace('\n ', '\n').replace(' \n', '\n').strip()
+        return text.split('\n')
+
+    def split_lines(self, lines):
+        """
+        :return: a list of sentences for every line
+        """
+        return [self.split(line) for line in lines]
+
+    def _breaks_after(self, word, next_word):
+        match = _ENDS_WITH_PERIOD.search(word)
+        if not match:
+            return False
+        prefix, starting_punct = match.group(1), match.group(2)
+        if prefix and not starting_punct and prefix in self.prefixes:
+            # Not breaking - known honorific
+            return False
+        if _ACRONYM.search(word):
+            # Not breaking - upper case acronym
+            return False
+        if _STARTS_SENTENCE.search(next_word):
+            # We always add a return for these unless we have a numeric non-breaker and a number start
+            return not (prefix and not starting_punct and prefix in self.numeric_prefixes
+                        and _STARTS_WITH_NUMBER.search(next_word))
+        return False
+
+
+class FastSplitter(Splitter):
+    """
+    Splits a whole document in one go: the lines are joined, every rule runs once over the joined text and the word
+    loop only visits the words that end with a period. None of the rules can match across a line boundary, so the
+    sentences are the same as Splitter.split gives line by line.
+    """
+
+    def split_lines(self, lines):
+        if not isinstance(lines, list):
+            lines = list(lines)
+        if any(_LINE_SEPARATOR in line for line in lines):
+            return super().split_lines(lines)
+        text = _LINE_SEPARATOR.join(lines)
+
+        for pattern in _BREAKS:
+            text = pattern.sub('\\1\n\\2', text)
+
+        parts = []
+        last = 0
+        for match in _PERIOD_BEFORE_WORD.finditer(text):
+            end = match.end()
+            start = text.rfind(' ', 0, end) + 1
+            start = text.rfind(_LINE_SEPARATOR, start, end) + 1 or start
+            if self._breaks_after(text[start:end], _NEXT_WORD.match(text, end).group(1)):
+                parts.append(text[last:end])
+                parts.append('\n')
+                last = end
+        parts.append(text[last:])
+        text = ''.join(parts)
+
+        text = _SPACES.sub(' ', text).replace('\n ', '\n').replace(' \n', '\n')
+        return [line.strip().split('\n') if line else [] for line in text.split(_LINE_SEPARATOR)]
+
+
+_implementations = {
+    'moses': Splitter,
+    'fast': FastSplitter,
+}
+
+
+class SplitterRegistry(object):
+    """
+    One splitter per language. Call preload before the workers fork so that they share the loaded splitters;
+    languages that were not preloaded are loaded on first use.
+    """
+
+    def __init__(self):
+        self._splitters = {}
+        self._selection = {'default': 'fast'}
+        self._lock = threading.Lock()
+
+    def configure(self, selection):
+        """
+        :param selection: {language or 'default': 'fast' or 'moses'}
+        """
+        unknown = set(selection.values()) - set(_implementations)
+        if unknown:
+            raise ValueError('Unknown sentence splitter(s) {}'.format(', '.join(sorted(unknown))))
+        with self._lock:
+            self._selection = dict(selection)
+            self._splitters = {}
+
+    def get(self, language):
+        splitter = self._splitters.get(language)
+        if splitter is None:
+            with self._lock:
+                splitter = self._splitters.get(language)
+                if splitter is None:
+                    implementation = self._selection.get(language, self._selection.get('default', 'fast'))
+                    splitter = _implementations[implementation](language, _lang2file[language])
+                    self._splitters[language] = splitter
+        return splitter
+
+    def preload(self, languages):
+        for language in languages:
+            try:
+                self.get(language)
+            except SentenceSplitterException as e:
+                log.warning("Can't preload sentence splitter: {}".format(e))
+
+
+splitters = SplitterRegistry()
@@ -0,0 +1,127 @@
+"""
+Lightweight per-request tracing. Every request gets a trace id (X-Trace-Id, passed on to the backends); a sampled
+request also records spans (preprocessing, hops, batches, retries, db logging) that are appended to TRACE_FILE in the
+Chrome trace event format, which chrome://tracing and https://ui.perfetto.dev load. The array is never closed, the
+viewers accept that, so all the workers can keep appending to the same file.
+"""
+import contextvars
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+
+_current = contextvars.ContextVar('trace', default=None)
+# client supplied ids end up in headers and grpc metadata
+_VALID_TRACE_ID = re.compile(r'^[0-9A-Za-z._-]{1,64}$')
+
+
+class Trace(object):
+
+    def __init__(self, trace_id, sampled):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.events = []
+        self.started_us = time.time_ns() // 1000
+
+    def add(self, name, start_us, end_us, args):
+        event = {'name': name, 'cat': 'translation', 'ph': 'X', 'ts': start_us, 'dur': end_us - start_us,
+                 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args}
+        args['trace_id'] = self.trace_id
+        self.events.append(event)
+
+
+def start_trace(trace_id=None, sample_rate=0.0):
+    """
+    Starts the trace of the current request (context)
+    :param trace_id: continue a trace started by the client, a new id is generated when missing or invalid
+    :param sample_rate: 0-1, the share of traces whose spans are recorded
+    """
+    if not trace_id or not _VALID_TRACE_ID.match(trace_id):
+        trace_id = uuid.uuid4().hex
+    trace = Trace(trace_id, sample_rate > 0 and random.random() < sample_rate)
+    _current.set(trace)
+    return trace
+
+
+def end_trace(trace_file, name='request', **args):
+    """
+    Ends the trace of the current request and, if it was sampled, appends its spans and a root span covering the
+    whole trace to trace_file
+    """
+    trace = _current.get()
+    _current.set(None)
+    if trace is not None and trace.sampled:
+        trace.add(name, trace.started_us, time.time_ns() // 1000, args)
+        export(trace_file, trace.events)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_trace_id():
+    """
+    :return: the id to pass to the backends or None outside of a trace
+    """
+    trace = _current.get()
+    return trace.trace_id if trace is not None else None
+
+
+def attach(trace):
+    """
+    Makes trace the current one in another thread, e.g. a pool thread working for the request
+    """
+    _current.set(trace)
+
+
+class _Span(object):
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time_ns() // 1000
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.trace.add(self.name, self.start, time.time_ns() // 1000, self.args)
+        return False
+
+
+# shared by all the spans that are not recorded, so that they cost one context variable lookup
+_NOT_RECORDED = nullcontext()
+
+
+def span(name, **args):
+    """
+    Records the with block as a span of the current trace; does nothing when the trace is not sampled
+    """
+    trace = _current.get()
+    if trace is None or not trace.sampled:
+        return _NOT_RECORDED
+    return _Span(trace, name, args)
+
+
+def export(path, events):
+    """
+    Appends the events to a json array file, one event per line, in a single write
+    """
+    data = ''.join(json.dumps(event, separators=(',', ':'), default=str) + ',\n' for event in events).encode('utf-8')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        os.write(fd, b'[\n')
+    except FileExistsError:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
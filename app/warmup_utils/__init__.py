@@ -0,0 +1,190 @@
+import fcntl
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from app.deadline_utils import Deadline
+
+log = logging.getLogger(__name__)
+
+_WORDS = ('the', 'translation', 'of', 'this', 'sentence', 'is', 'only', 'a', 'test', 'for', 'our', 'new', 'servers')
+
+COLD = 'cold'
+WARMING = 'warming'
+WARM = 'warm'
+FAILED = 'failed'
+
+
+def warm_up_text(words, sentences):
+    """
+    :return: a text of `sentences` sentences, `words` words each
+    """
+    sentence = ' '.join(_WORDS[i % len(_WORDS)] for i in range(words)).capitalize() + '.'
+    return ' '.join([sentence] * sentences)
+
+
+class WarmUp(object):
+    """
+    Translates a batch of sentences of each length bucket with every model before the worker reports ready (/ready),
+    so that the backends (graph initialization, tensorflow serving batching) and whatever is still lazy in the
+    frontend are ready before the first user request. A model whose backend failed is warmed up again, once its backend
+    answers; the worker is not ready meanwhile. The workers on a host take turns per model, the first one pays for the
+    cold backend; a worker that waited for another one whose warm-up failed doesn't try the backend again until the
+    retry.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, lengths=(), retry_secs=10, timeout_secs=120, lock_dir=None, ready_while_rewarming=False):
+        """
+        :param lengths: the length buckets in words, a warm-up batch has batch_size sentences of each; none to skip
+            the warm-up
+        :param retry_secs: how often a failed model is tried again
+        :param timeout_secs: the time the warm-up of a model may take, and a worker waits for another one warming it up
+        :param ready_while_rewarming: stay ready while a model whose backend failed is warmed up again
+        """
+        self.lengths = tuple(lengths)
+        self.retry_secs = retry_secs
+        self.timeout_secs = timeout_secs
+        self.lock_dir = lock_dir or tempfile.gettempdir()
+        self.ready_while_rewarming = ready_while_rewarming
+        self._states = {}
+        self._rewarming = set()
+        self._ready = not self.lengths
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, app, models):
+        """
+        Starts warming up the models in a background thread of this process, unless it already runs
+        :param models: app.models.Model instances
+        """
+        with self._lock:
+            if self._pid == os.getpid() or not self.lengths:
+                return
+            # a forked worker warms up on its own, the thread of the parent didn't survive the fork
+            self._pid = os.getpid()
+            self._ready = False
+            self._states = {model.model: {'state': COLD} for model in models}
+            self._rewarming = set()
+        threading.Thread(target=self._run, args=(app, list(models)), name='warmup', daemon=True).start()
+
+    def _is_ready(self):
+        return self._ready and (self.ready_while_rewarming or not self._rewarming)
+
+    def is_ready(self):
+        with self._lock:
+            return self._is_ready()
+
+    def status(self):
+        with self._lock:
+            return {'ready': self._is_ready(),
+                    'models': {name: dict(state) for name, state in self._states.items()}}
+
+    def backend_failed(self, model_name):
+        """
+        The backend of the model failed (e.g. tensorflow serving restarted), warm it up again once it answers
+        """
+        with self._lock:
+            state = self._states.get(model_name)
+            if state is None or state['state'] != WARM:
+                return
+            self._states[model_name] = {'state': COLD}
+            self._rewarming.add(model_name)
+        log.warning('The backend of %s failed, warming it up again', model_name)
+        self._wake.set()
+
+    def _set_state(self, model_name, **state):
+        with self._lock:
+            self._states[model_name] = state
+            if state['state'] in (WARM, FAILED):
+                # a backend that is down keeps failing on every worker, not being ready wouldn't help
+                self._rewarming.discard(model_name)
+
+    def _run(self, app, models):
+        # the backend clients read the app config and clear the session on errors
+        with app.test_request_context():
+            first = True
+            while True:
+                for model in models:
+                    if self.status()['models'][model.model]['state'] != WARM:
+                        self._warm_up_in_turn(model)
+                if first:
+                    # the models whose backends are down are retried in the background
+                    with self._lock:
+                        self._ready = True
+                    first = False
+                    log.info('Warm-up of %d models done', len(models))
+                self._wake.wait(self.retry_secs)
+                self._wake.clear()
+
+    def _warm_up_in_turn(self, model):
+        """
+        Warms up the model holding its host wide lock, waits for the lock at most timeout_secs; the lock file keeps
+        the time and error of the last failed warm-up
+        """
+        path = os.path.join(self.lock_dir, 'lindat-warmup-{}.lock'.format(re.sub(r'[^\w.-]', '_', model.model)))
+        waiting_since = time.time()
+        with open(path, 'a+') as lock_file:
+            locked = _lock(lock_file, self.timeout_secs)
+            if not locked:
+                log.warning('Another worker takes too long warming up %s, warming it up anyway', model.model)
+            try:
+                if locked:
+                    lock_file.seek(0)
+                    failed_at, _, error = lock_file.read().partition('\t')
+                    if failed_at and float(failed_at) > waiting_since:
+                        # failed in the worker this one waited for
+                        self._set_state(model.model, state=FAILED, error=error)
+                        return
+                error = self._warm_up(model)
+                if locked:
+                    lock_file.truncate(0)
+                    lock_file.write('{}\t{}'.format(time.time(), error) if error else '')
+                    lock_file.flush()
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _warm_up(self, model):
+        """
+        :return: the error or None
+        """
+        self._set_state(model.model, state=WARMING)
+        src = next(iter(model.supports))
+        tgt = model.supports[src][0]
+        start = time.monotonic()
+        # all the buckets of a model share the timeout, a hung backend doesn't cost it per bucket
+        deadline = Deadline(self.timeout_secs)
+        try:
+            for words in self.lengths:
+                model.translate(warm_up_text(words, model.batch_size), src, tgt, deadline=deadline)
+        except Exception as e:
+            log.warning('Warm-up of %s failed: %r', model.model, e)
+            self._set_state(model.model, state=FAILED, error=repr(e))
+            return repr(e)
+        self._set_state(model.model, state=WARM, secs=round(time.monotonic() - start, 3))
+        return None
+
+
+def _lock(lock_file, timeout_secs):
+    """
+    :return: whether the flock was taken within timeout_secs
+    """
+    give_up = time.monotonic() + timeout_secs
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= give_up:
+                return False
+            time.sleep(0.05)
+
+
+warmup = WarmUp()
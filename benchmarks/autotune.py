@@ -0,0 +1,213 @@
+"""
+Tune tensorflow serving's batching.config and the frontend batch sizes of the tensorflow models on a replayed workload.
+
+    python -m benchmarks.replay export --db app/db/database.db --sample 0.1 -o workload.jsonl
+    python -m benchmarks.autotune workload.jsonl --rates 5,10,20,40 --slo 2 --latency 0.05 \\
+        --per-token-latency 0.0002 -o tuning
+
+Every combination of max_batch_size, num_batch_threads, batch_timeout_micros (the tf serving stand-in batches the
+requests like batching.config does, a batch costs latency + per-token-latency * its padded size) and frontend
+batch_size (BATCH_SIZE, at most max_batch_size) is replayed with Poisson arrivals at each of the rates. The recommended
+batching.config sustains the highest rate with no errors and p99 within the SLO; with it, each model gets the batch
+size with the lowest p99 of its requests at that rate. Written to the output directory:
+
+    batching.config  the recommended server side batching
+    models.json      a copy of app/models.json with batch_size of the tensorflow models
+    curve.csv        throughput and latency of every combination and rate, for all requests and per model
+
+Set --latency and --per-token-latency to what the GPU takes (e.g. from the backend_call spans of a trace), the
+recommendation is only as good as the stand-in's cost model. Marian and ctranslate2 models are not tuned.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+from collections import defaultdict
+
+from app.stats_utils import summarize
+from benchmarks.replay import replay
+from benchmarks.workloads import read_workload
+
+CURVE_FIELDS = ['max_batch_size', 'num_batch_threads', 'batch_timeout_micros', 'batch_size', 'rate', 'group',
+                'requests', 'errors', 'throughput', 'p50', 'p90', 'p99']
+
+
+def parameter_grid(max_batch_sizes, batch_threads, batch_timeouts, batch_sizes):
+    """
+    :return: (max_batch_size, num_batch_threads, batch_timeout_micros, batch_size) tuples; a frontend batch larger than
+    max_batch_size would be rejected by tf serving
+    """
+    return [(max_batch_size, threads, timeout, batch_size)
+            for max_batch_size, threads, timeout, batch_size
+            in itertools.product(max_batch_sizes, batch_threads, batch_timeouts, batch_sizes)
+            if batch_size <= max_batch_size]
+
+
+def curve_rows(params, rate, results, models_of):
+    """
+    :param results: of benchmarks.replay.replay
+    :param models_of: fn(result) -> the names of the models that translated the request
+    :return: a curve.csv row for all the requests and one per model
+    """
+    groups = defaultdict(list)
+    for res in results:
+        groups['all'].append(res)
+        for model in models_of(res):
+            groups[model].append(res)
+    rows = []
+    for group, group_results in sorted(groups.items()):
+        ok = [res for res in group_results if res['status'] == 200]
+        wall = max(res['scheduled'] + res['latency'] for res in group_results) - min(
+            res['scheduled'] for res in group_results)
+        latency = summarize([res['latency'] for res in ok])
+        rows.append(dict(zip(CURVE_FIELDS[:4], params), rate=rate, group=group, requests=len(group_results),
+                         errors=len(group_results) - len(ok), throughput=len(ok) / wall if wall > 0 else None,
+                         p50=latency['p50'], p90=latency['p90'], p99=latency['p99']))
+    return rows
+
+
+def _sustains(row, slo):
+    return row['errors'] == 0 and row['p99'] is not None and row['p99'] <= slo
+
+
+def recommend(rows, slo):
+    """
+    :param rows: the curve
+    :return: ((max_batch_size, num_batch_threads, batch_timeout_micros), {model: batch_size}, the rate they sustain)
+    """
+    totals = [row for row in rows if row['group'] == 'all']
+    by_batching = defaultdict(list)
+    for row in totals:
+        by_batching[(row['max_batch_size'], row['num_batch_threads'], row['batch_timeout_micros'])].append(row)
+
+    def score(batching_rows):
+        sustained = [row for row in batching_rows if _sustains(row, slo)]
+        if not sustained:
+            # nothing meets the SLO, the least bad at the lowest rate
+            lowest = min(row['rate'] for row in batching_rows)
+            return 0, -min(row['p99'] or float('inf') for row in batching_rows if row['rate'] == lowest)
+        rate = max(row['rate'] for row in sustained)
+        return rate, -min(row['p99'] for row in sustained if row['rate'] == rate)
+
+    batching = max(by_batching, key=lambda key: score(by_batching[key]))
+    rate = score(by_batching[batching])[0] or min(row['rate'] for row in by_batching[batching])
+
+    batch_sizes = {}
+    candidates = defaultdict(list)
+    for row in rows:
+        if row['group'] != 'all' and row['rate'] == rate and \
+                (row['max_batch_size'], row['num_batch_threads'], row['batch_timeout_micros']) == batching:
+            candidates[row['group']].append(row)
+    for model, model_rows in candidates.items():
+        best = min(model_rows, key=lambda row: (not _sustains(row, slo), row['p99'] if row['p99'] is not None
+                                                else float('inf')))
+        batch_sizes[model] = best['batch_size']
+    return batching, batch_sizes, rate
+
+
+def format_batching_config(max_batch_size, num_batch_threads, batch_timeout_micros):
+    return ('max_batch_size {{ value: {} }}\n'
+            'batch_timeout_micros {{ value: {} }}\n'
+            'num_batch_threads {{ value: {} }}\n').format(max_batch_size, batch_timeout_micros, num_batch_threads)
+
+
+def write_recommendation(output_dir, batching, batch_sizes, rows, models_json):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'batching.config'), 'w') as f:
+        f.write(format_batching_config(*batching))
+    with open(models_json) as f:
+        models_cfg = json.load(f)
+    for cfg in models_cfg:
+        if cfg['model'] in batch_sizes:
+            cfg['batch_size'] = batch_sizes[cfg['model']]
+    with open(os.path.join(output_dir, 'models.json'), 'w') as f:
+        json.dump(models_cfg, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    with open(os.path.join(output_dir, 'curve.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, CURVE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def tune(requests, grid, rates, latency=0.0, per_token_latency=0.0, seed=42, log=print):
+    """
+    Replays the requests in-process against the stand-ins for every combination of the grid and every rate
+    :return: the curve rows
+    """
+    from benchmarks.run import mock_app
+
+    backends = {}
+    with mock_app(latency, per_token_latency, backends, tf_serving_workers=256) as app:
+        from app.model_settings import models
+        from app.models import T2TModel
+
+        tuned = [model for model in models.get_models() if isinstance(model, T2TModel)]
+
+        def models_of(res):
+            if '/models/' in res['path']:
+                names = [res['path'].split('/models/', 1)[1].split('/')[0]]
+            else:
+                names = [obj['model'].model for obj in models.get_model_list(res['src'], res['tgt'])]
+            return [name for name in names if name in {model.model for model in tuned}]
+
+        rows = []
+        for i, params in enumerate(grid):
+            max_batch_size, num_batch_threads, batch_timeout_micros, batch_size = params
+            backends['tf_serving'].configure_batching(max_batch_size, num_batch_threads, batch_timeout_micros)
+            for model in tuned:
+                model._batch_size = batch_size
+            for rate in rates:
+                results = replay(requests, app.test_client, rate=rate, seed=seed)
+                trial = curve_rows(params, rate, results, models_of)
+                rows += trial
+                total = next(row for row in trial if row['group'] == 'all')
+                log('[{}/{}] max_batch_size={} threads={} timeout_us={} batch_size={} rate={}: {:.1f} req/s, '
+                    'p99 {:.0f} ms, {} errors'.format(i + 1, len(grid), *params, rate, total['throughput'] or 0,
+                                                      (total['p99'] or 0) * 1000, total['errors']))
+        return rows
+
+
+def _ints(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('workload', help='a workload file, see benchmarks.replay export')
+    parser.add_argument('-o', '--output-dir', required=True)
+    parser.add_argument('--requests', type=int, default=200, help='replay a sample of this many requests')
+    parser.add_argument('--rates', default='5,10,20,40', help='requests/s to replay at')
+    parser.add_argument('--slo', type=float, default=2.0, help='p99 seconds a rate has to be sustained with')
+    parser.add_argument('--max-batch-sizes', default='8,16,32,64')
+    parser.add_argument('--batch-threads', default='1,2,4')
+    parser.add_argument('--batch-timeouts', default='0,2000,10000', help='batch_timeout_micros')
+    parser.add_argument('--batch-sizes', default='4,8,16,32', help='frontend batch sizes')
+    parser.add_argument('--latency', type=float, default=0.05, help='stand-in backend seconds per batch')
+    parser.add_argument('--per-token-latency', type=float, default=0.0002,
+                        help='stand-in backend seconds per token of the padded batch')
+    parser.add_argument('--models-json', default=os.path.join('app', 'models.json'))
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    requests = read_workload(args.workload)
+    if len(requests) > args.requests:
+        requests = random.Random(args.seed).sample(requests, args.requests)
+    grid = parameter_grid(_ints(args.max_batch_sizes), _ints(args.batch_threads), _ints(args.batch_timeouts),
+                          _ints(args.batch_sizes))
+    if not grid:
+        sys.exit('No batch size fits into the max batch sizes')
+    rows = tune(requests, grid, [float(rate) for rate in args.rates.split(',')], args.latency,
+                args.per_token_latency, args.seed, log=lambda line: print(line, file=sys.stderr))
+    batching, batch_sizes, rate = recommend(rows, args.slo)
+    write_recommendation(args.output_dir, batching, batch_sizes, rows, args.models_json)
+    print('max_batch_size={} num_batch_threads={} batch_timeout_micros={} sustain {} req/s with p99 <= {} s'.format(
+        *batching, rate, args.slo))
+    print('batch sizes: ' + ', '.join('{}={}'.format(model, size) for model, size in sorted(batch_sizes.items())))
+    print('written to ' + args.output_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Local stand-ins for the translation backends so that the frontend can be benchmarked without a GPU.
+Both echo their input back after sleeping `latency + per_token_latency * tokens` seconds.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+class BatchScheduler(object):
+    """
+    Server side batching the way tensorflow serving does it with --enable_batching and batching.config: the requests
+    are queued, each of the num_batch_threads threads (batches run at once) takes the oldest one and adds the following
+    ones as long as they fit into max_batch_size rows, waiting at most batch_timeout_micros for them, then runs them as
+    one batch. A request with more than max_batch_size rows is rejected, like tensorflow serving does.
+    """
+
+    def __init__(self, run, max_batch_size, num_batch_threads=1, batch_timeout_micros=0):
+        """
+        :param run: fn(rows) -> a result per row, the model
+        """
+        self.run = run
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout_micros / 1e6
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._loop, daemon=True) for _ in range(num_batch_threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, rows):
+        """
+        :return: the results of the rows, once their batch ran
+        """
+        if len(rows) > self.max_batch_size:
+            raise ValueError('Task size {} is larger than maximum batch size {}'.format(len(rows),
+                                                                                        self.max_batch_size))
+        future = Future()
+        with self._cond:
+            self._queue.append((rows, future))
+            self._cond.notify()
+        return future.result()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return None
+            batch = [self._queue.popleft()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.batch_timeout
+            while size < self.max_batch_size:
+                if self._queue:
+                    if size + len(self._queue[0][0]) > self.max_batch_size:
+                        break
+                    batch.append(self._queue.popleft())
+                    size += len(batch[-1][0])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                results = self.run([row for rows, _ in batch for row in rows])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for rows, future in batch:
+                future.set_result(results[start:start + len(rows)])
+                start += len(rows)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+class MockTFServing(object):
+    """
+    gRPC server implementing the tensorflow serving Predict API the way T2TModel uses it.
+    Outputs are the input ids (so the "translation" is the input text), scores are zeros.
+    """
+
+    def __init__(self, latency=0.0, per_token_latency=0.0, max_workers=16, port=0):
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.max_workers = max_workers
+        self.port = port
+        self._server = None
+        self._scheduler = None
+
+    @property
+    def address(self):
+        return 'localhost:{}'.format(self.port)
+
+    def start(self):
+        import grpc
+        from tensorflow_serving.apis import prediction_service_pb2_grpc
+
+        self._server = grpc.server(ThreadPoolExecutor(max_workers=self.max_workers))
+        prediction_service_pb2_grpc.add_PredictionServiceServicer_to_server(
+            _make_prediction_servicer(self), self._server)
+        self.port = self._server.add_insecure_port(self.address)
+        self._server.start()
+        log.info('Mock TF serving listening on %s', self.address)
+        return self
+
+    def stop(self):
+        self.configure_batching(None)
+        if self._server is not None:
+            self._server.stop(0)
+            self._server = None
+
+    def configure_batching(self, max_batch_size, num_batch_threads=1, batch_timeout_micros=0):
+        """
+        Batch the requests on the server like batching.config does, None to process every request on its own (and
+        all of them at once)
+        """
+        if self._scheduler is not None:
+            self._scheduler.stop()
+            self._scheduler = None
+        if max_batch_size:
+            self._scheduler = BatchScheduler(self._run_batch, max_batch_size, num_batch_threads,
+                                             batch_timeout_micros)
+
+    def _run_batch(self, batch_of_ids):
+        # a batch costs its padded size
+        time.sleep(self.latency + self.per_token_latency * len(batch_of_ids) * max(map(len, batch_of_ids), default=0))
+        return batch_of_ids
+
+    def process(self, batch_of_ids):
+        """
+        Simulate the model: sleep and echo
+        :param batch_of_ids: list of lists of input subword ids
+        :return: the outputs
+        """
+        if self._scheduler is not None:
+            return self._scheduler.submit(batch_of_ids)
+        time.sleep(self.latency + self.per_token_latency * sum(len(ids) for ids in batch_of_ids))
+        return batch_of_ids
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _make_prediction_servicer(mock):
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow_serving.apis import predict_pb2, prediction_service_pb2_grpc
+
+    class PredictionServicer(prediction_service_pb2_grpc.PredictionServiceServicer):
+
+        def Predict(self, request, context):
+            batch_of_ids = []
+            for serialized in request.inputs['input'].string_val:
+                example = tf.train.Example.FromString(serialized)
+                batch_of_ids.append(list(example.features.feature['inputs'].int64_list.value))
+            batch_of_ids = mock.process(batch_of_ids)
+            # pad with 0 (PAD); the decoder strips everything after EOS
+            outputs = np.zeros((len(batch_of_ids), max(map(len, batch_of_ids), default=0)), dtype=np.int64)
+            for i, ids in enumerate(batch_of_ids):
+                outputs[i, :len(ids)] = ids
+            response = predict_pb2.PredictResponse()
+            response.model_spec.name = request.model_spec.name
+            response.outputs['outputs'].CopyFrom(tf.make_tensor_proto(outputs))
+            response.outputs['scores'].CopyFrom(
+                tf.make_tensor_proto(np.zeros(len(batch_of_ids), dtype=np.float32)))
+            return response
+
+    return PredictionServicer()
+
+
+class MockMarianServer(object):
+    """
+    Websocket server speaking the marian-server protocol: a batch is a message with one sentence per line,
+    the reply has one translation per line.
+    """
+
+    def __init__(self, latency=0.0, per_token_latency=0.0, port=0):
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self):
+        return 'localhost:{}'.format(self.port)
+
+    def start(self):
+        from websockets.sync.server import serve
+
+        self._server = serve(self._handle, 'localhost', self.port)
+        self.port = self._server.socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        log.info('Mock marian-server listening on %s', self.address)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._server = None
+
+    def _handle(self, websocket):
+        for batch in websocket:
+            time.sleep(self.latency + self.per_token_latency * len(batch.split()))
+            websocket.send(batch)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+DOC_MODEL = 'en-cs-doc'
+
+
+def write_models_json(path, tf_serving_address, marian_address, models_json=None):
+    """
+    Copy of app/models.json with every model pointed to the stand-ins, plus a document level model
+    (DOC_MODEL) that is not part of the language graph.
+    :return: the list of model configs
+    """
+    models_json = models_json or os.path.join('app', 'models.json')
+    with open(models_json) as f:
+        models_cfg = json.load(f)
+    for cfg in models_cfg:
+        if cfg.get('model_framework') == 'marian':
+            cfg['server'] = marian_address
+        else:
+            cfg['server'] = tf_serving_address
+    en_cs = next(cfg for cfg in models_cfg if cfg['model'] == 'en-cs')
+    models_cfg.append(dict(en_cs, model=DOC_MODEL, model_framework='tensorflow_doclevel', default=False,
+                           include_in_graph=False, display='English->Czech document level'))
+    with open(path, 'w') as f:
+        json.dump(models_cfg, f, indent=2)
+    return models_cfg
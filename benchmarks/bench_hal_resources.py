@@ -0,0 +1,59 @@
+"""
+GET throughput of the HAL resources under /languages and /models with and without CACHE_RENDERED_RESOURCES.
+Run from the repository root (model paths in models.json are relative to it):
+
+    python -m benchmarks.bench_hal_resources -n 2000 -t 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.factory import create_app
+from app.model_settings import languages, models
+
+SCRIPT_NAMES = ['', '/services/translation']
+
+
+def urls():
+    yield '/api/v2/languages/'
+    yield '/api/v2/models/'
+    for lang in languages.languages:
+        yield '/api/v2/languages/{}'.format(lang)
+    for model in models.get_model_names():
+        yield '/api/v2/models/{}'.format(model)
+
+
+def run(app, requests, threads):
+    all_urls = list(urls())
+
+    def get(i):
+        client = app.test_client()
+        url = all_urls[i % len(all_urls)]
+        script_name = SCRIPT_NAMES[i % len(SCRIPT_NAMES)]
+        resp = client.get(script_name + url, headers={'X-Script-Name': script_name,
+                                                            'Accept': 'application/json'})
+        assert resp.status_code == 200, (url, resp.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(get, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('-t', '--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app()
+    for cached in (False, True):
+        app.config['CACHE_RENDERED_RESOURCES'] = cached
+        # warm up url_map, marshalling and (when enabled) the rendered variants
+        run(app, 100, 1)
+        rps = run(app, args.requests, args.threads)
+        print('CACHE_RENDERED_RESOURCES={}: {:.0f} req/s'.format(cached, rps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Per-batch cost of the debug logging in T2TModel._do_send_request: the former f-string with pformat of the batch
+versus the deferred Payload summary through the sampled batch logger, with DEBUG off and on. Run from the repository
+root:
+
+    python -m benchmarks.bench_logging -n 20000 --batch-size 20
+"""
+import argparse
+import io
+import logging
+import time
+from pprint import pformat
+
+import numpy as np
+
+from app.logging_utils import Payload, SampledLogger
+
+SENTENCE = 'The quick brown fox jumps over the lazy dog while the translation server is busy. '
+
+
+def old(log, batch):
+    log.debug(f"===== sending batch\n{pformat(batch)}\n")
+
+
+def new(batch_log, batch):
+    batch_log.debug("===== sending batch %s", Payload(batch))
+
+
+def time_per_batch(fn, logger, batch, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(logger, batch)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--batches', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=20)
+    args = parser.parse_args()
+
+    batch = np.array([SENTENCE * 2] * args.batch_size)
+    log = logging.getLogger('bench_logging')
+    log.propagate = False
+    log.addHandler(logging.StreamHandler(io.StringIO()))
+    batch_log = SampledLogger(log)
+
+    for level in (logging.INFO, logging.DEBUG):
+        log.setLevel(level)
+        print('{}:'.format(logging.getLevelName(level)))
+        print('  f-string + pformat:   {:8.2f} us/batch'.format(time_per_batch(old, log, batch, args.batches) * 1e6))
+        for every in (1, 100):
+            batch_log.configure(every)
+            per_batch = time_per_batch(new, batch_log, batch, args.batches)
+            print('  Payload, every {:3d}:  {:8.2f} us/batch'.format(every, per_batch * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Overhead of the tracing on the hot path: a single span without a trace, in an unsampled and in a sampled trace, and
+a whole request trace (start, spans, export to a file) as with TRACE_SAMPLE_RATE 0 and 1. Run from the repository root:
+
+    python -m benchmarks.bench_tracing -n 100000 --spans 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.tracing_utils import end_trace, span, start_trace
+
+
+def time_spans(n):
+    start = time.perf_counter()
+    for _ in range(n):
+        with span('batch', size=16):
+            pass
+    return (time.perf_counter() - start) / n
+
+
+def time_requests(n, spans, sample_rate, path):
+    start = time.perf_counter()
+    for _ in range(n):
+        start_trace(None, sample_rate)
+        for _ in range(spans):
+            with span('batch', size=16):
+                pass
+        end_trace(path, method='POST', path='/api/v2/languages/')
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--iterations', type=int, default=100000)
+    parser.add_argument('--spans', type=int, default=20, help='spans per request')
+    args = parser.parse_args()
+
+    print('span, no trace:        {:.2f} us'.format(time_spans(args.iterations) * 1e6))
+    start_trace(None, 0.0)
+    print('span, unsampled trace: {:.2f} us'.format(time_spans(args.iterations) * 1e6))
+    start_trace(None, 1.0)
+    print('span, sampled trace:   {:.2f} us'.format(time_spans(args.iterations) * 1e6))
+
+    requests = max(1, args.iterations // args.spans)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'traces.json')
+        for sample_rate in (0.0, 1.0):
+            per_request = time_requests(requests, args.spans, sample_rate, path)
+            print('request with {} spans, TRACE_SAMPLE_RATE={}: {:.1f} us'.format(args.spans, sample_rate,
+                                                                                  per_request * 1e6))
+        print('trace file: {:.1f} kB per sampled request'.format(os.path.getsize(path) / requests / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Replay recorded production traffic.
+
+    # sample 10 % of the access log into an anonymised workload
+    python -m benchmarks.replay export --db app/db/database.db --sample 0.1 -o workload.jsonl
+    # replay it against a running instance at the recorded pace (or twice as fast with --speedup 2)
+    python -m benchmarks.replay replay workload.jsonl --url http://localhost:5000 -o build_a.jsonl
+    # ... or in-process against the stand-in backends, with Poisson arrivals at 20 req/s
+    python -m benchmarks.replay replay workload.jsonl --mock --rate 20 -o build_b.jsonl
+    # compare the latency distributions of two builds
+    python -m benchmarks.replay compare build_a.jsonl build_b.jsonl
+
+The workload format is described in benchmarks/workloads.py. The arrivals are open loop: requests are sent at their
+scheduled time no matter how many are still in flight and the latency is measured from the scheduled time, so a slow
+build can't hide its queueing delay by sending less.
+"""
+import argparse
+import bisect
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.stats_utils import summarize
+from benchmarks.workloads import SENTENCES, make_document, read_workload, send, write_workload
+
+_word = re.compile(r'\w+')
+
+
+class Anonymizer(object):
+    """
+    Replaces every word with a pseudo-word of the same length, case and script, keeping whitespace, punctuation and
+    digits in place, so that sentence splitting and input lengths stay realistic. The same word always maps to the
+    same pseudo-word (keyed by a secret), which keeps repetitions in the traffic.
+    """
+
+    def __init__(self, key, alphabets):
+        """
+        :param key: secret bytes
+        :param alphabets: {lang: lowercase letters to draw from}
+        """
+        self.key = key
+        self.alphabets = alphabets
+
+    def _pseudo_word(self, word, alphabet):
+        digest = hmac.new(self.key, word.lower().encode('utf-8'), hashlib.sha256).digest()
+        rnd = random.Random(digest)
+        out = []
+        for c in word:
+            if c.isdigit():
+                out.append(c)
+            else:
+                replacement = rnd.choice(alphabet)
+                out.append(replacement.upper() if c.isupper() else replacement)
+        return ''.join(out)
+
+    def anonymize(self, text, lang):
+        alphabet = self.alphabets.get(lang) or 'abcdefghijklmnopqrstuvwxyz'
+        return _word.sub(lambda m: self._pseudo_word(m.group(0), alphabet), text)
+
+
+def collect_alphabets(texts_by_lang):
+    return {lang: ''.join(sorted({c for text in texts for c in text.lower() if c.isalpha()}))
+            for lang, texts in texts_by_lang.items()}
+
+
+def fit_length(text, length):
+    """
+    Repeat or cut the text to `length` characters
+    """
+    if not text:
+        return text
+    while len(text) < length:
+        text = text + ' ' + text
+    return text[:length]
+
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def export_workload(db_path, sample=1.0, since=None, limit=None, seed=42, key=None):
+    """
+    Build a workload out of the access table. The texts are anonymised inputs from the translations table (only
+    filled in for requests with logInput) of the same source language and similar length, synthetic text
+    otherwise.
+    """
+    rnd = random.Random(seed)
+    db = sqlite3.connect(db_path)
+    texts_by_lang = defaultdict(list)
+    for src_lang, src in db.execute('SELECT src_lang, src FROM translations WHERE src IS NOT NULL'):
+        texts_by_lang[src_lang].append(src)
+    anonymizer = Anonymizer(key or os.urandom(32), collect_alphabets(texts_by_lang))
+    pools = {}
+    for lang, texts in texts_by_lang.items():
+        anonymized = sorted((anonymizer.anonymize(text, lang) for text in texts), key=len)
+        pools[lang] = ([len(text) for text in anonymized], anonymized)
+
+    query = 'SELECT src_lang, tgt_lang, input_nfc_len, frontend, input_type, inserted FROM access'
+    params = ()
+    if since:
+        query += ' WHERE inserted >= ?'
+        params = (since,)
+    query += ' ORDER BY inserted'
+
+    requests = []
+    first = None
+    for src_lang, tgt_lang, input_nfc_len, frontend, input_type, inserted in db.execute(query, params):
+        if rnd.random() >= sample:
+            continue
+        length = max(input_nfc_len or 1, 1)
+        if src_lang in pools:
+            lengths, texts = pools[src_lang]
+            i = min(bisect.bisect_left(lengths, length), len(texts) - 1)
+            text = fit_length(texts[i], length)
+        else:
+            text = fit_length(make_document(rnd, src_lang if src_lang in SENTENCES else 'en', length * 4), length)
+        inserted = _parse_time(inserted)
+        first = first or inserted
+        requests.append({
+            'path': '/api/v2/languages/',
+            'src': src_lang,
+            'tgt': tgt_lang,
+            'text': text,
+            'upload': input_type == 'file',
+            'input_type': input_type or 'keyboard',
+            'frontend': frontend or 'unknown',
+            # inserted has a resolution of seconds, spread the requests within the second
+            'offset': (inserted - first).total_seconds() + rnd.random(),
+        })
+        if limit and len(requests) >= limit:
+            break
+    return sorted(requests, key=lambda req: req['offset'])
+
+
+class HttpClient(object):
+    """
+    Gives requests.Session the flask test client interface benchmarks.workloads.send uses
+    """
+
+    def __init__(self, base_url, timeout):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def post(self, path, data, query_string=None, headers=None):
+        files = {k: v for k, v in data.items() if isinstance(v, tuple)}
+        form = {k: v for k, v in data.items() if not isinstance(v, tuple)}
+        return self.session.post(self.base_url + path, data=form, files=files or None, params=query_string,
+                                 headers=headers, timeout=self.timeout)
+
+
+def schedule(requests, rate=None, speedup=1.0, seed=42):
+    """
+    :return: seconds since start at which each request is to be sent; recorded offsets divided by speedup or
+    Poisson arrivals with the given rate
+    """
+    if rate:
+        rnd = random.Random(seed)
+        at = 0.0
+        offsets = []
+        for _ in requests:
+            offsets.append(at)
+            at += rnd.expovariate(rate)
+        return offsets
+    return [req.get('offset', 0.0) / speedup for req in requests]
+
+
+def replay(requests, make_client, rate=None, speedup=1.0, max_in_flight=256, seed=42):
+    """
+    Open loop replay
+    :param make_client: called once per sending thread
+    :return: one result dict per request
+    """
+    local = threading.local()
+    offsets = schedule(requests, rate, speedup, seed)
+
+    def one(req, scheduled):
+        if not hasattr(local, 'client'):
+            local.client = make_client()
+        try:
+            status = send(local.client, req)
+        except Exception as e:
+            status = type(e).__name__
+        return {
+            'scheduled': scheduled - start,
+            'latency': time.perf_counter() - scheduled,
+            'status': status,
+            'path': req['path'],
+            'src': req['src'],
+            'tgt': req['tgt'],
+            'input_len': len(req['text']),
+            'input_type': req.get('input_type', 'keyboard'),
+        }
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        start = time.perf_counter()
+        for req, offset in zip(requests, offsets):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(one, req, scheduled))
+    return [f.result() for f in futures]
+
+
+SIZE_BUCKETS = [(0, 100, '<100'), (100, 1000, '100-1k'), (1000, 10000, '1k-10k'), (10000, sys.maxsize, '10k+')]
+
+
+def _groups(results):
+    groups = defaultdict(list)
+    for res in results:
+        if res['status'] != 200:
+            continue
+        groups['all'].append(res['latency'])
+        groups['input_type=' + res['input_type']].append(res['latency'])
+        for low, high, name in SIZE_BUCKETS:
+            if low <= res['input_len'] < high:
+                groups['chars ' + name].append(res['latency'])
+    return groups
+
+
+def compare(results_a, results_b, threshold=0.1):
+    """
+    :return: (report lines, True if build b's p99 is more than threshold worse than a's in any group)
+    """
+    groups_a, groups_b = _groups(results_a), _groups(results_b)
+    lines = ['{:<20} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+        'group', 'n a', 'n b', 'p50 a', 'p50 b', 'p90 a', 'p90 b', 'p99 a', 'p99 b', 'p99 b/a')]
+    regression = False
+    for group in sorted(set(groups_a) | set(groups_b)):
+        a, b = summarize(groups_a.get(group, [])), summarize(groups_b.get(group, []))
+        ratio = b['p99'] / a['p99'] if a['p99'] and b['p99'] else None
+        if ratio and ratio > 1 + threshold:
+            regression = True
+        ms = lambda v: '{:>9.1f}'.format(v * 1000) if v is not None else '{:>9}'.format('-')
+        lines.append('{:<20} {:>7} {:>7} {} {} {} {} {} {} {:>8}'.format(
+            group, a['count'], b['count'], ms(a['p50']), ms(b['p50']), ms(a['p90']), ms(b['p90']), ms(a['p99']),
+            ms(b['p99']), '{:.2f}'.format(ratio) if ratio else '-'))
+    errors_a = sum(1 for res in results_a if res['status'] != 200)
+    errors_b = sum(1 for res in results_b if res['status'] != 200)
+    lines.append('errors: a={} b={}'.format(errors_a, errors_b))
+    return lines, regression
+
+
+def _read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='sample the sqlite access log into a workload file')
+    export.add_argument('--db', required=True)
+    export.add_argument('-o', '--output', required=True)
+    export.add_argument('--sample', type=float, default=1.0, help='fraction of requests to keep')
+    export.add_argument('--since', help='only requests inserted after this (YYYY-MM-DD)')
+    export.add_argument('--limit', type=int)
+    export.add_argument('--seed', type=int, default=42)
+
+    rep = commands.add_parser('replay', help='replay a workload file')
+    rep.add_argument('workload')
+    target = rep.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base url of a running instance, e.g. http://localhost:5000')
+    target.add_argument('--mock', action='store_true', help='in-process app against the stand-in backends')
+    rep.add_argument('--latency', type=float, default=0.0, help='stand-in backend seconds per batch')
+    rep.add_argument('--per-token-latency', type=float, default=0.0, help='stand-in backend seconds per token')
+    rep.add_argument('--rate', type=float, help='Poisson arrivals with this many requests/s instead of the '
+                                                'recorded timing')
+    rep.add_argument('--speedup', type=float, default=1.0, help='compress the recorded timing')
+    rep.add_argument('--max-in-flight', type=int, default=256)
+    rep.add_argument('--timeout', type=float, default=600)
+    rep.add_argument('-o', '--output', required=True, help='results (jsonl)')
+
+    cmp = commands.add_parser('compare', help='compare latency distributions of two replays')
+    cmp.add_argument('a')
+    cmp.add_argument('b')
+    cmp.add_argument('--threshold', type=float, default=0.1, help='exit with 1 when a p99 of b is worse than '
+                                                                  'a by more than this')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        requests = export_workload(args.db, args.sample, args.since, args.limit, args.seed)
+        write_workload(args.output, requests)
+        print('exported {} requests'.format(len(requests)))
+    elif args.command == 'replay':
+        requests = read_workload(args.workload)
+        if args.url:
+            results = replay(requests, lambda: HttpClient(args.url, args.timeout), args.rate, args.speedup,
+                             args.max_in_flight)
+        else:
+            from benchmarks.run import mock_app
+            with mock_app(args.latency, args.per_token_latency) as app:
+                results = replay(requests, app.test_client, args.rate, args.speedup, args.max_in_flight)
+        write_workload(args.output, results)
+        latency = summarize([res['latency'] for res in results if res['status'] == 200])
+        print('{} requests, {} errors, latency ms p50={:.1f} p90={:.1f} p99={:.1f}'.format(
+            len(results), sum(1 for res in results if res['status'] != 200),
+            *((latency[p] or 0) * 1000 for p in ('p50', 'p90', 'p99'))))
+    else:
+        lines, regression = compare(_read_results(args.a), _read_results(args.b), args.threshold)
+        print('\n'.join(lines))
+        sys.exit(1 if regression else 0)
+
+
+if __name__ == '__main__':
+    main()
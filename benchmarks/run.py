@@ -0,0 +1,190 @@
+"""
+Benchmark the translation frontend against local stand-in backends (no GPU needed).
+Starts a mock TF serving (gRPC) and a mock marian-server (websocket), points a copy of models.json at them and
+drives the flask app in-process with the synthetic workloads. Run from the repository root:
+
+    python -m benchmarks.run -w ui -w upload -n 200 -c 4 --latency 0.02 --per-token-latency 0.0001
+
+Reports throughput, p50/p99 latency and CPU time per request split into stages
+(preprocess = extract_blocks_of_text, backend = send_blocks_to_backend, postprocess = reconstruct_formatting).
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from app.stats_utils import summarize
+from benchmarks.backends import MockMarianServer, MockTFServing, write_models_json
+from benchmarks.workloads import WORKLOADS, make_workload, send
+
+STAGES = {
+    'extract_blocks_of_text': 'preprocess',
+    'send_blocks_to_backend': 'backend',
+    'reconstruct_formatting': 'postprocess',
+}
+
+
+class StageTimer(object):
+    """
+    Accumulates thread CPU time of the wrapped methods per thread, so that it can be attributed to the request
+    the thread is currently processing.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def wrap(self, stage, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current()[stage] += time.thread_time() - start
+        return timed
+
+    def current(self):
+        if not hasattr(self._local, 'stages'):
+            self._local.stages = defaultdict(float)
+        return self._local.stages
+
+    def reset(self):
+        self._local.stages = defaultdict(float)
+
+
+def instrument(models, timer):
+    for model in models.get_models():
+        for method, stage in STAGES.items():
+            setattr(model, method, timer.wrap(stage, getattr(model, method)))
+
+
+def drive(app, requests, concurrency, timer):
+    """
+    Closed loop: `concurrency` threads send the requests as fast as they can
+    """
+    def one(req):
+        client = app.test_client()
+        timer.reset()
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        status = send(client, req)
+        latency = time.perf_counter() - start
+        stages = dict(timer.current())
+        stages['request'] = time.thread_time() - cpu_start
+        return status, latency, stages
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, requests))
+    wall = time.perf_counter() - start
+
+    latencies = [latency for status, latency, _ in results if status == 200]
+    cpu = defaultdict(float)
+    for _, _, stages in results:
+        for stage, secs in stages.items():
+            cpu[stage] += secs
+    return {
+        'requests': len(requests),
+        'errors': sum(1 for status, _, _ in results if status != 200),
+        'rate_limited': sum(1 for status, _, _ in results if status == 429),
+        'concurrency': concurrency,
+        'throughput': len(requests) / wall,
+        # texts translated per second, a batch request has many
+        'text_throughput': sum(len(req.get('texts') or [None]) for req in requests) / wall,
+        'latency': summarize(latencies),
+        'cpu_per_request': {stage: secs / len(requests) for stage, secs in cpu.items()},
+    }
+
+
+@contextmanager
+def mock_app(latency=0.0, per_token_latency=0.0, backends=None, tf_serving_workers=16):
+    """
+    The flask app with all models served by the stand-in backends and a temporary database
+    :param backends: a dict to fill with the stand-ins ('tf_serving', 'marian'), e.g. to reconfigure them between runs
+    :param tf_serving_workers: requests the tf serving stand-in takes at once
+    """
+    if 'app.model_settings' in sys.modules:
+        raise RuntimeError('app.model_settings was already imported, models.json can\'t be swapped for the '
+                           'benchmark one')
+    with MockTFServing(latency, per_token_latency, max_workers=tf_serving_workers) as tf_serving, \
+            MockMarianServer(latency, per_token_latency) as marian, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        if backends is not None:
+            backends.update(tf_serving=tf_serving, marian=marian)
+        os.environ['MODELS_JSON'] = os.path.join(tmp_dir, 'models.json')
+        write_models_json(os.environ['MODELS_JSON'], tf_serving.address, marian.address)
+        # import only now, models are loaded from MODELS_JSON at import time
+        from app.db import init_db
+        from app.factory import create_app
+
+        app = create_app()
+        app.config['DATABASE'] = os.path.join(tmp_dir, 'database.db')
+        # all the simulated clients are one peer, they would share a bucket and measure 429s
+        app.config['RATE_LIMIT'] = False
+        with app.app_context():
+            init_db()
+        yield app
+
+
+def run_benchmarks(workloads, requests=100, concurrency=4, latency=0.0, per_token_latency=0.0, seed=42):
+    """
+    :return: {workload name: results}
+    """
+    with mock_app(latency, per_token_latency) as app:
+        from app.model_settings import models
+        timer = StageTimer()
+        instrument(models, timer)
+
+        results = {}
+        for name in workloads:
+            workload = make_workload(name, requests, seed)
+            # warm up connections, sentence splitters etc.
+            drive(app, workload[:concurrency], concurrency, timer)
+            results[name] = drive(app, workload, concurrency, timer)
+        return results
+
+
+def format_results(results):
+    stages = ['request'] + list(STAGES.values())
+    lines = ['{:<8} {:>6} {:>5} {:>8} {:>8} {:>9} {:>9}  cpu ms/req: {}'.format(
+        'workload', 'reqs', 'conc', 'req/s', 'texts/s', 'p50 ms', 'p99 ms',
+        ' '.join('{:>11}'.format(s) for s in stages))]
+    for name, res in results.items():
+        cpu = res['cpu_per_request']
+        lines.append('{:<8} {:>6} {:>5} {:>8.1f} {:>8.1f} {:>9.1f} {:>9.1f}              {}{}'.format(
+            name, res['requests'], res['concurrency'], res['throughput'], res['text_throughput'],
+            (res['latency']['p50'] or 0) * 1000, (res['latency']['p99'] or 0) * 1000,
+            ' '.join('{:>11.2f}'.format(cpu.get(s, 0) * 1000) for s in stages),
+            '  ({} errors)'.format(res['errors']) if res['errors'] else ''))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-w', '--workload', action='append', choices=sorted(WORKLOADS),
+                        help='can be repeated, defaults to all')
+    parser.add_argument('-n', '--requests', type=int, default=100, help='requests per workload')
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='backend seconds per batch')
+    parser.add_argument('--per-token-latency', type=float, default=0.0, help='backend seconds per token')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.workload or sorted(WORKLOADS), args.requests, args.concurrency, args.latency,
+                             args.per_token_latency, args.seed)
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Synthetic workloads and the code that sends a workload request to the app.
+
+A workload request is a dict (one json object per line when stored in a file):
+    path        url path of the endpoint, e.g. /api/v2/languages/ or /api/v2/models/en-cs
+    src, tgt    language codes (query params)
+    text        the input_text
+    texts       instead of text, a list of texts sent as {"texts": [...]} to a /models/<model>/batch endpoint
+    upload      send text as a text/plain file instead of a form field
+    input_type  inputType form field (keyboard, file, ...)
+    frontend    X-Frontend header
+    offset      seconds since the start of the workload when the request should be sent (used by replay)
+"""
+import io
+import json
+import random
+
+from benchmarks.backends import DOC_MODEL
+
+SENTENCES = {
+    'en': [
+        'The committee approved the proposal on Tuesday.',
+        'Dr. Smith will present the results at 10 a.m. in room 4.',
+        'Prices rose by 3.5 % compared to last year, e.g. for energy and food.',
+        'Can you send me the report before the meeting?',
+        'The new bridge, which cost over 2 billion, opened to traffic yesterday.',
+        'She said: "We are not going to give up."',
+        'Click Save to keep your changes.',
+    ],
+    'cs': [
+        'Výbor návrh schválil v úterý.',
+        'Prof. Novák představí výsledky v 10 hod. v místnosti č. 4.',
+        'Ceny vzrostly o 3,5 % oproti loňskému roku, např. u energií a potravin.',
+        'Můžete mi poslat zprávu před schůzkou?',
+        'Nový most, který stál přes 2 miliardy, byl včera otevřen pro dopravu.',
+        'Řekla: „Nevzdáme se.“',
+        'Kliknutím na Uložit změny zachováte.',
+    ],
+    'de': [
+        'Der Ausschuss hat den Vorschlag am Dienstag angenommen.',
+        'Dr. Müller stellt die Ergebnisse um 10 Uhr in Raum Nr. 4 vor.',
+        'Die Preise stiegen um 3,5 % gegenüber dem Vorjahr, z. B. bei Energie.',
+        'Können Sie mir den Bericht vor der Besprechung schicken?',
+        'Die neue Brücke wurde gestern für den Verkehr freigegeben.',
+    ],
+    'fr': [
+        'Le comité a approuvé la proposition mardi.',
+        'M. Dupont présentera les résultats à 10 h dans la salle 4.',
+        'Les prix ont augmenté de 3,5 % par rapport à l\'an dernier.',
+        'Pouvez-vous m\'envoyer le rapport avant la réunion ?',
+        'Le nouveau pont a été ouvert à la circulation hier.',
+    ],
+    'ru': [
+        'Комитет одобрил предложение во вторник.',
+        'Проф. Иванов представит результаты в 10 ч. в комнате № 4.',
+        'Цены выросли на 3,5 % по сравнению с прошлым годом.',
+        'Можете ли вы прислать мне отчёт до встречи?',
+        'Новый мост вчера открыли для движения.',
+    ],
+}
+
+UI_STRINGS = ['Save', 'Cancel', 'Open file', 'Settings', 'Log out', 'Add to cart', 'Show more results',
+              'Your password has expired', 'Search']
+
+# pairs that translate directly and pairs that need two hops through en
+DIRECT_PAIRS = [('en', 'cs'), ('cs', 'en'), ('de', 'cs'), ('cs', 'de'), ('en', 'fr'), ('en', 'ru')]
+PIVOT_PAIRS = [('cs', 'fr'), ('fr', 'cs'), ('de', 'ru'), ('ru', 'de'), ('cs', 'hi')]
+
+# MAX_CONTENT_LENGTH is 100 KB including the multipart envelope
+UPLOAD_BYTES = 98 * 1024
+
+
+def make_document(rnd, lang, max_bytes, sentences_per_paragraph=(1, 8)):
+    paragraphs = []
+    size = 0
+    while True:
+        paragraph = ' '.join(rnd.choice(SENTENCES[lang]) for _ in range(rnd.randint(*sentences_per_paragraph)))
+        size += len(paragraph.encode('utf-8')) + 1
+        if size > max_bytes:
+            break
+        paragraphs.append(paragraph)
+    return '\n'.join(paragraphs) or SENTENCES[lang][0]
+
+
+def _request(path, src, tgt, text, upload=False, input_type='keyboard'):
+    return {'path': path, 'src': src, 'tgt': tgt, 'text': text, 'upload': upload, 'input_type': input_type,
+            'frontend': 'benchmark', 'offset': 0.0}
+
+
+def ui_workload(rnd):
+    src, tgt = rnd.choice([pair for pair in DIRECT_PAIRS if pair[0] == 'en'])
+    return _request('/api/v2/languages/', src, tgt, rnd.choice(UI_STRINGS))
+
+
+def upload_workload(rnd):
+    src, tgt = rnd.choice(DIRECT_PAIRS)
+    return _request('/api/v2/languages/', src, tgt, make_document(rnd, src, UPLOAD_BYTES), upload=True,
+                    input_type='file')
+
+
+def pivot_workload(rnd):
+    src, tgt = rnd.choice(PIVOT_PAIRS)
+    return _request('/api/v2/languages/', src, tgt, make_document(rnd, src, 2 * 1024, (1, 4)))
+
+
+def doc_workload(rnd):
+    return _request('/api/v2/models/' + DOC_MODEL, 'en', 'cs', make_document(rnd, 'en', 8 * 1024))
+
+
+def ui_batch_workload(rnd):
+    req = _request('/api/v2/models/en-cs/batch', 'en', 'cs', None)
+    req['texts'] = [rnd.choice(UI_STRINGS) for _ in range(100)]
+    return req
+
+
+WORKLOADS = {
+    'ui': ui_workload,
+    'upload': upload_workload,
+    'pivot': pivot_workload,
+    'doc': doc_workload,
+    'ui_batch': ui_batch_workload,
+}
+
+
+def make_workload(name, count, seed=42):
+    rnd = random.Random(seed)
+    return [WORKLOADS[name](rnd) for _ in range(count)]
+
+
+def read_workload(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_workload(path, requests):
+    with open(path, 'w', encoding='utf-8') as f:
+        for req in requests:
+            f.write(json.dumps(req, ensure_ascii=False) + '\n')
+
+
+def send(client, req):
+    """
+    POST the request with a flask test client
+    :return: the status code
+    """
+    if req.get('texts'):
+        resp = client.post(req['path'], json={'texts': req['texts']},
+                           query_string={'src': req['src'], 'tgt': req['tgt']},
+                           headers={'Accept': 'application/json', 'X-Frontend': req.get('frontend', 'benchmark')})
+        return resp.status_code
+    if req.get('upload'):
+        data = {'input_text': (io.BytesIO(req['text'].encode('utf-8')), 'upload.txt', 'text/plain')}
+    else:
+        data = {'input_text': req['text']}
+    data['inputType'] = req.get('input_type', 'keyboard')
+    resp = client.post(req['path'], data=data, query_string={'src': req['src'], 'tgt': req['tgt']},
+                       headers={'Accept': 'application/json', 'X-Frontend': req.get('frontend', 'benchmark')})
+    return resp.status_code
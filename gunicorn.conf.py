@@ -0,0 +1,35 @@
+# gunicorn -c gunicorn.conf.py uwsgi:app
+#
+# The app (models, vocabularies, sentence splitters) is loaded once in the master and the workers share its memory
+# copy-on-write. A page stays shared until somebody writes to it; the cyclic garbage collector writes to every object
+# it visits, so the objects loaded in the master are moved out of its reach (gc.freeze) before forking.
+# Compare /api/v2/admin/memory (uss = memory private to the worker) with and without preload_app.
+import gc
+
+bind = '0.0.0.0:5000'
+worker_class = 'sync'
+workers = 12
+timeout = 500
+preload_app = True
+
+# no collections while the app is loaded, they would only leave holes in the pages that are about to be shared
+gc.disable()
+
+
+def when_ready(server):
+    gc.freeze()
+    gc.enable()
+
+
+def pre_fork(server, worker):
+    # whatever the master allocated since, e.g. before respawning a worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.resource_utils import record_baseline
+    record_baseline()
+    # the worker answers /ready with 503 until it warmed up the models
+    from app.model_settings import models
+    from app.warmup_utils import warmup
+    warmup.start(server.app.wsgi(), models.get_models())
@@ -1,3 +1,11 @@
+import functools
+import os
+import sys
+import time
+
+import click
+from flask import g
+
 from uwsgi import app
 
 
@@ -8,3 +16,103 @@ from uwsgi import app
 def init_db_command():
     from app.db import init_db
     init_db()
+
+
+def _init_corpus_worker(flask_app):
+    # the backend clients read the app config and clear the session on errors; the batches share the slots of the
+    # batch class with the batch requests served on this host and wait for them as long as it takes
+    flask_app.test_request_context().push()
+    g.priority_class = 'batch'
+    g.admitted = True
+
+
+@app.cli.command("translate-corpus")
+@click.option('--src', required=True, help='source language')
+@click.option('--tgt', required=True, help='target language')
+@click.option('--model', help='translate with this model instead of the route from src to tgt')
+@click.option('--chunk-lines', default=1000, show_default=True, help='lines a worker translates at once')
+@click.option('--in-flight', default=4, show_default=True,
+              help='worker processes; each sends its backend batches one after another')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='defaults to OUTPUT.checkpoint')
+@click.argument('input_path', metavar='INPUT', default='-', type=click.Path(dir_okay=False, allow_dash=True))
+@click.argument('output_path', metavar='OUTPUT', default='-', type=click.Path(dir_okay=False, allow_dash=True))
+def translate_corpus_command(src, tgt, model, chunk_lines, in_flight, checkpoint, input_path, output_path):
+    """
+    Translates INPUT (a file, - for stdin) line by line into OUTPUT (a file, - for stdout). A run that was
+    interrupted continues from its checkpoint when started again with the same arguments; writing to stdout is not
+    checkpointed.
+    """
+    from app.corpus_utils import Checkpoint, corpus_lines, read_chunks, translate_corpus
+    from app.main.translate import get_route, translate_lines
+
+    try:
+        get_route(src, tgt, model)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if output_path == '-':
+        checkpoint = None
+    params = {'src': src, 'tgt': tgt, 'model': model,
+              'input': input_path if input_path == '-' else os.path.abspath(input_path)}
+    state = Checkpoint(checkpoint or (None if output_path == '-' else output_path + '.checkpoint'), params)
+    try:
+        resumed = state.load()
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if resumed:
+        click.echo('Resuming after {} lines'.format(state.lines), err=True)
+        output = open(output_path, 'r+b')
+        # drop whatever was written after the checkpoint
+        output.truncate(state.offset)
+        output.seek(state.offset)
+    else:
+        output = sys.stdout.buffer if output_path == '-' else open(output_path, 'wb')
+    stream = sys.stdin.buffer if input_path == '-' else open(input_path, 'rb')
+    try:
+        translate_corpus(read_chunks(corpus_lines(stream), chunk_lines, skip=state.lines),
+                         functools.partial(translate_lines, src, tgt, model_name=model), output, state,
+                         in_flight=in_flight, initializer=_init_corpus_worker, initargs=(app,),
+                         progress=lambda lines: click.echo('{} lines'.format(lines), err=True))
+    finally:
+        output.flush()
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+    state.remove()
+
+
+def _format_secs(value):
+    return '-' if value is None else '{:.0f} ms'.format(value * 1000)
+
+
+def _format_ratio(value):
+    return '-' if value is None else '{:.2f}'.format(value)
+
+
+@app.cli.command("shadow-report")
+@click.option('--model', help='only this model')
+@click.option('--hours', type=float, help='only the batches of the last hours')
+def shadow_report_command(model, hours):
+    """
+    Compares the candidate backends ("shadow" in models.json) with the models' backends on the mirrored batches:
+    batch latencies of both, and per batch the latency and output length of the candidate relative to the model's
+    """
+    from app.shadow_utils import shadow
+
+    report = shadow.report(model, time.time() - hours * 3600 if hours else None)
+    if not report:
+        click.echo('No mirrored batches in ' + shadow.database)
+    for entry in report:
+        click.echo('{model} -> {server}: {batches} batches, {sentences} sentences, {failed} failed'.format(**entry))
+        for error, count in entry['errors'][:3]:
+            click.echo('  {}x {}'.format(count, error))
+        click.echo('  {:<24}{:>10}{:>10}{:>10}{:>10}'.format('', 'p50', 'p90', 'p99', 'max'))
+        for label, key, fmt in [('model latency', 'primary_secs', _format_secs),
+                                ('candidate latency', 'shadow_secs', _format_secs),
+                                ('latency ratio', 'latency_ratio', _format_ratio)]:
+            click.echo('  {:<24}{:>10}{:>10}{:>10}{:>10}'.format(label, *(fmt(entry[key][p])
+                                                                         for p in ('p50', 'p90', 'p99', 'max'))))
+        length = entry['length_ratio']
+        click.echo('  {:<24}{:>10}{:>10}{:>10}{:>10}'.format('', 'min', 'p10', 'p50', 'p90'))
+        click.echo('  {:<24}{:>10}{:>10}{:>10}{:>10}'.format('output length ratio', *(
+            _format_ratio(length[p]) for p in ('min', 'p10', 'p50', 'p90'))))
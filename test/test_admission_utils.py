@@ -0,0 +1,49 @@
+import tempfile
+import threading
+import unittest
+
+from app.admission_utils import AdmissionController, AdmissionRejected, classify
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.controller = AdmissionController()
+        self.controller.configure(self.tmp_dir.name, {'interactive': {'slots': 1, 'deadline': 5},
+                                                      'document': {'slots': 1, 'deadline': 0.1}})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_rejects_after_deadline(self):
+        with self.controller.slot('document'):
+            with self.assertRaises(AdmissionRejected) as cm:
+                with self.controller.slot('document'):
+                    pass
+            self.assertGreaterEqual(cm.exception.retry_after, 1)
+            # the other classes have their own slots
+            with self.controller.slot('interactive'):
+                self.assertEqual(self.controller.slots_in_use('interactive'), 1)
+        metrics = self.controller.metrics()['document']
+        self.assertEqual((metrics['admitted'], metrics['rejected'], metrics['slots_in_use']), (1, 1, 0))
+
+    def test_waits_for_a_free_slot(self):
+        released = threading.Event()
+
+        def hold():
+            with self.controller.slot('interactive'):
+                released.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        threading.Timer(0.1, released.set).start()
+        with self.controller.slot('interactive'):
+            self.assertTrue(released.is_set())
+        thread.join()
+
+    def test_classify(self):
+        self.assertEqual(classify(False, 'keyboard', 'web', 20, 2000, ()), 'interactive')
+        self.assertEqual(classify(False, 'keyboard', 'web', 5000, 2000, ()), 'document')
+        self.assertEqual(classify(True, 'file', 'web', 20, 2000, ()), 'document')
+        self.assertEqual(classify(False, 'keyboard', 'crawler', 20, 2000, ('crawler',)), 'batch')
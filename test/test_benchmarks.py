@@ -0,0 +1,67 @@
+import importlib.util
+import unittest
+
+_REQUIRED = ['tensorflow', 'tensor2tensor', 'tensorflow_serving', 'grpc', 'websockets']
+_MISSING = [module for module in _REQUIRED if importlib.util.find_spec(module) is None]
+
+
+@unittest.skipIf(_MISSING, 'benchmarks need {}'.format(', '.join(_MISSING)))
+class TestBenchmarks(unittest.TestCase):
+
+    def test_all_workloads_against_mock_backends(self):
+        from benchmarks.run import run_benchmarks
+        from benchmarks.workloads import WORKLOADS
+
+        results = run_benchmarks(sorted(WORKLOADS), requests=4, concurrency=2, latency=0.001)
+        self.assertEqual(set(results), set(WORKLOADS))
+        for name, res in results.items():
+            self.assertEqual(res['errors'], 0, name)
+            self.assertEqual(res['rate_limited'], 0, name)
+            self.assertGreater(res['throughput'], 0, name)
+
+
+class TestBatchScheduler(unittest.TestCase):
+
+    def test_merges_queued_requests(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from benchmarks.backends import BatchScheduler
+
+        batches = []
+
+        def run(rows):
+            batches.append(len(rows))
+            return [row * 2 for row in rows]
+
+        scheduler = BatchScheduler(run, max_batch_size=4, batch_timeout_micros=50000)
+        try:
+            with ThreadPoolExecutor(3) as executor:
+                results = list(executor.map(scheduler.submit, [[1], [2, 3], [4]]))
+            self.assertEqual(results, [[2], [4, 6], [8]])
+            self.assertEqual(sum(batches), 4)
+            self.assertLess(len(batches), 3)
+            self.assertRaises(ValueError, scheduler.submit, [1] * 5)
+        finally:
+            scheduler.stop()
+
+
+class TestAutotune(unittest.TestCase):
+
+    def test_recommend(self):
+        from benchmarks.autotune import parameter_grid, recommend
+
+        self.assertEqual(parameter_grid([8, 16], [1], [0], [8, 16]), [(8, 1, 0, 8), (16, 1, 0, 8), (16, 1, 0, 16)])
+
+        def row(max_batch_size, batch_size, rate, group, p99, errors=0):
+            return {'max_batch_size': max_batch_size, 'num_batch_threads': 1, 'batch_timeout_micros': 0,
+                    'batch_size': batch_size, 'rate': rate, 'group': group, 'errors': errors, 'p99': p99}
+
+        rows = [
+            # 8 sustains only 5 req/s
+            row(8, 8, 5, 'all', 0.5), row(8, 8, 10, 'all', 3.0),
+            row(16, 8, 5, 'all', 0.6), row(16, 8, 10, 'all', 1.5), row(16, 8, 10, 'en-cs', 1.5),
+            row(16, 8, 10, 'cs-en', 0.8),
+            row(16, 16, 5, 'all', 0.4), row(16, 16, 10, 'all', 1.8), row(16, 16, 10, 'en-cs', 1.0),
+            row(16, 16, 10, 'cs-en', 1.8),
+        ]
+        self.assertEqual(recommend(rows, slo=2.0), ((16, 1, 0), {'en-cs': 16, 'cs-en': 8}, 10))
@@ -0,0 +1,147 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from app.coalesce_utils import SingleFlight, make_key
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_concurrently(self, flights, key, count=6):
+        calls = []
+        results = []
+
+        def translate():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['Ahoj.\n']
+
+        def request(flight):
+            results.append(flight.do(key, translate))
+
+        threads = [threading.Thread(target=request, args=(flights[i % len(flights)],)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return calls, results
+
+    def test_threads(self):
+        calls, results = self.run_concurrently([SingleFlight()], make_key('en-cs', 'en', 'cs', ['Hello.']))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['Ahoj.\n']] * 6)
+        # the followers get copies
+        self.assertEqual(len({id(result) for result in results}), 6)
+
+    def test_processes(self):
+        # two instances stand in for two workers sharing the directory
+        with tempfile.TemporaryDirectory() as directory:
+            calls, results = self.run_concurrently([SingleFlight(directory), SingleFlight(directory)],
+                                                   make_key('en-cs', 'en', 'cs', 'Hello.'))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['Ahoj.\n']] * 6)
+
+    def test_errors_are_shared_but_not_kept(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('No models found for the given pair')
+
+        with self.assertRaises(ValueError):
+            flight.do('key', fail)
+        self.assertEqual(flight.do('key', lambda: 'ok'), 'ok')
+
+    def test_waiting_calls_raise_copies(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError('No models found for the given pair')
+
+        def request(wait):
+            if wait:
+                started.wait(5)
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=request, args=(i > 0,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(len({id(error) for error in errors}), 3)
+        leader = next(error for error in errors if error.__cause__ is None)
+        self.assertTrue(all(error.__cause__ is leader for error in errors if error is not leader))
+        self.assertEqual({str(error) for error in errors}, {'No models found for the given pair'})
+
+    def test_stuck_call_is_not_waited_for(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for flights in ([SingleFlight(max_wait_secs=0.05)] * 2,
+                            [SingleFlight(directory, max_wait_secs=0.05), SingleFlight(directory, max_wait_secs=0.05)]):
+                release = threading.Event()
+                stuck = threading.Thread(target=flights[0].do, args=('key', release.wait, 5))
+                stuck.start()
+                time.sleep(0.02)
+                try:
+                    self.assertEqual(flights[1].do('key', lambda: 'ok'), 'ok')
+                finally:
+                    release.set()
+                    stuck.join()
+
+    def test_deadline_failures_are_not_shared(self):
+        from app.deadline_utils import Deadline, DeadlineExceeded
+
+        flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def leader():
+            def run_out_of_time():
+                started.set()
+                time.sleep(0.05)
+                raise DeadlineExceeded('The request did not finish within 0.05 s')
+            try:
+                flight.do('key', run_out_of_time)
+            except DeadlineExceeded as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait()
+        # a follower with more time translates the text itself
+        self.assertEqual(flight.do('key', lambda: 'ok', deadline=Deadline(5)), 'ok')
+        thread.join()
+        self.assertEqual(len(errors), 1)
+
+        # a follower with less time than the leader doesn't wait past its deadline
+        release = threading.Event()
+        thread = threading.Thread(target=flight.do, args=('key', release.wait, 5))
+        thread.start()
+        time.sleep(0.01)
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                flight.do('key', lambda: 'ok', deadline=Deadline(0.02))
+        finally:
+            release.set()
+            thread.join()
+
+        # a result holding a deadline failure is not reused
+        calls = []
+        thread = threading.Thread(target=flight.do, args=('key', lambda: time.sleep(0.05) or {'cs': 'timeout'}))
+        thread.start()
+        time.sleep(0.01)
+        self.assertEqual(flight.do('key', lambda: calls.append(1) or {'cs': 'ok'},
+                                   reusable=lambda results: results['cs'] != 'timeout'), {'cs': 'ok'})
+        thread.join()
+        self.assertEqual(calls, [1])
+
+    def test_key(self):
+        self.assertEqual(make_key('m', 'en', 'cs', 'a\nb'), make_key('m', 'en', 'cs', ['a', 'b']))
+        self.assertNotEqual(make_key('m', 'en', 'cs', 'a'), make_key('m', 'en', 'de', 'a'))
@@ -0,0 +1,66 @@
+import io
+import os
+import tempfile
+import unittest
+
+from app.corpus_utils import Checkpoint, corpus_lines, read_chunks, translate_corpus
+
+
+def _upper(lines):
+    return [line.upper() for line in lines]
+
+
+def _fail_on_c(lines):
+    if 'c' in lines:
+        raise RuntimeError('backend down')
+    return [line.upper() for line in lines]
+
+
+def _mark(lines):
+    return ['2:' + line for line in lines]
+
+
+class TestTranslateCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.tmp_dir.name, 'out.txt')
+        self.checkpoint = Checkpoint(self.output_path + '.checkpoint', {'src': 'en', 'tgt': 'cs'})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_corpus(self, data, translate_chunk, checkpoint):
+        checkpoint.load()
+        with open(self.output_path, 'r+b' if checkpoint.offset else 'wb') as output:
+            output.truncate(checkpoint.offset)
+            output.seek(checkpoint.offset)
+            chunks = read_chunks(corpus_lines(io.BytesIO(data)), 1, skip=checkpoint.lines)
+            translate_corpus(chunks, translate_chunk, output, checkpoint, in_flight=2)
+
+    def read_output(self):
+        with open(self.output_path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_in_order(self):
+        data = '\n'.join('line {}'.format(i) for i in range(50)).encode('utf-8') + b'\n'
+        self.run_corpus(data, _upper, self.checkpoint)
+        self.assertEqual(self.read_output(), data.decode('utf-8').upper())
+        self.assertEqual(self.checkpoint.lines, 50)
+
+    def test_resume(self):
+        data = b'a\nb\nc\nd\n'
+        self.assertRaises(RuntimeError, self.run_corpus, data, _fail_on_c, self.checkpoint)
+        self.assertEqual(self.read_output(), 'A\nB\n')
+        # a new process, the lines before c are not translated again
+        self.run_corpus(data, _mark, Checkpoint(self.checkpoint.path, self.checkpoint.params))
+        self.assertEqual(self.read_output(), 'A\nB\n2:c\n2:d\n')
+
+    def test_checkpoint_of_another_run(self):
+        self.checkpoint.save(2, 4)
+        self.assertRaises(ValueError, Checkpoint(self.checkpoint.path, {'src': 'en', 'tgt': 'de'}).load)
+
+    def test_corpus_lines(self):
+        self.assertEqual(list(corpus_lines(io.BytesIO(b'a\n\nb\n'))), ['a', '', 'b'])
+        self.assertEqual(list(corpus_lines(io.BytesIO(b'a'))), ['a'])
+        self.assertEqual(list(corpus_lines(io.BytesIO(b''))), [])
@@ -0,0 +1,66 @@
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import app.ctranslate2_utils as ctranslate2_utils
+from app.ctranslate2_utils import TranslatorPool
+
+
+class FakeSpm(object):
+
+    def EncodeAsPieces(self, sent):
+        return ['▁' + word for word in sent.split()]
+
+    def DecodePieces(self, pieces):
+        return ''.join(pieces).replace('▁', ' ').strip()
+
+
+class FakeTranslator(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def translate_batch(self, tokens, beam_size, target_prefix=None):
+        self.calls.append((tokens, beam_size, target_prefix))
+        prefixes = target_prefix or [[]] * len(tokens)
+        return [mock.Mock(hypotheses=[prefix + [piece.upper() for piece in sent]])
+                for prefix, sent in zip(prefixes, tokens)]
+
+
+class TestTranslateBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.translator = FakeTranslator()
+        patcher = mock.patch.multiple(ctranslate2_utils, _translator=self.translator, _source_spm=FakeSpm(),
+                                      _target_spm=FakeSpm())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_translate(self):
+        self.assertEqual(ctranslate2_utils._translate_batch(['hello world', 'bye'], 4, None), ['HELLO WORLD', 'BYE'])
+        self.assertEqual(self.translator.calls[0][1:], (4, None))
+
+    def test_target_prefix_is_stripped(self):
+        self.assertEqual(ctranslate2_utils._translate_batch(['hello', 'bye'], 2, ['>>cs<<']), ['HELLO', 'BYE'])
+        self.assertEqual(self.translator.calls[0][2], [['>>cs<<'], ['>>cs<<']])
+
+
+class TestTranslatorPool(unittest.TestCase):
+
+    def test_broken_pool_is_started_again(self):
+        pool = TranslatorPool('model_dir', 'vocab.spm')
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool('a pool process died')
+        with mock.patch.object(pool, '_get_executor', return_value=broken):
+            pool._executor = broken
+            with self.assertRaises(BrokenProcessPool):
+                pool.submit(['hello'])
+        self.assertIsNone(pool._executor)
+
+    def test_other_errors_keep_the_pool(self):
+        pool = TranslatorPool('model_dir', 'vocab.spm')
+        pool._executor = executor = mock.Mock()
+        pool.reset_if_broken(ValueError('bad input'))
+        self.assertIs(pool._executor, executor)
+        pool.reset_if_broken(BrokenProcessPool('a pool process died'))
+        self.assertIsNone(pool._executor)
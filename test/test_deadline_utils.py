@@ -0,0 +1,36 @@
+import time
+import unittest
+
+from app.deadline_utils import Deadline, DeadlineExceeded, request_timeout, socket_timeout
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_deadline(self):
+        deadline = Deadline(0.05)
+        self.assertGreater(deadline.remaining(), 0)
+        deadline.check()
+        time.sleep(0.06)
+        self.assertEqual(deadline.remaining(), 0)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.check()
+
+    def test_socket_timeout(self):
+        self.assertIsNone(socket_timeout(None, None))
+        self.assertGreater(socket_timeout(Deadline(10), None), 9)
+        expired = Deadline(10)
+        expired.expires_at = time.monotonic()
+        # never 0, it would make the socket non-blocking
+        with self.assertRaises(DeadlineExceeded):
+            socket_timeout(expired, None)
+
+    def test_request_timeout(self):
+        timeouts = {'default': 480, 'models/en-cs-doc': 120}
+        self.assertEqual(request_timeout(None, 'languages', timeouts), 480)
+        self.assertEqual(request_timeout(None, 'models/en-cs-doc', timeouts), 120)
+        # the header can only shorten it
+        self.assertEqual(request_timeout('10', 'languages', timeouts), 10)
+        self.assertEqual(request_timeout('1000', 'models/en-cs-doc', timeouts), 120)
+        self.assertEqual(request_timeout('soon', 'languages', timeouts), 480)
+        self.assertEqual(request_timeout('10', 'languages', {}), 10)
+        self.assertIsNone(request_timeout(None, 'languages', {}))
@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from app.hedge_utils import HedgePolicy
+
+
+class TestHedgePolicy(unittest.TestCase):
+
+    def warm_up(self, policy, samples=20):
+        for _ in range(samples):
+            policy.call(lambda attempt: 'fast', 'primary', ['replica'])
+        self.assertIsNotNone(policy.delay())
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        policy = HedgePolicy(budget=1)
+        self.warm_up(policy)
+        cancelled = threading.Event()
+
+        def send(attempt):
+            if attempt.hedge:
+                return attempt.server
+            attempt.on_cancel(cancelled.set)
+            if not cancelled.wait(5):
+                return 'primary'
+            raise RuntimeError('cancelled')
+
+        self.assertEqual(policy.call(send, 'primary', ['replica']), 'replica')
+        self.assertTrue(cancelled.is_set())
+        metrics = policy.metrics()
+        self.assertEqual((metrics['hedged'], metrics['hedge_wins']), (1, 1))
+
+    def test_budget(self):
+        policy = HedgePolicy(budget=0.05)
+        self.warm_up(policy)
+
+        def send(attempt):
+            if not attempt.hedge:
+                time.sleep(0.02)
+            return attempt.server
+
+        # 21 calls earned a single hedge
+        self.assertEqual([policy.call(send, 'primary', ['replica']) for _ in range(2)], ['replica', 'primary'])
+        self.assertEqual(policy.metrics()['over_budget'], 1)
+
+    def test_errors(self):
+        policy = HedgePolicy(budget=1)
+        self.warm_up(policy)
+
+        def send(attempt):
+            # the hedge fails first
+            time.sleep(0.01 if attempt.hedge else 0.05)
+            raise RuntimeError(attempt.server)
+
+        with self.assertRaisesRegex(RuntimeError, 'primary'):
+            policy.call(send, 'primary', ['replica'])
+        self.assertEqual(policy.metrics()['hedged'], 1)
+
+    def test_queued_primary_is_not_hedged(self):
+        policy = HedgePolicy(budget=1)
+        self.warm_up(policy)
+        executor = ThreadPoolExecutor(1)
+        try:
+            # the only thread is busy for much longer than the hedging delay
+            executor.submit(time.sleep, 0.1)
+            with mock.patch('app.hedge_utils._get_executor', return_value=executor):
+                self.assertEqual(policy.call(lambda attempt: attempt.server, 'primary', ['replica']), 'primary')
+            self.assertEqual(policy.metrics()['hedged'], 0)
+            self.assertLess(policy.metrics()['latency_secs']['max'], 0.1)
+        finally:
+            executor.shutdown()
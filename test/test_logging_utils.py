@@ -0,0 +1,37 @@
+import logging
+import unittest
+
+from app.logging_utils import Payload, SampledLogger, logged
+
+
+class Exploding(object):
+    def __repr__(self):
+        raise AssertionError('formatted although the level is disabled')
+
+
+class TestLazyLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_logging_utils')
+        self.logger.setLevel(logging.INFO)
+
+    def test_payload(self):
+        self.assertRegex(str(Payload(['Hello world.', 'Bye.'])),
+                         r"^2 items, 16 chars, sha1 [0-9a-f]{12} 'Hello world.' ...$")
+        self.assertEqual(str(Payload(['Hello world.', 'Bye.'])), str(Payload(('Hello world.', 'Bye.'))))
+        self.assertNotEqual(str(Payload(['Hello world.', 'Bye.'])), str(Payload(['Hello world.', 'Bye!'])))
+        self.assertRegex(str(Payload('x' * 100, preview=3)), r"^1 items, 100 chars, sha1 [0-9a-f]{12} 'xxx' ...$")
+        self.assertRegex(str(Payload({'a': 1}, preview=0)), r"^1 items, 8 chars, sha1 [0-9a-f]{12}$")
+
+    def test_nothing_is_formatted_below_the_level(self):
+        SampledLogger(self.logger).debug('batch %s', Payload([Exploding()]))
+        self.assertEqual(logged(self.logger)(lambda: 'ok')(), 'ok')
+
+    def test_sampling(self):
+        batch_log = SampledLogger(self.logger)
+        batch_log.configure(3)
+        with self.assertLogs(self.logger, logging.INFO) as logs:
+            for i in range(7):
+                batch_log.info('batch %s', i)
+        self.assertEqual([record.getMessage() for record in logs.records], ['batch 0', 'batch 3', 'batch 6'])
+        self.assertEqual(logs.records[0].funcName, 'test_sampling')
@@ -0,0 +1,199 @@
+import datetime
+import importlib.util
+import re
+import unittest
+from unittest import mock
+
+_REQUIRED = ['tensorflow', 'tensor2tensor', 'tensorflow_serving']
+_MISSING = [module for module in _REQUIRED if importlib.util.find_spec(module) is None]
+
+
+def fake_model(mask=False):
+    from app.models import Model
+
+    class FakeModel(Model):
+        """
+        Translates by upper-casing, records the blocks of each backend call; the placeholders of the sentences
+        starting with "Lose" are dropped
+        """
+
+        def __init__(self, cfg):
+            super().__init__(cfg)
+            self.calls = []
+
+        def split_long_sentence(self, sent):
+            return [sent]
+
+        def send_blocks_to_backend(self, blocks, src, tgt, deadline=None):
+            self.calls.append((list(blocks), src, tgt))
+            return [re.sub(r'\[\d+\]', '', block).upper() if block.startswith('Lose') else block.upper()
+                    for block in blocks]
+
+    return FakeModel({'model': 'en-cs', 'source': ['en', 'fr'], 'target': ['cs', 'de'], 'mask': mask})
+
+
+@unittest.skipIf(_MISSING, 'the models need {}'.format(', '.join(_MISSING)))
+class TestBatch(unittest.TestCase):
+
+    def test_grouped_by_pair(self):
+        from app.main.translate import group_batch_items
+
+        model = fake_model()
+        items = [('a', None, None), ('b', 'fr', None), ('c', None, 'de'), ('d', 'en', 'cs'), ('e', 'fr', 'de')]
+        results, groups = group_batch_items(model, items)
+        self.assertEqual(results, [None] * 5)
+        self.assertEqual(groups, {('en', 'cs'): [0, 3], ('fr', 'cs'): [1], ('en', 'de'): [2], ('fr', 'de'): [4]})
+
+        results, groups = group_batch_items(model, items, src='fr', tgt='de')
+        self.assertEqual(groups, {('fr', 'de'): [0, 1, 2, 4], ('en', 'cs'): [3]})
+
+    def test_unsupported_pairs_are_errors(self):
+        from app.main.translate import group_batch_items
+
+        model = fake_model()
+        items = [('a', 'es', None), ('b', 'en', 'es'), ('c', None, None)]
+        results, groups = group_batch_items(model, items)
+        self.assertEqual(results, [{'error': 'This model does not support translation from es'},
+                                   {'error': 'This model does not support translation from en to es'}, None])
+        self.assertEqual(groups, {('en', 'cs'): [2]})
+
+        # a query tgt the model doesn't support is not swapped for its default
+        results, groups = group_batch_items(model, [('a', None, None), ('b', None, 'cs')], tgt='es')
+        self.assertEqual(results, [{'error': 'This model does not support translation from en to es'}, None])
+        self.assertEqual(groups, {('en', 'cs'): [1]})
+
+    def test_texts_share_a_backend_call(self):
+        model = fake_model()
+        translations = model.translate_many(['One. Two.\nThree.', 'Four.', 'Five. Six.'], 'en', 'cs')
+        self.assertEqual(translations, [['ONE.', 'TWO.\n', 'THREE.\n'], ['FOUR.\n'], ['FIVE.', 'SIX.\n']])
+        self.assertEqual(model.calls, [(['One.', 'Two.', 'Three.', 'Four.', 'Five.', 'Six.'], 'en', 'cs')])
+
+    def test_blank_texts_are_not_sent(self):
+        from app.main.translate import translate_many_with_model
+
+        model = fake_model()
+        self.assertEqual(translate_many_with_model(model, ['One.', ' \n', 'Two.', ''], 'en', 'cs'),
+                         [['ONE.\n'], [], ['TWO.\n'], []])
+        self.assertEqual(model.calls, [(['One.', 'Two.'], 'en', 'cs')])
+
+    def test_one_access_row(self):
+        from flask import Flask
+
+        import app.main.api.translation.endpoints.MyAbstractResource as resource_module
+
+        resource = resource_module.MyAbstractResource()
+        resource._start_time = datetime.datetime.now()
+        resource._input_nfc_len = 10
+        results = [('en', 'cs', 'One.', ['JEDNA.']), ('fr', 'cs', 'Deux.', ['DVA.'])]
+        for log_input, translations in ((False, 0), (True, 2)):
+            with mock.patch.multiple(resource_module, log_access=mock.DEFAULT, log_translation=mock.DEFAULT,
+                                     commit_log=mock.DEFAULT) as log, \
+                    Flask(__name__).test_request_context('/?logInput={}'.format(str(log_input).lower())):
+                resource.log_batch_request(src='en,fr', tgt='cs', results=results)
+            self.assertEqual(log['log_access'].call_count, 1)
+            self.assertEqual(log['log_access'].call_args.kwargs['commit'], not log_input)
+            self.assertEqual(log['log_translation'].call_count, translations)
+            self.assertEqual(log['commit_log'].call_count, int(log_input))
+
+
+@unittest.skipIf(_MISSING, 'the models need {}'.format(', '.join(_MISSING)))
+class TestMasking(unittest.TestCase):
+
+    def test_lost_placeholders_are_translated_unmasked(self):
+        model = fake_model(mask=True)
+        translation = model.translate('Lose it at www.a.com. See www.b.com.\nSee www.c.com.', 'en', 'cs')
+        self.assertEqual(translation, ['LOSE IT AT WWW.A.COM.', 'SEE www.b.com.\n', 'SEE www.c.com.\n'])
+        # only the sentence that lost its placeholders is sent again, unmasked
+        self.assertEqual(model.calls, [(['Lose it at [1].', 'See [1].', 'See [1].'], 'en', 'cs'),
+                                       (['Lose it at www.a.com.'], 'en', 'cs')])
+
+    def test_batch(self):
+        model = fake_model(mask=True)
+        translations = model.translate_many(['See www.a.com.', 'Nothing here.', 'Lose www.b.com.'], 'en', 'cs')
+        self.assertEqual(translations, [['SEE www.a.com.\n'], ['NOTHING HERE.\n'], ['LOSE WWW.B.COM.\n']])
+        self.assertEqual(model.calls[1:], [(['Lose www.b.com.'], 'en', 'cs')])
+
+
+@unittest.skipIf(_MISSING, 'the models need {}'.format(', '.join(_MISSING)))
+class TestRevisions(unittest.TestCase):
+
+    def test_only_changed_sentences_are_sent(self):
+        model = fake_model()
+        translation, alignment = model.translate_revision('One. Two.\nThree.', 'en', 'cs')
+        self.assertEqual(translation, ['ONE.', 'TWO.\n', 'THREE.\n'])
+        self.assertEqual(model.calls, [(['One.', 'Two.', 'Three.'], 'en', 'cs')])
+
+        translation, alignment = model.translate_revision('One. Deux.\nThree. One.', 'en', 'cs', previous=alignment)
+        self.assertEqual(translation, ['ONE.', 'DEUX.\n', 'THREE.', 'ONE.\n'])
+        self.assertEqual(model.calls[1:], [(['Deux.'], 'en', 'cs')])
+        # the alignment keeps the backend outputs, without the formatting
+        self.assertEqual(alignment, {'One.': 'ONE.', 'Deux.': 'DEUX.', 'Three.': 'THREE.'})
+
+    def test_unmasked_fallbacks_are_reused(self):
+        model = fake_model(mask=True)
+        translation, alignment = model.translate_revision('Lose it at www.a.com. See www.b.com.', 'en', 'cs')
+        self.assertEqual(translation, ['LOSE IT AT WWW.A.COM.', 'SEE www.b.com.\n'])
+        self.assertEqual(model.calls, [(['Lose it at [1].', 'See [1].'], 'en', 'cs'),
+                                       (['Lose it at www.a.com.'], 'en', 'cs')])
+        self.assertEqual(alignment['Lose it at www.a.com.'], 'LOSE IT AT WWW.A.COM.')
+
+        translation, alignment = model.translate_revision('Lose it at www.a.com. See www.c.com. Bye.', 'en', 'cs',
+                                                          previous=alignment)
+        self.assertEqual(translation, ['LOSE IT AT WWW.A.COM.', 'SEE www.c.com.', 'BYE.\n'])
+        self.assertEqual(model.calls[2:], [(['Bye.'], 'en', 'cs')])
+        self.assertIn('Lose it at www.a.com.', alignment)
+
+        # another span in the same masked sentence is translated again
+        translation, _ = model.translate_revision('Lose it at www.d.com.', 'en', 'cs', previous=alignment)
+        self.assertEqual(translation, ['LOSE IT AT WWW.D.COM.\n'])
+        self.assertEqual(model.calls[3:], [(['Lose it at www.d.com.'], 'en', 'cs')])
+
+    def test_only_changed_windows_are_sent(self):
+        from app.models import T2TDocModel
+
+        with mock.patch('app.models.t2t_model.resources'):
+            model = T2TDocModel({'model': 'doc', 'problem': 'doc', 'source': ['en'], 'target': ['cs'],
+                                 'sent_chars_limit': 500})
+        model.MAX_CHARS, model.USE_CHARS, model.PRE_CHARS, model.PRE_TOO_SHORT = 14, 7, 7, 0
+        calls = []
+
+        def send(sequences, deadline=None):
+            calls.append(list(sequences))
+            return [sequence.upper() for sequence in sequences]
+
+        model._do_send_request = send
+        text = 'One. Two. Three. Four. Five. Six.'
+        translation, alignment = model.translate_revision(text, 'en', 'cs')
+        self.assertEqual(translation, ['ONE.', 'TWO.', 'THREE.', 'FOUR.', 'FIVE.', 'SIX.\n'])
+        windows = calls[0]
+
+        edited = text.replace('Six.', 'Sechs.')
+        translation, _ = model.translate_revision(edited, 'en', 'cs', previous=alignment)
+        self.assertEqual(translation, ['ONE.', 'TWO.', 'THREE.', 'FOUR.', 'FIVE.', 'SECHS.\n'])
+        sent = calls[1]
+        self.assertTrue(sent)
+        self.assertTrue(all('Sechs.' in sequence for sequence in sent))
+        self.assertEqual(model.translate_revision(edited, 'en', 'cs')[0], translation)
+        self.assertEqual(len(calls[2]), len(windows))
+        self.assertLess(len(sent), len(windows))
+
+
+@unittest.skipIf(_MISSING, 'the models need {}'.format(', '.join(_MISSING)))
+class TestShadow(unittest.TestCase):
+
+    def test_request_fn_per_candidate(self):
+        from flask import Flask
+
+        from app.models import T2TModel
+
+        with mock.patch('app.models.t2t_model.resources'):
+            model = T2TModel({'model': 'en-cs', 'problem': 'en-cs', 'source': ['en'], 'target': ['cs'],
+                              'shadow': {'server': '{CANDIDATE}', 'sample': 1}})
+        app = Flask(__name__)
+        with mock.patch('app.models.t2t_model.make_grpc_request_fn') as make_request_fn, \
+                mock.patch('app.models.t2t_model.shadow') as shadow, app.app_context():
+            for candidate in ('a:9000', 'a:9000', 'b:9000'):
+                app.config['CANDIDATE'] = candidate
+                model._mirror(['Hello'], 0.1, ['Ahoj'])
+        self.assertEqual([call.kwargs['server'] for call in make_request_fn.call_args_list], ['a:9000', 'b:9000'])
+        self.assertEqual([call.args[1] for call in shadow.mirror.call_args_list], ['a:9000', 'a:9000', 'b:9000'])
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+import unittest
+
+from app.ratelimit_utils import TokenBucketLimiter, client_key, redact_key
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmp_dir.name, 'ratelimit.db')
+        self.limiter = TokenBucketLimiter(self.database, capacity=100, rate=1000,
+                                          overrides={'big': {'capacity': 1000}})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_bucket(self):
+        self.assertTrue(self.limiter.consume('a', 60).allowed)
+        quota = self.limiter.consume('a', 60)
+        self.assertFalse(quota.allowed)
+        self.assertEqual(quota.headers['Retry-After'], 1)
+        # other clients have their own buckets
+        self.assertTrue(self.limiter.consume('b', 60).allowed)
+        self.assertTrue(self.limiter.consume('big', 600).allowed)
+        time.sleep(0.05)
+        self.assertTrue(self.limiter.consume('a', 60).allowed)
+
+    def test_shared_by_workers(self):
+        other_worker = TokenBucketLimiter(self.database, capacity=100, rate=0.001)
+        self.assertTrue(self.limiter.consume('a', 100).allowed)
+        self.assertFalse(other_worker.consume('a', 50).allowed)
+        usage = {client['key']: client for client in self.limiter.usage()}
+        self.assertEqual((usage['a']['used'], usage['a']['requests'], usage['a']['rejected']), (100, 2, 1))
+
+    def test_idle_buckets_are_dropped(self):
+        limiter = TokenBucketLimiter(self.database, capacity=100, rate=1000, idle_secs=0.01)
+        limiter.consume('a', 10)
+        time.sleep(0.02)
+        limiter._last_prune = 0
+        limiter.consume('b', 10)
+        self.assertEqual([client['key'] for client in limiter.usage()], ['b'])
+
+    def test_client_key(self):
+        args = {'author': 'unknown', 'frontend': 'web', 'ip_address': '10.0.0.1'}
+        self.assertEqual(client_key(args, ('frontend', 'ip_address')), 'frontend=web|ip_address=10.0.0.1')
+        # the fields that were not sent are left out, a client without any has no bucket
+        self.assertEqual(client_key(args, ('author', 'ip_address')), 'ip_address=10.0.0.1')
+        self.assertIsNone(client_key(args, ('author',)))
+        self.assertIsNone(client_key(dict(args, ip_address=None), ('ip_address',)))
+        redacted = redact_key('frontend=web|ip_address=10.0.0.1')
+        self.assertTrue(redacted.startswith('frontend=web|ip_address=#'))
+        self.assertNotIn('10.0.0.1', redacted)
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import time
+import unittest
+
+from app.revision_utils import NEW_REVISION, RevisionStore, make_scope
+
+
+class TestRevisionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmp_dir.name, 'revisions.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_saved_revision(self):
+        store = RevisionStore(self.database)
+        scope = make_scope('languages', 'cs', 'fr')
+        alignments = [{'Ahoj.': 'Hello.'}, {'Hello.': 'Bonjour.'}]
+        token = store.save(scope, alignments)
+        # e.g. another worker
+        self.assertEqual(RevisionStore(self.database).load(token, scope), alignments)
+        self.assertIsNone(store.load(token, make_scope('languages', 'cs', 'de')))
+        self.assertIsNone(store.load(NEW_REVISION, scope))
+        self.assertIsNone(store.load('unknown', scope))
+
+    def test_bounded_and_expiring(self):
+        store = RevisionStore(self.database, ttl=0.05, max_entries=2)
+        tokens = [store.save('scope', [{str(i): str(i)}]) for i in range(3)]
+        self.assertIsNone(store.load(tokens[0], 'scope'))
+        self.assertEqual(store.load(tokens[2], 'scope'), [{'2': '2'}])
+        time.sleep(0.06)
+        self.assertIsNone(store.load(tokens[2], 'scope'))
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from app.shadow_utils import Shadow
+
+
+class TestShadow(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shadow = Shadow(os.path.join(self.tmp_dir.name, 'shadow.db'), max_pending=2, max_rows=3)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def wait_for(self, batches):
+        for _ in range(100):
+            report = self.shadow.report()
+            if report and report[0]['batches'] == batches:
+                return report[0]
+            time.sleep(0.01)
+        self.fail('the mirrored batches were not recorded')
+
+    def test_records_both_backends(self):
+        self.assertTrue(self.shadow.mirror('en-cs', 'candidate:9000', lambda timeout_secs: ['Ahoj světe'],
+                                           ['Hello world'], 0.1, ['Ahoj svět']))
+        entry = self.wait_for(1)
+        self.assertEqual((entry['model'], entry['server'], entry['sentences'], entry['failed']),
+                         ('en-cs', 'candidate:9000', 1, 0))
+        self.assertEqual(entry['primary_secs']['p50'], 0.1)
+        self.assertAlmostEqual(entry['length_ratio']['p50'], 10 / 9)
+
+        def fail(timeout_secs):
+            raise ConnectionRefusedError('candidate down')
+
+        self.shadow.mirror('en-cs', 'candidate:9000', fail, ['Hello'], 0.1, ['Ahoj'])
+        entry = self.wait_for(2)
+        self.assertEqual(entry['failed'], 1)
+        self.assertEqual(entry['errors'], [("ConnectionRefusedError('candidate down')", 1)])
+        self.assertEqual(entry['shadow_secs']['count'], 1)
+
+        self.assertEqual(self.shadow.report(model='cs-en'), [])
+        self.assertEqual(self.shadow.report(since=time.time() + 1), [])
+
+    def test_bounded(self):
+        release = threading.Event()
+
+        def send(timeout_secs):
+            release.wait(5)
+            return ['Ahoj']
+
+        mirrored = [self.shadow.mirror('en-cs', 'candidate:9000', send, ['Hello'], 0.1, ['Ahoj']) for _ in range(3)]
+        self.assertEqual(mirrored, [True, True, False])
+        self.assertEqual(self.shadow.dropped, 1)
+        release.set()
+        self.wait_for(2)
+
+        for _ in range(3):
+            self.assertTrue(self.shadow.mirror('en-cs', 'candidate:9000', lambda timeout_secs: ['Ahoj'], ['Hello'],
+                                               0.1, ['Ahoj']))
+            self.wait_for(3)
+            while self.shadow._pending:
+                time.sleep(0.01)
+        # at most max_rows
+        self.assertEqual(self.shadow.report()[0]['batches'], 3)
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app.sqlite_utils import SharedDatabase
+
+SCHEMA = 'CREATE TABLE IF NOT EXISTS items (name TEXT)'
+
+
+class TestSharedDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = SharedDatabase(os.path.join(self.tmp_dir.name, 'shared.db'), SCHEMA)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_connection_per_thread(self):
+        conn = self.db.connect()
+        self.assertIs(self.db.connect(), conn)
+        conn.execute("INSERT INTO items VALUES ('a')")
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+
+        other = []
+
+        def read():
+            other_conn = self.db.connect()
+            other.append((other_conn is conn, other_conn.execute('SELECT name FROM items').fetchall()))
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        self.assertEqual(other, [(False, [('a',)])])
+
+    def test_new_connection_after_fork(self):
+        conn = self.db.connect()
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(self.db.connect(), conn)
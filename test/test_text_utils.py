@@ -0,0 +1,190 @@
+import contextvars
+import io
+import random
+import threading
+import unittest
+from unicodedata import normalize
+
+from sentence_splitter import SentenceSplitter
+
+from app.text_utils import read_nfc_lines, shared_splitting, split_many, split_on_budget
+from app.text_utils.masking import Masker, number_per_block, unmask
+from app.text_utils.splitter import FastSplitter, Splitter, SplitterRegistry, _lang2file, load_non_breaking_prefixes
+
+
+class TestReadNfcLines(unittest.TestCase):
+
+    def assertSameLines(self, text, chunk_size):
+        data = text.encode('utf-8')
+        expected = normalize('NFC', data.decode('utf-8')).split('\n')
+        self.assertEqual(list(read_nfc_lines(io.BytesIO(data), chunk_size)), expected)
+
+    def test_matches_reading_everything(self):
+        # multibyte chars and decomposed diacritics (e + combining acute) cut by the chunk boundaries
+        text = 'Příliš žluťoučký kůň\nCafe\u0301 au lait\n\nпривет мир\r\nend'
+        for chunk_size in range(1, 12):
+            self.assertSameLines(text, chunk_size)
+
+    def test_trailing_newline_and_empty_input(self):
+        self.assertSameLines('one\ntwo\n', 3)
+        self.assertSameLines('', 3)
+
+    def test_invalid_utf8(self):
+        with self.assertRaises(UnicodeDecodeError):
+            list(read_nfc_lines(io.BytesIO(b'ok\n\xff\xfe'), 2))
+
+
+class TestSplitter(unittest.TestCase):
+    SAMPLES = {
+        'en': ['Mr. Smith arrived at 5 p.m. yesterday. He left early!',
+               'See No. 5 for details. The U.S.A. is big... Really? "Yes." (Maybe.) Fine.',
+               '  leading and   double spaces. Next one '],
+        'cs': ['Prof. Novák přišel v 10 hod. Pak odešel. Viz str. 5 a č. 3.'],
+    }
+
+    def test_same_splits_as_sentence_splitter(self):
+        for lang, texts in self.SAMPLES.items():
+            reference, splitter = SentenceSplitter(lang), Splitter(lang)
+            for text in texts:
+                self.assertEqual(splitter.split(text), reference.split(text), text)
+
+    def test_split_many(self):
+        self.assertEqual(split_many(['One. Two.', '', 'Three.'], 'en'), [['One.', 'Two.'], [], ['Three.']])
+
+    def test_shared_splitting(self):
+        self.assertIsNot(split_many(['One. Two.'], 'en'), split_many(['One. Two.'], 'en'))
+        with shared_splitting():
+            first = split_many(['One. Two.'], 'en')
+            in_thread = []
+            thread = threading.Thread(target=contextvars.copy_context().run,
+                                      args=(lambda: in_thread.append(split_many(['One. Two.'], 'en')),))
+            thread.start()
+            thread.join()
+            self.assertIs(in_thread[0], first)
+            self.assertIsNot(split_many(['One. Two.'], 'cs'), first)
+
+    def test_registry_loads_each_language_once(self):
+        registry = SplitterRegistry()
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(registry.get('en'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(splitter) for splitter in seen}), 1)
+
+
+class TestFastSplitter(unittest.TestCase):
+    LANGUAGES = ['cs', 'en', 'de', 'fr', 'uk', 'ru', 'pl', 'hi']
+    CORPUS = {
+        'cs': 'Prof. Novák přišel v 10 hod. Pak odešel. Viz str. 5 a č. 3.\n'
+              'Tzv. „chytrá“ řešení, např. AI, atd. Další věta!  Opravdu?Ne.\n'
+              '\n'
+              'Dne 1. 1. 2020 se sešli. MUDr. J. Svoboda, Ph.D. odpověděl: „Ano.“ Hotovo...  A dál.\n',
+        'en': 'Mr. Smith arrived at 5 p.m. yesterday. He left early!\n'
+              'See No. 5 for details. The U.S.A. is big... Really? "Yes." (Maybe.) Fine.\n'
+              '  leading and   double spaces. Next one \n'
+              '\tTabbed. Line.\t Here. Art. 5 and pp. 10-12. e.g. this. i.e. That.\n'
+              '\n\n'
+              "He said 'Go.' Then left. [Note.] Next. 3.14 is pi. 4. Four.",
+        'de': 'Dr. Müller kam um 10 Uhr. Er ging früh!\n'
+              'Am 3. Oktober ist Feiertag. Vgl. S. 12 bzw. Nr. 4. Der Rest.\n'
+              '„Wirklich?“ Ja. z. B. Hunde, u. a. Katzen. Ende.\n',
+        'fr': 'M. Dupont est arrivé. Il est parti.\n'
+              'Voir p. 5 et chap. 3. « Vraiment ? » Oui. Mme. Curie... Et après.\n'
+              'Le Dr. Martin, etc. Fin !\n',
+        'uk': 'Проф. Шевченко прийшов. Він пішов!\n'
+              'Див. с. 5 і т. д. А. Б. Коваль сказав: «Так.» Кінець... Далі.\n',
+        'ru': 'Проф. Иванов представит результаты в 10 ч. в комнате № 4. Затем обед.\n'
+              'См. стр. 5, т. е. No. 7. Art. 3 и pp. 10. Конец?! Да.\n'
+              '«Правда?» Да. Т. Толстой. И т. д. Всё.\n',
+        'pl': 'Zob. str. 5 oraz nr 3. Nr. 7 jest dalej. Dr. Kowalski przyszedł.\n'
+              'Art. 5 ust. 2 pkt. 3 tab. 1. Koniec. s. 12 i r. 2020. Tak!\n'
+              'str. Następna. nr. Nowa.\n',
+        'hi': 'श्री. राम आए। वे चले गए! A. K. शर्मा ने कहा। डॉ. गुप्ता आए... फिर गए।\n'
+              'यह वाक्य है. यह दूसरा है? हाँ. "ठीक." (शायद.) अंत.\n',
+    }
+
+    def assertSameSplits(self, lang, lines):
+        reference = SentenceSplitter(lang, _lang2file[lang])
+        expected = [reference.split(line) for line in lines]
+        self.assertEqual(Splitter(lang, _lang2file[lang]).split_lines(lines), expected)
+        self.assertEqual(FastSplitter(lang, _lang2file[lang]).split_lines(lines), expected)
+
+    def test_corpus(self):
+        for lang in self.LANGUAGES:
+            with self.subTest(lang=lang):
+                self.assertSameSplits(lang, self.CORPUS[lang].split('\n'))
+
+    def test_random_documents(self):
+        rnd = random.Random(42)
+        punctuation = ['.', '..', '...', '?', '!', '."', '.)', '.\u201d', '.\u00bb', '.]', ',', '']
+        starters = ['', '"', '(', '\u201e', '\u00ab', '[', '\u00bf']
+        for lang in self.LANGUAGES:
+            prefixes, numeric_prefixes = load_non_breaking_prefixes(lang, _lang2file[lang])
+            vocabulary = sorted(prefixes | numeric_prefixes) + self.CORPUS[lang].split() + ['5', '10', 'A.B.']
+            lines = []
+            for _ in range(300):
+                words = [rnd.choice(starters) + rnd.choice(vocabulary) + rnd.choice(punctuation)
+                         for _ in range(rnd.randint(0, 12))]
+                lines.append(''.join(word + rnd.choice([' ', ' ', '  ', '\t']) for word in words))
+            with self.subTest(lang=lang):
+                self.assertSameSplits(lang, lines)
+
+    def test_separator_in_text(self):
+        self.assertSameSplits('en', ['One.\x00 Two.', 'Three. Four.'])
+
+
+class TestSplitOnBudget(unittest.TestCase):
+
+    def test_split_on_budget(self):
+        costs = []
+
+        def cost(word):
+            costs.append(word)
+            return len(word)
+
+        sent = 'aa bbb cc dddd e'
+        self.assertEqual(split_on_budget(sent, 5, cost), ['aa bbb', 'cc', 'dddd e'])
+        self.assertEqual(costs, sent.split())
+        self.assertEqual(split_on_budget(sent, 100, len), [sent])
+
+    def test_word_over_limit(self):
+        self.assertEqual(split_on_budget('a bbbbbbb c', 3, len), ['a', 'bbb', 'bbb', 'b c'])
+        self.assertEqual(split_on_budget('', 3, len), [''])
+
+    def test_uneven_word_cost(self):
+        def cost(word):
+            return sum(5 if char == 'x' else 1 for char in word)
+
+        parts = split_on_budget('a xxxxaaaaaaaa b', 6, cost)
+        self.assertEqual(parts, ['a', 'x', 'x', 'x', 'xa', 'aaaaaa', 'a b'])
+        self.assertTrue(all(cost(part.replace(' ', '')) <= 6 for part in parts))
+
+
+class TestMasking(unittest.TestCase):
+
+    def test_round_trip(self):
+        lines = ['See https://lindat.cz/a.html, write to info@ufal.cz.',
+                 'The A320 costs 1,200,000 CZK, not 3 [1].', 'Run `make test` on x86_64.']
+        masked, spans = Masker().mask(lines)
+        self.assertEqual(masked, ['See [1], write to [2].', 'The [3] costs [4] CZK, not 3 [5].',
+                                  'Run [6] on [7].'])
+        blocks, block_spans = number_per_block(masked, spans)
+        self.assertEqual(blocks, ['See [1], write to [2].', 'The [1] costs [2] CZK, not 3 [3].', 'Run [1] on [2].'])
+        self.assertEqual([unmask(block, originals) for block, originals in zip(blocks, block_spans)], lines)
+
+    def test_selected_kinds(self):
+        masked, spans = Masker(['email']).mask(['info@ufal.cz 2024-01-01'])
+        self.assertEqual((masked, spans), (['[1] 2024-01-01'], ['info@ufal.cz']))
+        self.assertRaises(ValueError, Masker, ['phone'])
+
+    def test_ordinals_are_not_masked(self):
+        masked, spans = Masker().mask(['The 1st and 22nd of May, the 3RD A4 and the 4th-gen A5s.'])
+        self.assertEqual(masked, ['The 1st and 22nd of May, the 3RD [1] and the 4th-gen [2].'])
+        self.assertEqual(spans, ['A4', 'A5s'])
+
+    def test_lost_placeholder(self):
+        self.assertIsNone(unmask('Viz [1].', ['a', 'b']))
+        self.assertIsNone(unmask('Viz [1] a [1].', ['a', 'b']))
+        self.assertEqual(unmask('[2] a [1]', ['a', 'b']), 'b a a')
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from app.tracing_utils import attach, current_trace, current_trace_id, end_trace, span, start_trace
+
+
+def load_trace_file(path):
+    # the array is left open for appending, the viewers close it like this
+    with open(path) as f:
+        return json.loads(f.read().rstrip().rstrip(',') + ']')
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'traces.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sampled_trace_is_exported(self):
+        start_trace('abc-123', 1.0)
+        self.assertEqual(current_trace_id(), 'abc-123')
+        with span('hop', model='en-cs'):
+            with span('batch', size=2):
+                pass
+            trace = current_trace()
+
+            def in_thread():
+                attach(trace)
+                with span('backend_call'):
+                    pass
+            thread = threading.Thread(target=in_thread)
+            thread.start()
+            thread.join()
+        with self.assertRaises(ValueError):
+            with span('retry'):
+                raise ValueError()
+        end_trace(self.path, method='POST')
+        self.assertIsNone(current_trace_id())
+
+        events = load_trace_file(self.path)
+        self.assertEqual([e['name'] for e in events], ['batch', 'backend_call', 'hop', 'retry', 'request'])
+        self.assertTrue(all(e['ph'] == 'X' and e['args']['trace_id'] == 'abc-123' for e in events))
+        hop, batch = events[2], events[0]
+        self.assertLessEqual(hop['ts'], batch['ts'])
+        self.assertGreaterEqual(hop['ts'] + hop['dur'], batch['ts'] + batch['dur'])
+        self.assertEqual(events[3]['args']['error'], 'ValueError')
+        self.assertEqual(events[4]['args']['method'], 'POST')
+
+        # the next trace is appended to the same array
+        start_trace(None, 1.0)
+        end_trace(self.path)
+        self.assertEqual(len(load_trace_file(self.path)), 6)
+
+    def test_unsampled_trace_records_nothing(self):
+        trace = start_trace('not valid!', 0.0)
+        self.assertNotEqual(trace.trace_id, 'not valid!')
+        with span('hop'):
+            pass
+        self.assertEqual(trace.events, [])
+        end_trace(self.path)
+        self.assertFalse(os.path.exists(self.path))
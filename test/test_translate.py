@@ -0,0 +1,92 @@
+import importlib.util
+import threading
+import unittest
+from unittest import mock
+
+from app.deadline_utils import DeadlineExceeded
+
+_REQUIRED = ['tensorflow', 'tensor2tensor', 'tensorflow_serving']
+_MISSING = [module for module in _REQUIRED if importlib.util.find_spec(module) is None]
+
+
+class FakeModel(object):
+    """
+    Translates a text "x" to "tgt(x)", records the calls
+    """
+
+    def __init__(self, model, barrier=None, error=None):
+        self.model = model
+        self.barrier = barrier
+        self.error = error
+        self.calls = []
+
+    def translate(self, text, src=None, tgt=None, deadline=None):
+        self.calls.append((list(text), src, tgt))
+        if self.barrier:
+            # the sibling branches must be translated at the same time
+            self.barrier.wait(5)
+        if self.error:
+            raise self.error
+        return ['{}({})\n'.format(tgt, ''.join(text).strip())]
+
+
+class FakeModels(object):
+
+    def __init__(self, routes):
+        self.routes = routes
+
+    def get_model_list(self, source, target):
+        return [{'model': model, 'src': src, 'tgt': tgt} for model, src, tgt in self.routes.get((source, target), [])]
+
+
+@unittest.skipIf(_MISSING, 'the models need {}'.format(', '.join(_MISSING)))
+class TestFanOut(unittest.TestCase):
+
+    def fan_out(self, routes, targets):
+        from app.main.translate import translate_fan_out
+
+        with mock.patch('app.main.translate.models', FakeModels(routes)):
+            return translate_fan_out('cs', targets, ['Ahoj'])
+
+    def test_shared_hops_run_once(self):
+        cs_en = FakeModel('cs-en')
+        en_x = FakeModel('en-x', barrier=threading.Barrier(2))
+        cs_uk = FakeModel('cs-uk')
+        results = self.fan_out({
+            ('cs', 'en'): [(cs_en, 'cs', 'en')],
+            ('cs', 'de'): [(cs_en, 'cs', 'en'), (en_x, 'en', 'de')],
+            ('cs', 'fr'): [(cs_en, 'cs', 'en'), (en_x, 'en', 'fr')],
+            ('cs', 'uk'): [(cs_uk, 'cs', 'uk')],
+        }, ['en', 'de', 'fr', 'uk'])
+        self.assertEqual(results, {'en': ['en(Ahoj)\n'], 'de': ['de(en(Ahoj))\n'], 'fr': ['fr(en(Ahoj))\n'],
+                                   'uk': ['uk(Ahoj)\n']})
+        self.assertEqual(cs_en.calls, [(['Ahoj'], 'cs', 'en')])
+        self.assertEqual(sorted(call[2] for call in en_x.calls), ['de', 'fr'])
+        self.assertEqual(cs_uk.calls, [(['Ahoj'], 'cs', 'uk')])
+
+    def test_a_failed_branch_doesnt_stop_the_others(self):
+        cs_en = FakeModel('cs-en')
+        failing = FakeModel('en-de', error=DeadlineExceeded())
+        en_fr = FakeModel('en-fr')
+        results = self.fan_out({
+            ('cs', 'de'): [(cs_en, 'cs', 'en'), (failing, 'en', 'de')],
+            ('cs', 'fr'): [(cs_en, 'cs', 'en'), (en_fr, 'en', 'fr')],
+        }, ['de', 'fr', 'xx'])
+        self.assertIsInstance(results['de'], DeadlineExceeded)
+        self.assertEqual(results['fr'], ['fr(en(Ahoj))\n'])
+        self.assertIsInstance(results['xx'], ValueError)
+        self.assertEqual(len(cs_en.calls), 1)
+
+    def test_a_failed_shared_hop_fails_its_targets(self):
+        failing = FakeModel('cs-en', error=DeadlineExceeded())
+        en_de = FakeModel('en-de')
+        cs_uk = FakeModel('cs-uk')
+        results = self.fan_out({
+            ('cs', 'en'): [(failing, 'cs', 'en')],
+            ('cs', 'de'): [(failing, 'cs', 'en'), (en_de, 'en', 'de')],
+            ('cs', 'uk'): [(cs_uk, 'cs', 'uk')],
+        }, ['en', 'de', 'uk'])
+        self.assertIsInstance(results['en'], DeadlineExceeded)
+        self.assertIs(results['de'], results['en'])
+        self.assertEqual(results['uk'], ['uk(Ahoj)\n'])
+        self.assertEqual(en_de.calls, [])
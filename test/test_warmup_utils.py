@@ -0,0 +1,87 @@
+import tempfile
+import time
+import unittest
+
+from flask import Flask
+
+from app.warmup_utils import WarmUp, warm_up_text
+
+
+class FakeModel(object):
+
+    def __init__(self, name, fail=False):
+        self.model = name
+        self.supports = {'en': ['cs']}
+        self.batch_size = 2
+        self.fail = fail
+        self.delay = 0
+        self.texts = []
+
+    def translate(self, text, src, tgt, deadline=None):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionRefusedError('backend down')
+        self.texts.append(text)
+        return [text]
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.warmup = WarmUp()
+        self.warmup.configure((3, 10), retry_secs=0.05, lock_dir=self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('timed out')
+
+    def test_warm_up_text(self):
+        self.assertEqual(warm_up_text(3, 2), 'The translation of. The translation of.')
+
+    def test_ready_after_warm_up_and_rewarm(self):
+        ok, down = FakeModel('en-cs'), FakeModel('en-cs-doc', fail=True)
+        self.assertFalse(self.warmup.is_ready())
+        self.warmup.start(Flask(__name__), [ok, down])
+        self.wait_for(self.warmup.is_ready)
+        models = self.warmup.status()['models']
+        self.assertEqual((models['en-cs']['state'], models['en-cs-doc']['state']), ('warm', 'failed'))
+        self.assertEqual([len(text.split()) for text in ok.texts], [6, 20])
+        # the backend is back
+        down.fail = False
+        self.wait_for(lambda: self.warmup.status()['models']['en-cs-doc']['state'] == 'warm')
+        # ... and restarted, not ready until it is warm again
+        ok.fail, ok.delay = True, 0.1
+        self.warmup.backend_failed('en-cs')
+        self.assertFalse(self.warmup.is_ready())
+        # a backend that stays down doesn't keep the worker not ready
+        self.wait_for(lambda: self.warmup.status()['models']['en-cs']['state'] == 'failed')
+        self.assertTrue(self.warmup.is_ready())
+        ok.fail = False
+        self.wait_for(lambda: len(ok.texts) == 4)
+
+    def test_failure_is_shared_with_the_waiting_workers(self):
+        other_worker = WarmUp()
+        other_worker.configure((3,), retry_secs=60, lock_dir=self.tmp_dir.name)
+        self.warmup.configure((3,), retry_secs=60, lock_dir=self.tmp_dir.name)
+        slow = FakeModel('en-cs', fail=True)
+        slow.delay = 0.1
+        calls = []
+        waiting = FakeModel('en-cs', fail=True)
+        waiting.translate = lambda *args, **kwargs: calls.append(1)
+        other_worker.start(Flask(__name__), [slow])
+        time.sleep(0.02)
+        self.warmup.start(Flask(__name__), [waiting])
+        self.wait_for(self.warmup.is_ready)
+        self.assertEqual(self.warmup.status()['models']['en-cs']['state'], 'failed')
+        self.assertEqual(calls, [])
+
+    def test_disabled(self):
+        self.warmup.configure(())
+        self.assertTrue(self.warmup.is_ready())